@@ -1,14 +1,177 @@
 from flask import Flask, request, jsonify
 import requests
+import requests.adapters
 import os
 import logging
 import io
+import collections
+import concurrent.futures
+import json
+import sqlite3
+import threading
+import time
+import functools
+import re
+import sys
+import datetime
+import email.utils
+import random
+import hashlib
+import tempfile
+import uuid
+
+# Początek inicjalizacji modułu (po imporcie bibliotek); zob. startup_state.
+_MODULE_INIT_STARTED = time.perf_counter()
 
 # --- KONFIGURACJA APLIKACJI FLASK ---
 app = Flask(__name__)
 
 # --- KONFIGURACJA LOGOWANIA ---
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Wszystkie wywołania logging używają formatowania leniwego ("... %s", arg), więc komunikaty
+# poniżej progu LOG_LEVEL nie są w ogóle budowane. Każdy argument komunikatu jest przycinany
+# do LOG_MAX_FIELD_LENGTH znaków (payloady i treści odpowiedzi potrafią mieć setki KB),
+# sekrety (api_token, tokeny z konfiguracji) są maskowane, a powtórzenia identycznego komunikatu
+# (ten sam tekst z tego samego miejsca w kodzie) są próbkowane: najwyżej LOG_SAMPLE_BURST w oknie
+# LOG_SAMPLE_WINDOW_SECONDS, z informacją o liczbie pominiętych. Komunikaty różniące się
+# argumentami (np. ID zadania i deala) nie są sobie liczone, więc nie giną. LOG_FORMAT=json daje
+# jeden obiekt JSON na linię (dla agregatorów logów).
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_MAX_FIELD_LENGTH = int(os.getenv("LOG_MAX_FIELD_LENGTH", "2000"))
+LOG_SAMPLE_WINDOW_SECONDS = float(os.getenv("LOG_SAMPLE_WINDOW_SECONDS", "60"))
+LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", "20")) # 0 = bez próbkowania
+LOG_SAMPLE_MAX_LEVEL = os.getenv("LOG_SAMPLE_MAX_LEVEL", "WARNING").upper() # błędy nie są próbkowane
+
+_LOG_REDACT_PATTERN = re.compile(r"((?:api_token|api_key|password|token)=)[^&\s'\"]+", re.IGNORECASE)
+
+
+def _truncate_log_value(value, max_length=None):
+    """Zamienia argument komunikatu na tekst i przycina go do max_length znaków."""
+    max_length = LOG_MAX_FIELD_LENGTH if max_length is None else max_length
+    text = value if isinstance(value, str) else str(value)
+    if max_length and len(text) > max_length:
+        return f"{text[:max_length]}...[+{len(text) - max_length} znaków]"
+    return text
+
+
+def redact_log_text(text):
+    """Maskuje tokeny API w tekście komunikatu (np. w URL-ach zapytań do Pipedrive)."""
+    text = _LOG_REDACT_PATTERN.sub(r"\1***", text)
+    for secret in (PIPEDRIVE_API_TOKEN, JIRA_API_TOKEN):
+        # Krótkie wartości (np. w środowiskach testowych) maskowałyby przypadkowe fragmenty słów.
+        if secret and len(secret) >= 8 and secret in text:
+            text = text.replace(secret, "***")
+    return text
+
+
+class LogSampler(logging.Filter):
+    """Przepuszcza najwyżej `burst` powtórzeń tego samego komunikatu (miejsce w kodzie + treść) na okno czasowe."""
+
+    MAX_TRACKED_MESSAGES = 10000
+
+    def __init__(self, window_seconds, burst, max_level):
+        super().__init__()
+        self.window_seconds = window_seconds
+        self.burst = burst
+        self.max_level = max_level
+        self._lock = threading.Lock()
+        self._messages = {} # (ścieżka, linia, treść) -> [początek okna, przepuszczone, pominięte]
+
+    def _message_key(self, record):
+        try:
+            text = record.getMessage()
+        except (TypeError, ValueError):
+            text = str(record.msg)
+        return record.pathname, record.lineno, _truncate_log_value(text)
+
+    def filter(self, record):
+        if self.burst <= 0 or record.levelno > self.max_level:
+            return True
+        key = self._message_key(record)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._messages.get(key)
+            if entry is None or now - entry[0] >= self.window_seconds:
+                suppressed = entry[2] if entry else 0
+                if entry is None and len(self._messages) >= self.MAX_TRACKED_MESSAGES:
+                    self._prune(now)
+                self._messages[key] = [now, 1, 0]
+                if suppressed:
+                    record.sampled_out = suppressed
+                return True
+            if entry[1] >= self.burst:
+                entry[2] += 1
+                return False
+            entry[1] += 1
+            return True
+
+    def _prune(self, now):
+        # Wywoływane z założoną blokadą: usuwa wpisy z zakończonym oknem (liczniki pominiętych przepadają).
+        for key in [key for key, entry in self._messages.items() if now - entry[0] >= self.window_seconds]:
+            del self._messages[key]
+
+
+class SafeLogFormatter(logging.Formatter):
+    """Formatter przycinający argumenty, maskujący sekrety i opcjonalnie zwracający JSON."""
+
+    def __init__(self, json_output=False):
+        super().__init__("%(asctime)s - %(levelname)s - %(message)s")
+        self.json_output = json_output
+
+    def _render_message(self, record):
+        # Szablon komunikatu pochodzi z kodu – przycinane są tylko argumenty i obiekty niebędące tekstem.
+        msg = record.msg if isinstance(record.msg, str) else _truncate_log_value(record.msg)
+        if record.args:
+            args = record.args
+            if isinstance(args, dict) and "%(" not in str(record.msg):
+                # logging.info("... %s", some_dict) – słownik jest pojedynczym argumentem.
+                args = (args,)
+            if isinstance(args, dict):
+                args = {key: value if isinstance(value, (int, float)) else _truncate_log_value(value)
+                        for key, value in args.items()}
+            else:
+                args = tuple(arg if isinstance(arg, (int, float)) else _truncate_log_value(arg) for arg in args)
+            try:
+                msg = msg % args
+            except (TypeError, ValueError):
+                msg = f"{msg} {args}"
+        sampled_out = getattr(record, "sampled_out", 0)
+        if sampled_out:
+            msg = f"{msg} [pominięto {sampled_out} powtórzeń tego komunikatu]"
+        return redact_log_text(msg)
+
+    def format(self, record):
+        record.message = self._render_message(record)
+        exc_text = redact_log_text(self.formatException(record.exc_info)) if record.exc_info else None
+        if self.json_output:
+            entry = {
+                "time": self.formatTime(record),
+                "level": record.levelname,
+                "logger": record.name,
+                "message": record.message,
+                "process": record.process,
+                "thread": record.threadName,
+            }
+            if exc_text:
+                entry["exc_info"] = exc_text
+            return json.dumps(entry, ensure_ascii=False)
+        record.asctime = self.formatTime(record)
+        line = self.formatMessage(record)
+        if exc_text:
+            line = f"{line}\n{exc_text}"
+        return line
+
+
+def configure_logging():
+    """Konfiguruje główny logger zgodnie ze zmiennymi LOG_* (wywoływane raz przy imporcie)."""
+    handler = logging.StreamHandler()
+    handler.setFormatter(SafeLogFormatter(json_output=LOG_FORMAT == "json"))
+    handler.addFilter(LogSampler(LOG_SAMPLE_WINDOW_SECONDS, LOG_SAMPLE_BURST,
+                                 logging.getLevelName(LOG_SAMPLE_MAX_LEVEL)))
+    logging.basicConfig(level=LOG_LEVEL, handlers=[handler], force=True)
+
+
+configure_logging()
 
 # --- KONFIGURACJA DANYCH DOSTĘPOWYCH API (ZMIENNE ŚRODOWISKOWE Z RENDER.COM) ---
 PIPEDRIVE_API_TOKEN = os.getenv("PIPEDRIVE_API_TOKEN")
@@ -32,23 +195,12 @@ JIRA_PROJECT_ID = "10033" # <-- Zmieniono z klucza na ID projektu!
 JIRA_ISSUE_TYPE = "Task" # Używamy polskiej nazwy.
 
 # --- MAPOWANIE PÓL NIESTANDARDOWYCH ---
-
-PIPEDRIVE_CUSTOM_FIELDS_HASHES = {
-    "typ_prezentacji_tech": "5bc985e61592b58e001c657305423499b6a23ce4",
-    "data_1": "77554ed03246265be68e75bc152243b19d492d9f",
-    "data_2": "348bc2d5699beb5a76ae34f9318055a0bbbef3a8",
-    "data_3": "db137c6e874446aaa7e42d1638538f5138786633",
-    "partner_org_field": "fea50f9d3ff5801b5fa9c451a8110445442db46d",
-    "notatka_summary": "b1d7a6fb7866d3e88f0eb486ae1032012bf8295b" # Klucz Pipedrive dla Notatki (Summary)
-}
+# Mapowanie pól Pipedrive -> Jira (hashe pól Pipedrive, ID pól Jira, mapowania opcji)
+# jest zdefiniowane deklaratywnie w pliku FIELD_MAPPING_PATH i kompilowane raz przy starcie
+# (zob. FieldMapper). Dodanie pola wymaga tylko nowego wpisu w tym pliku.
+FIELD_MAPPING_PATH = os.getenv("FIELD_MAPPING_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "field_mapping.json")
 
 JIRA_CUSTOM_FIELDS_IDS = {
-    "typ_prezentacji_tech": "customfield_1008",
-    "klient": "customfield_10086",
-    "data_1": "customfield_10090",
-    "data_2": "customfield_10089",
-    "data_3": "customfield_10091",
-    "partner": "customfield_10092",
     "request_type_field": "customfield_10010" # ID pola "Request Type" dla Jira Service Management
 }
 
@@ -59,186 +211,1426 @@ JIRA_CUSTOM_FIELDS_IDS = {
 JIRA_REQUEST_TYPE_VALUE = {"value": "YOUR_EXACT_REQUEST_TYPE_NAME_FROM_JIRA_LOGS"} # <-- Nadal wymaga uzupełnienia!
 
 
-# Mapowanie opcji dla pola 'Typ Prezentacji Technicznej'
-TYP_PREZENTACJI_MAPPING = {
-    "32": {"id": "32"}, # Prezentacja wprowadzająca
-    "33": {"id": "33"}, # Prezentacja techniczna
-    "68": {"id": "68"}, # PoC
-    "69": {"id": "69"}, # Demo
-    "70": {"id": "70"}, # Rozmowa referencyjna
+# --- METRYKI (FORMAT PROMETHEUS) ---
+# Lekki rejestr liczników i histogramów w pamięci procesu (jedna blokada i aktualizacja
+# słownika na zdarzenie). Przy wielu workerach Gunicorna ustaw METRICS_DIR: każdy proces
+# co METRICS_FLUSH_INTERVAL sekund zapisuje tam swój stan, a /metrics sumuje liczniki
+# i histogramy ze wszystkich plików. Metryki stanu procesu (gotowość, czasy startu, cache)
+# są raportowane osobno dla każdego workera z etykietą pid. Pliki workerów, które już nie
+# żyją, są usuwane przy odczycie i w hooku child_exit (gunicorn.conf.py).
+METRICS_PREFIX = "pipedrive_jira"
+METRICS_DIR = os.getenv("METRICS_DIR") or None
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5")) # sekundy
+METRICS_DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+METRICS_HELP = {
+    "stage_duration_seconds": ("histogram", "Czas wykonania etapów przetwarzania (Pipedrive, Jira, załączniki)."),
+    "upstream_requests_total": ("counter", "Żądania HTTP do Pipedrive/Jira według usługi, metody i statusu."),
+    "upstream_retries_total": ("counter", "Ponowienia żądań do Pipedrive/Jira według usługi i przyczyny."),
+    "attachment_bytes_total": ("counter", "Bajty załączników pobrane z Pipedrive i wysłane do Jira."),
+    "jobs_total": ("counter", "Zadania z kolejki według wyniku."),
+    "queue_jobs": ("gauge", "Liczba zadań w kolejce według statusu."),
+    "cache_events_total": ("counter", "Zdarzenia cache odczytów Pipedrive (bieżący proces)."),
+    "attachment_cache_events_total": ("counter", "Trafienia, chybienia i eviction w dyskowym cache załączników."),
+    "attachments_deduplicated_total": ("counter", "Pliki pominięte, bo są już załączone do zadania Jira."),
+    "startup_seconds": ("gauge", "Czas startu workera według fazy (import, rozgrzewanie i jego etapy)."),
+    "ready": ("gauge", "1, gdy rozgrzewanie workera po starcie zostało zakończone (także z błędami etapów)."),
+    "startup_step_ok": ("gauge", "1, gdy etap rozgrzewania workera się powiódł, 0 przy błędzie."),
 }
 
+
+class MetricsRegistry:
+    """Rejestr metryk bezpieczny dla wątków; serie identyfikowane są nazwą i etykietami."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._counters = collections.defaultdict(float)
+        self._histograms = {}
+        self._gauges = {}
+        self._gauge_collectors = []
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+                    break
+            histogram[1] += value
+            histogram[2] += 1
+
+    def set_gauge(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def add_gauge_collector(self, collector):
+        """Rejestruje funkcję ustawiającą metryki stanu procesu (set_gauge) tuż przed każdą migawką."""
+        self._gauge_collectors.append(collector)
+
+    def snapshot(self):
+        """Stan rejestru w postaci nadającej się do zapisu w JSON."""
+        for collector in self._gauge_collectors:
+            try:
+                collector()
+            except Exception as e:
+                logging.warning("Nie udało się odczytać metryk stanu procesu: %s", e)
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "counters": [[name, dict(labels), value] for (name, labels), value in self._counters.items()],
+                "histograms": [[name, dict(labels), list(h[0]), h[1], h[2]] for (name, labels), h in self._histograms.items()],
+                "gauges": [[name, dict(labels), value] for (name, labels), value in self._gauges.items()],
+            }
+
+
+metrics = MetricsRegistry(METRICS_DURATION_BUCKETS)
+_metrics_flusher_pid = None
+
+
+def _metrics_snapshot_path(pid):
+    return os.path.join(METRICS_DIR, f"metrics-{pid}.json")
+
+
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True # proces istnieje, ale należy do innego użytkownika
+    return True
+
+
+def flush_metrics():
+    """Zapisuje stan metryk bieżącego procesu do METRICS_DIR (zapis atomowy)."""
+    path = _metrics_snapshot_path(os.getpid())
+    try:
+        with open(f"{path}.tmp", "w", encoding="utf-8") as snapshot_file:
+            json.dump(metrics.snapshot(), snapshot_file)
+        os.replace(f"{path}.tmp", path)
+    except OSError as e:
+        logging.warning("Nie udało się zapisać metryk do %s: %s", path, e)
+
+
+def _metrics_flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        flush_metrics()
+
+
+def start_metrics_flusher():
+    """Uruchamia (raz na proces) wątek zapisujący metryki do METRICS_DIR, jeśli jest ustawiony."""
+    global _metrics_flusher_pid
+    if not METRICS_DIR or _metrics_flusher_pid == os.getpid():
+        return
+    _metrics_flusher_pid = os.getpid()
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    threading.Thread(target=_metrics_flush_loop, name="metrics-flusher", daemon=True).start()
+
+
+def collect_metric_snapshots():
+    """Zwraca migawki metryk: bieżącego procesu oraz (przy METRICS_DIR) pozostałych workerów."""
+    snapshots = [metrics.snapshot()]
+    if METRICS_DIR and os.path.isdir(METRICS_DIR):
+        own_file = os.path.basename(_metrics_snapshot_path(os.getpid()))
+        for file_name in os.listdir(METRICS_DIR):
+            if not (file_name.startswith("metrics-") and file_name.endswith(".json")) or file_name == own_file:
+                continue
+            try:
+                pid = int(file_name[len("metrics-"):-len(".json")])
+            except ValueError:
+                continue
+            if not _process_exists(pid):
+                # Worker zakończony lub zrestartowany (np. max_requests): jego migawka nie jest już aktualna.
+                try:
+                    os.remove(os.path.join(METRICS_DIR, file_name))
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(os.path.join(METRICS_DIR, file_name), encoding="utf-8") as snapshot_file:
+                    snapshots.append(json.load(snapshot_file))
+            except (OSError, ValueError):
+                continue
+    return snapshots
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (f'{k}="{str(v)}"'.replace("\n", " ") for k, v in sorted(labels.items()))
+    return "{" + ",".join(escaped) + "}"
+
+
+def render_prometheus_metrics(snapshots, gauges=()):
+    """Sumuje migawki i zwraca tekst w formacie ekspozycji Prometheusa.
+
+    Liczniki i histogramy są sumowane po procesach, a metryki stanu procesu z migawek
+    (gauges) raportowane osobno z etykietą pid. `gauges` to metryki wspólne (np. kolejka).
+    """
+    counters = collections.defaultdict(float)
+    histograms = {}
+    process_gauges = []
+    for snapshot in snapshots:
+        for name, labels, value in snapshot.get("gauges", []):
+            process_gauges.append((name, {**labels, "pid": snapshot.get("pid")}, value))
+        for name, labels, value in snapshot["counters"]:
+            counters[(name, tuple(sorted(labels.items())))] += value
+        for name, labels, buckets, total, count in snapshot["histograms"]:
+            key = (name, tuple(sorted(labels.items())))
+            merged = histograms.setdefault(key, [[0] * len(METRICS_DURATION_BUCKETS), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+            merged[1] += total
+            merged[2] += count
+
+    series = collections.defaultdict(list)
+    for (name, labels), value in counters.items():
+        series[name].append(f"{METRICS_PREFIX}_{name}{_format_labels(dict(labels))} {value:g}")
+    for (name, labels), (buckets, total, count) in histograms.items():
+        labels = dict(labels)
+        cumulative = 0
+        for bound, bucket_count in zip(METRICS_DURATION_BUCKETS, buckets):
+            cumulative += bucket_count
+            series[name].append(f"{METRICS_PREFIX}_{name}_bucket{_format_labels({**labels, 'le': f'{bound:g}'})} {cumulative}")
+        series[name].append(f"{METRICS_PREFIX}_{name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {count}")
+        series[name].append(f"{METRICS_PREFIX}_{name}_sum{_format_labels(labels)} {total:g}")
+        series[name].append(f"{METRICS_PREFIX}_{name}_count{_format_labels(labels)} {count}")
+    for name, labels, value in [*gauges, *process_gauges]:
+        series[name].append(f"{METRICS_PREFIX}_{name}{_format_labels(labels)} {value:g}")
+
+    lines = []
+    for name in sorted(series):
+        metric_type, help_text = METRICS_HELP.get(name, ("untyped", name))
+        lines.append(f"# HELP {METRICS_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {METRICS_PREFIX}_{name} {metric_type}")
+        lines.extend(series[name])
+    return "\n".join(lines) + "\n"
+
+
+def timed_stage(stage):
+    """Dekorator mierzący czas wykonania funkcji jako etap `stage` (histogram stage_duration_seconds)."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.observe("stage_duration_seconds", time.perf_counter() - started, stage=stage)
+        return wrapper
+    return decorator
+
+
+# --- TRYB WSPÓŁBIEŻNY (WORKERY GEVENT) ---
+# Pod workerem gevent Gunicorna (zob. gunicorn.conf.py) moduły socket/threading/time są
+# spatchowane przed importem aplikacji: wątki (kolejka zadań, pule transferów) stają się
+# greenletami, a blokujące I/O w requests oddaje sterowanie pętli zdarzeń. Jeden proces
+# obsługuje wtedy setki równoczesnych żądań, więc domyślne rozmiary pul są większe.
+# Tryb jest opcjonalny (GUNICORN_WORKER_CLASS=gevent); domyślnie workery są typu sync.
+def _is_cooperative_runtime():
+    """True, jeśli proces działa z gevent i spatchowanym modułem socket."""
+    gevent_monkey = sys.modules.get("gevent.monkey")
+    return bool(gevent_monkey and gevent_monkey.is_module_patched("socket"))
+
+
+COOPERATIVE_RUNTIME = _is_cooperative_runtime()
+
+
+# --- KONFIGURACJA KLIENTÓW HTTP (POOLING POŁĄCZEŃ) ---
+# Każdy proces workera utrzymuje po jednej sesji na usługę, dzięki czemu połączenia
+# TCP/TLS do Pipedrive i Jira są ponownie wykorzystywane między wywołaniami.
+PIPEDRIVE_API_URL = os.getenv("PIPEDRIVE_API_URL", "https://api.pipedrive.com/v1")
+JIRA_BASE_URL = os.getenv("JIRA_BASE_URL") or f"https://{JIRA_DOMAIN}"
+PIPEDRIVE_POOL_SIZE = int(os.getenv("PIPEDRIVE_POOL_SIZE", "50" if COOPERATIVE_RUNTIME else "10"))
+JIRA_POOL_SIZE = int(os.getenv("JIRA_POOL_SIZE", "50" if COOPERATIVE_RUNTIME else "10"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")) # sekundy
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60")) # sekundy
+
+_http_sessions = {}
+_http_sessions_lock = threading.Lock()
+
+
+def _build_http_session(pool_size, auth=None, headers=None, params=None):
+    """Tworzy sesję requests z pulą połączeń keep-alive o zadanym rozmiarze."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if auth:
+        session.auth = auth
+    if headers:
+        session.headers.update(headers)
+    if params:
+        session.params.update(params)
+    return session
+
+
+def _get_http_session(name, factory):
+    """Zwraca sesję danej usługi dla bieżącego procesu (po forku tworzona jest nowa)."""
+    key = (name, os.getpid())
+    session = _http_sessions.get(key)
+    if session is None:
+        with _http_sessions_lock:
+            session = _http_sessions.get(key)
+            if session is None:
+                session = factory()
+                _http_sessions[key] = session
+    return session
+
+
+def get_pipedrive_session():
+    """Sesja HTTP do API Pipedrive (token przekazywany jako parametr api_token)."""
+    return _get_http_session("pipedrive", lambda: _build_http_session(
+        PIPEDRIVE_POOL_SIZE,
+        headers={"Accept": "application/json"},
+        params={"api_token": PIPEDRIVE_API_TOKEN},
+    ))
+
+
+def get_jira_session():
+    """Sesja HTTP do API Jira (uwierzytelnianie e-mail + token API)."""
+    return _get_http_session("jira", lambda: _build_http_session(
+        JIRA_POOL_SIZE,
+        auth=(JIRA_EMAIL, JIRA_API_TOKEN),
+        headers={"Accept": "application/json"},
+    ))
+
+
+# --- LIMITOWANIE, PONAWIANIE I CIRCUIT BREAKER DLA WYWOŁAŃ API ---
+# Wszystkie żądania do Pipedrive i Jira przechodzą przez _send_upstream_request:
+# token bucket trzyma tempo poniżej limitów API, odpowiedzi 429/5xx i błędy połączenia
+# są ponawiane z wykładniczym opóźnieniem (z jitterem) i z respektowaniem Retry-After
+# oraz nagłówków X-RateLimit-*, a circuit breaker szybko odrzuca żądania, gdy usługa leży.
+# Oczekiwanie dłuższe niż UPSTREAM_BACKOFF_MAX nie jest odsiadywane w wątku: odpowiedź wraca
+# do wywołującego (zadanie z kolejki zostanie ponowione), a bucket pozostaje wstrzymany na pełny czas.
+# Limity są dzielone przez liczbę workerów Gunicorna (WEB_CONCURRENCY), bo każdy proces ma własny bucket.
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+PIPEDRIVE_RATE_LIMIT_PER_SECOND = float(os.getenv("PIPEDRIVE_RATE_LIMIT_PER_SECOND", "10")) / WEB_CONCURRENCY
+PIPEDRIVE_RATE_LIMIT_BURST = max(1, int(os.getenv("PIPEDRIVE_RATE_LIMIT_BURST", "20")) // WEB_CONCURRENCY)
+JIRA_RATE_LIMIT_PER_SECOND = float(os.getenv("JIRA_RATE_LIMIT_PER_SECOND", "10")) / WEB_CONCURRENCY
+JIRA_RATE_LIMIT_BURST = max(1, int(os.getenv("JIRA_RATE_LIMIT_BURST", "20")) // WEB_CONCURRENCY)
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "4"))
+UPSTREAM_BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.5")) # sekundy
+UPSTREAM_BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", "30")) # sekundy
+CIRCUIT_BREAKER_THRESHOLD = int(os.getenv("CIRCUIT_BREAKER_THRESHOLD", "5")) # kolejne błędy
+CIRCUIT_BREAKER_COOLDOWN = float(os.getenv("CIRCUIT_BREAKER_COOLDOWN", "30")) # sekundy
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class UpstreamUnavailableError(requests.exceptions.ConnectionError):
+    """Zgłaszany bez wysyłania żądania, gdy circuit breaker danej usługi jest otwarty."""
+
+
+class TokenBucket:
+    """Token bucket ograniczający tempo żądań; może zostać wstrzymany do czasu resetu limitu."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blokuje do momentu uzyskania tokenu."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                else:
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Wstrzymuje wydawanie tokenów (np. gdy API zgłosi wyczerpanie limitu)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+
+class CircuitBreaker:
+    """Prosty circuit breaker: po `threshold` kolejnych błędach odrzuca żądania przez `cooldown` sekund."""
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Czy żądanie może zostać wysłane (po czasie cooldown przepuszczane jest żądanie próbne)."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.cooldown:
+                self._opened_at = time.monotonic() # half-open: kolejna próba dopiero po następnym cooldown
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+
+    @property
+    def state(self):
+        with self._lock:
+            return "open" if self._opened_at is not None else "closed"
+
+
+_upstream_limiters = {
+    "pipedrive": {
+        "bucket": TokenBucket(PIPEDRIVE_RATE_LIMIT_PER_SECOND, PIPEDRIVE_RATE_LIMIT_BURST),
+        "breaker": CircuitBreaker(CIRCUIT_BREAKER_THRESHOLD, CIRCUIT_BREAKER_COOLDOWN),
+    },
+    "jira": {
+        "bucket": TokenBucket(JIRA_RATE_LIMIT_PER_SECOND, JIRA_RATE_LIMIT_BURST),
+        "breaker": CircuitBreaker(CIRCUIT_BREAKER_THRESHOLD, CIRCUIT_BREAKER_COOLDOWN),
+    },
+}
+
+
+def _rate_limit_delay(response):
+    """Zwraca liczbę sekund do odczekania wg Retry-After / X-RateLimit-Reset lub None."""
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                return max(0.0, email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    reset = response.headers.get("X-RateLimit-Reset")
+    if reset:
+        try:
+            value = float(reset)
+            # Pipedrive podaje liczbę sekund do resetu; wartości wyglądające na epoch traktujemy jako znacznik czasu.
+            return max(0.0, value - time.time()) if value > 1e9 else max(0.0, value)
+        except ValueError:
+            try:
+                # Jira podaje znacznik czasu ISO 8601.
+                return max(0.0, datetime.datetime.fromisoformat(reset.replace("Z", "+00:00")).timestamp() - time.time())
+            except ValueError:
+                pass
+    return None
+
+
+def _backoff_delay(attempt):
+    """Wykładnicze opóźnienie z pełnym jitterem."""
+    return random.uniform(0, min(UPSTREAM_BACKOFF_MAX, UPSTREAM_BACKOFF_BASE * (2 ** attempt)))
+
+
+def _send_upstream_request(upstream, session, method, url, **kwargs):
+    """Wysyła żądanie z limitowaniem tempa, ponawianiem i obsługą circuit breakera."""
+    kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+    bucket = _upstream_limiters[upstream]["bucket"]
+    breaker = _upstream_limiters[upstream]["breaker"]
+    idempotent = method.upper() in IDEMPOTENT_METHODS
+    body = kwargs.get("data")
+
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            metrics.inc("upstream_requests_total", upstream=upstream, method=method, status="circuit_open")
+            raise UpstreamUnavailableError(f"Circuit breaker dla {upstream} jest otwarty; żądanie {method} {url} odrzucone.")
+        bucket.acquire()
+
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException as e:
+            metrics.inc("upstream_requests_total", upstream=upstream, method=method, status=type(e).__name__)
+            breaker.record_failure()
+            # Żądania nieidempotentne ponawiamy tylko, gdy nie doszło do nawiązania połączenia.
+            retryable = idempotent or isinstance(e, requests.exceptions.ConnectTimeout)
+            if not retryable or attempt >= UPSTREAM_MAX_RETRIES or not _rewind_body(body):
+                raise
+            delay = _backoff_delay(attempt)
+            metrics.inc("upstream_retries_total", upstream=upstream, reason="connection_error")
+            logging.warning("Błąd połączenia z %s (%s). Ponowienie %s/%s za %.2fs.", upstream, e, attempt + 1, UPSTREAM_MAX_RETRIES, delay)
+        else:
+            metrics.inc("upstream_requests_total", upstream=upstream, method=method, status=str(response.status_code))
+            if response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+
+            rate_limit_delay = _rate_limit_delay(response)
+            if response.headers.get("X-RateLimit-Remaining") == "0" and rate_limit_delay:
+                bucket.pause(rate_limit_delay)
+
+            # 429 oznacza odrzucenie żądania, więc można je ponowić także dla POST.
+            retryable = response.status_code == 429 or (idempotent and response.status_code in RETRYABLE_STATUS_CODES)
+            delay = rate_limit_delay if rate_limit_delay is not None else _backoff_delay(attempt)
+            if response.status_code == 429:
+                # Limit obowiązuje wszystkie żądania do tej usługi, więc wstrzymujemy je na pełny Retry-After.
+                bucket.pause(delay)
+            if not retryable or attempt >= UPSTREAM_MAX_RETRIES or not _rewind_body(body):
+                return response
+            if delay > UPSTREAM_BACKOFF_MAX:
+                # Nie ponawiamy przed czasem ani nie blokujemy wątku dłużej niż UPSTREAM_BACKOFF_MAX:
+                # odpowiedź wraca do wywołującego, a zadanie z kolejki zostanie ponowione później.
+                logging.warning("%s zwrócił status %s dla %s %s z oczekiwaniem %.0fs (> %.0fs). Bez ponawiania.",
+                                upstream, response.status_code, method, url.split('?')[0], delay, UPSTREAM_BACKOFF_MAX)
+                return response
+            metrics.inc("upstream_retries_total", upstream=upstream, reason=f"status_{response.status_code}")
+            logging.warning("%s zwrócił status %s dla %s %s. Ponowienie %s/%s za %.2fs.",
+                            upstream, response.status_code, method, url.split('?')[0], attempt + 1, UPSTREAM_MAX_RETRIES, delay)
+            response.close()
+
+        time.sleep(delay)
+        attempt += 1
+
+
+def _rewind_body(body):
+    """Przygotowuje strumieniowe ciało żądania do ponownego wysłania; False, jeśli to niemożliwe."""
+    if body is None or not hasattr(body, "rewind"):
+        return True
+    return body.rewind()
+
+
+def get_upstream_status():
+    """Stan circuit breakerów dla poszczególnych usług."""
+    return {name: {"circuit": limiter["breaker"].state} for name, limiter in _upstream_limiters.items()}
+
+
+def pipedrive_request(method, path, **kwargs):
+    """Wykonuje żądanie do API Pipedrive przez współdzieloną sesję (ścieżka względem PIPEDRIVE_API_URL)."""
+    return _send_upstream_request("pipedrive", get_pipedrive_session(), method, f"{PIPEDRIVE_API_URL}{path}", **kwargs)
+
+
+def jira_request(method, path, **kwargs):
+    """Wykonuje żądanie do API Jira przez współdzieloną sesję (ścieżka względem JIRA_BASE_URL)."""
+    return _send_upstream_request("jira", get_jira_session(), method, f"{JIRA_BASE_URL}{path}", **kwargs)
+
+
+# --- CACHE ODCZYTÓW Z PIPEDRIVE (TTL + LRU) ---
+# Rzadko zmieniające się rekordy (np. organizacje) są trzymane w pamięci procesu.
+# Opcjonalnie (CACHE_SHARED_DB_PATH) wpisy są też zapisywane w pliku SQLite,
+# dzięki czemu wszystkie workery Gunicorna korzystają z tych samych trafień. Kopia
+# w pamięci procesu jest wtedy serwowana bez odczytu bazy przez CACHE_LOCAL_TTL_SECONDS,
+# a potem odczytywana ponownie ze wspólnej bazy. Unieważnienie z /webhook/organization
+# działa w workerze, który je obsłużył, od razu, a w pozostałych po najwyżej tym czasie.
+#
+# Cache'owane są tylko organizacje. Deal i lista jego plików zmieniają się dokładnie wtedy,
+# gdy przychodzi webhook (i przy nich sync.py), więc kopia z cache byłaby nieaktualna
+# w jedynym momencie, w którym jest czytana.
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1000"))
+CACHE_SHARED_DB_PATH = os.getenv("CACHE_SHARED_DB_PATH") or None
+CACHE_SHARED_MAX_ENTRIES = int(os.getenv("CACHE_SHARED_MAX_ENTRIES", "10000"))
+CACHE_LOCAL_TTL_SECONDS = float(os.getenv("CACHE_LOCAL_TTL_SECONDS", "30"))
+CACHE_TTL_SECONDS = {
+    "organization": int(os.getenv("CACHE_TTL_ORGANIZATION", "900")),
+}
+
+
+class TTLCache:
+    """Cache z ograniczonym rozmiarem, TTL per wpis i wypieraniem LRU (bezpieczny dla wątków)."""
+
+    def __init__(self, max_entries, shared_db_path=None, shared_max_entries=10000, local_ttl=30):
+        self.max_entries = max_entries
+        self.shared_db_path = shared_db_path
+        self.shared_max_entries = shared_max_entries
+        self.local_ttl = local_ttl
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = collections.defaultdict(lambda: {"hits": 0, "shared_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0})
+        self._shared_ready = False
+
+    def _shared_connection(self):
+        conn = sqlite3.connect(self.shared_db_path, timeout=5, isolation_level=None)
+        if not self._shared_ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, PRIMARY KEY (namespace, key))"
+            )
+            self._shared_ready = True
+        return conn
+
+    def get(self, namespace, key):
+        """Zwraca zapisaną wartość lub None, jeśli brak wpisu albo wygasł."""
+        cache_key = (namespace, str(key))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[1] <= now:
+                del self._entries[cache_key]
+                entry = None
+        if entry is not None:
+            with self._lock:
+                if cache_key in self._entries:
+                    self._entries.move_to_end(cache_key)
+                self._stats[namespace]["hits"] += 1
+            return entry[0]
+
+        if self.shared_db_path:
+            try:
+                conn = self._shared_connection()
+                try:
+                    row = conn.execute(
+                        "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ? AND expires_at > ?",
+                        (namespace, cache_key[1], now),
+                    ).fetchone()
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                logging.warning("Błąd odczytu współdzielonego cache (%s/%s): %s", namespace, key, e)
+                row = None
+            if row is not None:
+                value = json.loads(row[0])
+                with self._lock:
+                    self._store_local(cache_key, value, row[1])
+                    self._stats[namespace]["shared_hits"] += 1
+                return value
+
+        with self._lock:
+            self._stats[namespace]["misses"] += 1
+        return None
+
+    def set(self, namespace, key, value, ttl):
+        """Zapisuje wartość z czasem życia ttl (sekundy)."""
+        cache_key = (namespace, str(key))
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._store_local(cache_key, value, expires_at)
+        if self.shared_db_path:
+            try:
+                conn = self._shared_connection()
+                try:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                        (namespace, cache_key[1], json.dumps(value), expires_at),
+                    )
+                    conn.execute(
+                        "DELETE FROM cache WHERE expires_at <= ? OR rowid IN "
+                        "(SELECT rowid FROM cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                        (time.time(), self.shared_max_entries),
+                    )
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                logging.warning("Błąd zapisu współdzielonego cache (%s/%s): %s", namespace, key, e)
+
+    def invalidate(self, namespace, key):
+        """Usuwa wpis z cache lokalnego i współdzielonego (pozostałe workery po wygaśnięciu kopii lokalnej)."""
+        cache_key = (namespace, str(key))
+        with self._lock:
+            self._entries.pop(cache_key, None)
+            self._stats[namespace]["invalidations"] += 1
+        if self.shared_db_path:
+            try:
+                conn = self._shared_connection()
+                try:
+                    conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", cache_key)
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                logging.warning("Błąd unieważniania współdzielonego cache (%s/%s): %s", namespace, key, e)
+
+    def _store_local(self, cache_key, value, expires_at):
+        # Wywoływane z założoną blokadą. Przy współdzielonym backendzie kopia lokalna żyje najwyżej
+        # local_ttl sekund, po czym jest odczytywana ponownie ze wspólnej bazy.
+        if self.shared_db_path:
+            expires_at = min(expires_at, time.time() + self.local_ttl)
+        self._entries[cache_key] = (value, expires_at)
+        self._entries.move_to_end(cache_key)
+        while len(self._entries) > self.max_entries:
+            (evicted_namespace, _), _ = self._entries.popitem(last=False)
+            self._stats[evicted_namespace]["evictions"] += 1
+
+    def stats(self):
+        """Liczniki trafień/chybień per przestrzeń nazw oraz bieżący rozmiar cache."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "shared_backend": self.shared_db_path,
+                "namespaces": {namespace: dict(counters) for namespace, counters in self._stats.items()},
+            }
+
+
+pipedrive_cache = TTLCache(CACHE_MAX_ENTRIES, CACHE_SHARED_DB_PATH, CACHE_SHARED_MAX_ENTRIES, CACHE_LOCAL_TTL_SECONDS)
+
+
+# --- METADANE CREATEMETA JIRA (CACHE NA DYSKU + WALIDACJA PAYLOADU) ---
+# Schemat pól dla JIRA_PROJECT_ID/JIRA_ISSUE_TYPE jest pobierany raz, zapisywany na dysku
+# z TTL i ładowany do pamięci przy starcie workera. create_jira_issue waliduje na jego
+# podstawie payload lokalnie, zanim wyśle żądanie do Jira.
+JIRA_CREATEMETA_CACHE_PATH = os.getenv("JIRA_CREATEMETA_CACHE_PATH", "jira_createmeta_cache.json")
+JIRA_CREATEMETA_TTL_SECONDS = int(os.getenv("JIRA_CREATEMETA_TTL_SECONDS", str(24 * 3600)))
+JIRA_PAYLOAD_VALIDATION = os.getenv("JIRA_PAYLOAD_VALIDATION", "1") == "1"
+# Gdy walidacja odrzuca payload, metadane są odświeżane wymuszenie (nowa opcja lub pole w Jira),
+# ale nie częściej niż co tyle sekund; przy niedostępnej Jira kolejna próba pobrania po tylu sekundach.
+JIRA_CREATEMETA_MIN_REFRESH_SECONDS = int(os.getenv("JIRA_CREATEMETA_MIN_REFRESH_SECONDS", "60"))
+JIRA_CREATEMETA_RETRY_SECONDS = int(os.getenv("JIRA_CREATEMETA_RETRY_SECONDS", "300"))
+
+_jira_createmeta = {"fields": None, "fetched_at": 0.0, "retry_at": 0.0}
+_jira_createmeta_lock = threading.Lock()
+
+
+def fetch_jira_createmeta():
+    """Pobiera surową odpowiedź createmeta z Jira dla skonfigurowanego projektu i typu zadania."""
+    params = {
+        "projectIds": JIRA_PROJECT_ID, # Używamy projectIds!
+        "issueTypeNames": JIRA_ISSUE_TYPE,
+        "expand": "projects.issuetypes.fields",
+    }
+    response = jira_request("GET", "/rest/api/3/issue/createmeta", params=params)
+    response.raise_for_status()
+    return response.json()
+
+
+def extract_createmeta_fields(createmeta_data):
+    """Zwraca słownik pól dla JIRA_PROJECT_ID i JIRA_ISSUE_TYPE lub None, jeśli ich nie znaleziono."""
+    for project in createmeta_data.get('projects', []):
+        # Sprawdzamy po ID projektu, a nie po kluczu
+        if str(project.get('id')) != JIRA_PROJECT_ID:
+            continue
+        # Jira zwraca klucz 'issuetypes'; 'issueTypes' zostawiony dla zgodności.
+        for issue_type in project.get('issuetypes', project.get('issueTypes', [])):
+            if issue_type.get('name') == JIRA_ISSUE_TYPE:
+                return issue_type.get('fields', {})
+        logging.error("Typ zadania '%s' nie został znaleziony w projekcie (ID: %s) w metadanych Jira createmeta.", JIRA_ISSUE_TYPE, JIRA_PROJECT_ID)
+        return None
+    logging.error("Projekt (ID: %s) nie został znaleziony w metadanych Jira createmeta.", JIRA_PROJECT_ID)
+    return None
+
+
+def _read_createmeta_cache_file():
+    try:
+        with open(JIRA_CREATEMETA_CACHE_PATH, encoding="utf-8") as cache_file:
+            cached = json.load(cache_file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning("Nie udało się odczytać cache createmeta z %s: %s", JIRA_CREATEMETA_CACHE_PATH, e)
+        return None
+    if cached.get("project_id") != JIRA_PROJECT_ID or cached.get("issue_type") != JIRA_ISSUE_TYPE:
+        return None
+    return cached
+
+
+def _write_createmeta_cache_file(fields, fetched_at):
+    tmp_path = f"{JIRA_CREATEMETA_CACHE_PATH}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as cache_file:
+            json.dump({"project_id": JIRA_PROJECT_ID, "issue_type": JIRA_ISSUE_TYPE,
+                       "fetched_at": fetched_at, "fields": fields}, cache_file)
+        os.replace(tmp_path, JIRA_CREATEMETA_CACHE_PATH)
+    except OSError as e:
+        logging.warning("Nie udało się zapisać cache createmeta do %s: %s", JIRA_CREATEMETA_CACHE_PATH, e)
+
+
+def load_jira_createmeta_fields(force_refresh=False):
+    """Zwraca pola createmeta: z pamięci, z pliku cache lub (po wygaśnięciu TTL) z Jira.
+
+    `force_refresh` pobiera metadane ponownie, o ile nie są młodsze niż JIRA_CREATEMETA_MIN_REFRESH_SECONDS.
+    Gdy Jira jest niedostępna, używana jest przeterminowana kopia z dysku (bez odnawiania jej
+    wieku; ponowna próba po JIRA_CREATEMETA_RETRY_SECONDS). Zwraca None, jeśli metadanych nie da
+    się uzyskać (walidacja payloadu jest wtedy pomijana).
+    """
+    max_age = JIRA_CREATEMETA_MIN_REFRESH_SECONDS if force_refresh else JIRA_CREATEMETA_TTL_SECONDS
+
+    def usable_in_memory(now):
+        return _jira_createmeta["fields"] is not None and (
+            now - _jira_createmeta["fetched_at"] < max_age or now < _jira_createmeta["retry_at"])
+
+    if usable_in_memory(time.time()):
+        return _jira_createmeta["fields"]
+
+    with _jira_createmeta_lock:
+        now = time.time()
+        if usable_in_memory(now):
+            return _jira_createmeta["fields"]
+
+        cached = _read_createmeta_cache_file()
+        if cached and now - cached.get("fetched_at", 0) < max_age:
+            _jira_createmeta.update(fields=cached["fields"], fetched_at=cached["fetched_at"], retry_at=0.0)
+            logging.info("Załadowano metadane Jira createmeta z pliku %s.", JIRA_CREATEMETA_CACHE_PATH)
+            return cached["fields"]
+
+        if not all([JIRA_DOMAIN, JIRA_EMAIL, JIRA_API_TOKEN]):
+            logging.error("Brak pełnych danych uwierzytelniających Jira do pobrania metadanych createmeta.")
+            return cached["fields"] if cached else None
+
+        try:
+            fields = extract_createmeta_fields(fetch_jira_createmeta())
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logging.error("Błąd podczas pobierania metadanych Jira createmeta (sprawdź JIRA_DOMAIN, EMAIL, API_TOKEN, uprawnienia): %s", e)
+            fields = None
+
+        if fields is None:
+            stale = cached or (_jira_createmeta if _jira_createmeta["fields"] is not None else None)
+            if stale:
+                logging.warning("Używam przeterminowanej kopii metadanych createmeta (pobranej %s).",
+                                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(stale.get("fetched_at", 0))))
+                _jira_createmeta.update(fields=stale["fields"], fetched_at=stale.get("fetched_at", 0),
+                                        retry_at=now + JIRA_CREATEMETA_RETRY_SECONDS)
+                return stale["fields"]
+            return None
+
+        _jira_createmeta.update(fields=fields, fetched_at=now, retry_at=0.0)
+        _write_createmeta_cache_file(fields, now)
+        logging.info("Pobrano metadane Jira createmeta i zapisano je w cache.")
+        return fields
+
+
+def _option_matches(value, allowed_values):
+    """Sprawdza, czy opcja ({'id': ...} / {'value': ...} / {'name': ...}) występuje w allowedValues."""
+    if not isinstance(value, dict):
+        return False
+    for option in allowed_values:
+        for key in ("id", "value", "name"):
+            if key in value and str(value[key]) == str(option.get(key)):
+                return True
+    return False
+
+
+def validate_jira_issue_payload(jira_issue_payload, createmeta_fields=None):
+    """Waliduje payload zadania lokalnie na podstawie createmeta. Zwraca listę błędów (pusta = OK)."""
+    if createmeta_fields is None:
+        createmeta_fields = load_jira_createmeta_fields()
+    if createmeta_fields is None:
+        return []
+
+    payload_fields = jira_issue_payload.get("fields", {})
+    errors = []
+    for field_id, field_details in createmeta_fields.items():
+        if field_details.get('required') and not field_details.get('hasDefaultValue') \
+                and payload_fields.get(field_id) in (None, "", [], {}):
+            errors.append(f"Missing required field '{field_id}' ({field_details.get('name')}).")
+
+    for field_id, value in payload_fields.items():
+        field_details = createmeta_fields.get(field_id)
+        if field_details is None:
+            errors.append(f"Field '{field_id}' is not available on the create screen of issue type '{JIRA_ISSUE_TYPE}'.")
+            continue
+        allowed_values = field_details.get('allowedValues')
+        if not allowed_values or field_id in ("project", "issuetype"):
+            continue
+        for option in value if isinstance(value, list) else [value]:
+            if not _option_matches(option, allowed_values):
+                errors.append(f"Value {option} is not allowed for field '{field_id}' ({field_details.get('name')}).")
+    return errors
+
+
+def validate_jira_option_mappings(createmeta_fields):
+    """Sprawdza, czy skonfigurowane opcje (Request Type, mapowania opcji z FIELD_MAPPER) istnieją w Jira. Zwraca listę błędów."""
+    errors = []
+    checks = [(JIRA_CUSTOM_FIELDS_IDS["request_type_field"], [JIRA_REQUEST_TYPE_VALUE])]
+    checks.extend(FIELD_MAPPER.option_maps())
+    for field_id, options in checks:
+        allowed_values = (createmeta_fields.get(field_id) or {}).get('allowedValues')
+        if not allowed_values:
+            continue
+        for option in options:
+            if not _option_matches(option, allowed_values):
+                errors.append(f"Configured option {option} is not allowed for field '{field_id}'.")
+    for error in errors:
+        logging.warning("Niezgodność konfiguracji z metadanymi Jira: %s", error)
+    return errors
+
+
 # --- FUNKCJA DO LOGOWANIA METADANYCH CREATEMETA (WYWOŁYWANA RAZ PRZY STARCIE) ---
 def log_jira_createmeta_details():
-    """Pobiera i loguje szczegóły pól wymaganych oraz opcji dla Request Type."""
+    """Loguje szczegóły pól wymaganych oraz opcji dla Request Type (na podstawie świeżo pobranych metadanych)."""
     logging.info("Rozpoczynam pobieranie metadanych Jira createmeta...")
-    if not all([JIRA_DOMAIN, JIRA_EMAIL, JIRA_API_TOKEN]):
-        logging.error("Brak pełnych danych uwierzytelniających Jira do pobrania metadanych (API_TOKEN, EMAIL, DOMAIN). Pomijam funkcję log_jira_createmeta_details.")
+    fields = load_jira_createmeta_fields(force_refresh=True)
+    if fields is None:
+        logging.error("Brak metadanych Jira createmeta. Pomijam funkcję log_jira_createmeta_details.")
         return
 
-    url = (
-        f"https://{JIRA_DOMAIN}/rest/api/3/issue/createmeta?"
-        f"projectIds={JIRA_PROJECT_ID}&issueTypeNames={JIRA_ISSUE_TYPE}&expand=projects.issuetypes.fields" # Używamy projectIds!
-    )
-    auth = (JIRA_EMAIL, JIRA_API_TOKEN)
-    headers = {"Accept": "application/json"}
+    logging.info("\n--- METADANE PÓL DLA PROJEKTU (ID: %s) I TYPU ZADANIA '%s' ---", JIRA_PROJECT_ID, JIRA_ISSUE_TYPE)
 
-    try:
-        response = requests.get(url, headers=headers, auth=auth)
-        response.raise_for_status()
-        createmeta_data = response.json()
-
-        projects = createmeta_data.get('projects', [])
-        
-        found_project = False
-        found_issue_type = False
-
-        for project in projects:
-            # Sprawdzamy po ID projektu, a nie po kluczu
-            if str(project.get('id')) == JIRA_PROJECT_ID: 
-                found_project = True
-                issue_types = project.get('issueTypes', [])
-                for issue_type in issue_types:
-                    if issue_type.get('name') == JIRA_ISSUE_TYPE:
-                        found_issue_type = True
-                        fields = issue_type.get('fields', {})
-                        logging.info(f"\n--- METADANE PÓL DLA PROJEKTU (ID: {JIRA_PROJECT_ID}) I TYPU ZADANIA '{JIRA_ISSUE_TYPE}' ---")
-                        
-                        required_fields_info = {}
-                        request_type_field_details_found = None
-
-                        for field_id, field_details in fields.items():
-                            field_name = field_details.get('name')
-                            is_required = field_details.get('required')
-                            schema_custom = field_details.get('schema', {}).get('custom')
-                            
-                            if is_required:
-                                required_fields_info[field_id] = field_name
-
-                            if field_id == JIRA_CUSTOM_FIELDS_IDS["request_type_field"]:
-                                request_type_field_details_found = field_details
-                                
-                        if required_fields_info:
-                            logging.info("--- POLA WYMAGANE (required: true) ---")
-                            for f_id, f_name in required_fields_info.items():
-                                logging.info(f"  - ID: {f_id}, Nazwa: {f_name}")
-                        else:
-                            logging.info("Brak pól oznaczonych jako 'wymagane: true' w metadanych dla tego typu zadania.")
-
-                        if request_type_field_details_found:
-                            logging.info(f"\n--- SZCZEGÓŁY POLA REQUEST TYPE ({JIRA_CUSTOM_FIELDS_IDS['request_type_field']}) ---")
-                            logging.info(f"  Nazwa pola: {request_type_field_details_found.get('name')}")
-                            logging.info(f"  Typ Schematu: {request_type_field_details_found.get('schema', {}).get('type')}")
-                            logging.info(f"  Custom Type: {request_type_field_details_found.get('schema', {}).get('custom')}")
-                            logging.info(f"  Custom ID: {request_type_field_details_found.get('schema', {}).get('customId')}")
-
-                            if request_type_field_details_found.get('allowedValues'):
-                                logging.info("  Dostępne opcje (allowedValues) dla pola Request Type:")
-                                for option in request_type_field_details_found['allowedValues']:
-                                    # TE LINIE SĄ KLUCZOWE - TUTAJ BĘDZIESZ SZUKAĆ PRAWIDŁOWEJ WARTOŚCI DLA JIRA_REQUEST_TYPE_VALUE
-                                    logging.info(f"    - Value: '{option.get('value')}', ID: '{option.get('id')}'")
-                            else:
-                                logging.info("  Brak dostępnych opcji (allowedValues) dla tego pola Request Type. Może być polem tekstowym lub innym.")
-                        else:
-                            logging.warning(f"Nie znaleziono pola Request Type o ID '{JIRA_CUSTOM_FIELDS_IDS['request_type_field']}' w metadanych dla typu zadania '{JIRA_ISSUE_TYPE}'.")
-                        
-                        logging.info("\n--- KONIEC METADANYCH CREATEMETA ---")
-                        return # Zakończ po znalezieniu i zalogowaniu
-
-        if not found_project:
-            logging.error(f"Projekt (ID: {JIRA_PROJECT_ID}) nie został znaleziony w metadanych Jira createmeta.")
-        elif not found_issue_type:
-            logging.error(f"Typ zadania '{JIRA_ISSUE_TYPE}' nie został znaleziony w projekcie (ID: {JIRA_PROJECT_ID}) w metadanych Jira createmeta.")
+    required_fields_info = {}
+    request_type_field_details_found = None
 
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Błąd podczas pobierania metadanych Jira createmeta (sprawdź JIRA_DOMAIN, EMAIL, API_TOKEN, uprawnienia): {e}")
-        if response is not None:
-            logging.error(f"Odpowiedź Jira: {response.text}")
-    except Exception as e:
-        logging.error(f"Nieoczekiwany błąd podczas analizy metadanych Jira: {e}", exc_info=True)
+    for field_id, field_details in fields.items():
+        if field_details.get('required'):
+            required_fields_info[field_id] = field_details.get('name')
+        if field_id == JIRA_CUSTOM_FIELDS_IDS["request_type_field"]:
+            request_type_field_details_found = field_details
+
+    if required_fields_info:
+        logging.info("--- POLA WYMAGANE (required: true) ---")
+        for f_id, f_name in required_fields_info.items():
+            logging.info("  - ID: %s, Nazwa: %s", f_id, f_name)
+    else:
+        logging.info("Brak pól oznaczonych jako 'wymagane: true' w metadanych dla tego typu zadania.")
+
+    if request_type_field_details_found:
+        logging.info("\n--- SZCZEGÓŁY POLA REQUEST TYPE (%s) ---", JIRA_CUSTOM_FIELDS_IDS['request_type_field'])
+        logging.info("  Nazwa pola: %s", request_type_field_details_found.get('name'))
+        logging.info("  Typ Schematu: %s", request_type_field_details_found.get('schema', {}).get('type'))
+        logging.info("  Custom Type: %s", request_type_field_details_found.get('schema', {}).get('custom'))
+        logging.info("  Custom ID: %s", request_type_field_details_found.get('schema', {}).get('customId'))
+
+        if request_type_field_details_found.get('allowedValues'):
+            logging.info("  Dostępne opcje (allowedValues) dla pola Request Type:")
+            for option in request_type_field_details_found['allowedValues']:
+                # TE LINIE SĄ KLUCZOWE - TUTAJ BĘDZIESZ SZUKAĆ PRAWIDŁOWEJ WARTOŚCI DLA JIRA_REQUEST_TYPE_VALUE
+                logging.info("    - Value: '%s', ID: '%s'", option.get('value'), option.get('id'))
+        else:
+            logging.info("  Brak dostępnych opcji (allowedValues) dla tego pola Request Type. Może być polem tekstowym lub innym.")
+    else:
+        logging.warning("Nie znaleziono pola Request Type o ID '%s' w metadanych dla typu zadania '%s'.", JIRA_CUSTOM_FIELDS_IDS['request_type_field'], JIRA_ISSUE_TYPE)
+
+    logging.info("\n--- KONIEC METADANYCH CREATEMETA ---")
+
+
+# --- STRUMIENIOWE PRZEKAZYWANIE ZAŁĄCZNIKÓW (PIPEDRIVE -> JIRA) ---
+# Pliki nie są trzymane w całości w pamięci workera: treść pobierana z Pipedrive
+# jest przekazywana do uploadu Jira porcjami po ATTACHMENT_CHUNK_SIZE bajtów.
+# Pliki większe niż ATTACHMENT_SPOOL_THRESHOLD (lub o nieznanym rozmiarze) są najpierw
+# zapisywane do pliku tymczasowego, żeby nie blokować połączenia z Pipedrive
+# na czas uploadu do Jira i znać dokładną długość wysyłanego ciała.
+ATTACHMENT_CHUNK_SIZE = int(os.getenv("ATTACHMENT_CHUNK_SIZE", str(256 * 1024))) # bajty
+ATTACHMENT_SPOOL_THRESHOLD = int(os.getenv("ATTACHMENT_SPOOL_THRESHOLD", str(50 * 1024 * 1024))) # bajty
+ATTACHMENT_SPOOL_DIR = os.getenv("ATTACHMENT_SPOOL_DIR") or None # None = domyślny katalog tymczasowy
+
+
+class AttachmentContent:
+    """Treść pliku odczytywana porcjami: bezpośrednio z odpowiedzi Pipedrive albo z pliku tymczasowego."""
+
+    def __init__(self, size, response=None, spool_file=None):
+        self.size = size
+        self._response = response
+        self._spool_file = spool_file
+        self._started = False
+
+    @classmethod
+    def from_response(cls, response, size_hint=None):
+        """Tworzy źródło z odpowiedzi HTTP (stream=True); duże pliki są zrzucane na dysk."""
+        content_length = response.headers.get("Content-Length")
+        encoded = response.headers.get("Content-Encoding", "identity") != "identity"
+        size = int(content_length) if content_length and not encoded else None
+        if size is not None and size <= ATTACHMENT_SPOOL_THRESHOLD:
+            return cls(size, response=response)
+
+        spool_file = tempfile.TemporaryFile(dir=ATTACHMENT_SPOOL_DIR)
+        try:
+            written = 0
+            for chunk in response.iter_content(chunk_size=ATTACHMENT_CHUNK_SIZE):
+                spool_file.write(chunk)
+                written += len(chunk)
+            spool_file.seek(0)
+            metrics.inc("attachment_bytes_total", written, direction="download")
+        except Exception:
+            spool_file.close()
+            raise
+        finally:
+            response.close()
+        logging.info("Plik (%s B, deklarowany rozmiar: %s) zapisany tymczasowo na dysku przed uploadem.", written, size_hint)
+        return cls(written, spool_file=spool_file)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Opakowuje gotowe bajty (zachowana zgodność ze starszym API)."""
+        return cls(len(data), spool_file=io.BytesIO(data))
+
+    def __len__(self):
+        return self.size
+
+    def rewind(self):
+        """Cofa odczyt na początek (możliwe tylko dla treści z pliku tymczasowego/bajtów lub nierozpoczętego strumienia)."""
+        if self._spool_file is not None:
+            self._spool_file.seek(0)
+            return True
+        return not self._started
+
+    def __bool__(self):
+        return self.size > 0
+
+    def iter_chunks(self):
+        """Zwraca kolejne porcje treści; przy bezpośrednim strumieniu weryfikuje łączną długość."""
+        if self._spool_file is not None:
+            while True:
+                chunk = self._spool_file.read(ATTACHMENT_CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+        self._started = True
+        received = 0
+        for chunk in self._response.iter_content(chunk_size=ATTACHMENT_CHUNK_SIZE):
+            received += len(chunk)
+            yield chunk
+        metrics.inc("attachment_bytes_total", received, direction="download")
+        if received != self.size:
+            raise IOError(f"Pobrano {received} B zamiast zadeklarowanych {self.size} B.")
+
+    def close(self):
+        if self._response is not None:
+            self._response.close()
+        if self._spool_file is not None:
+            self._spool_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class MultipartFileBody:
+    """Ciało multipart/form-data z jednym plikiem, generowane strumieniowo (ze znaną długością)."""
+
+    def __init__(self, field_name, filename, content):
+        self.boundary = uuid.uuid4().hex
+        # Kodowanie nazwy pliku jak w urllib3 (HTML5): UTF-8 z escapowaniem cudzysłowów i znaków nowej linii.
+        safe_filename = filename.replace("\\", "\\\\").replace('"', "%22").replace("\r", "%0D").replace("\n", "%0A")
+        self._head = (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field_name}"; filename="{safe_filename}"\r\n'
+            f"Content-Type: application/octet-stream\r\n\r\n"
+        ).encode("utf-8")
+        self._tail = f"\r\n--{self.boundary}--\r\n".encode("utf-8")
+        self._content = content
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        # requests ustawia na tej podstawie nagłówek Content-Length zamiast kodowania chunked.
+        return len(self._head) + len(self._content) + len(self._tail)
+
+    def rewind(self):
+        return self._content.rewind()
+
+    def __iter__(self):
+        yield self._head
+        yield from self._content.iter_chunks()
+        yield self._tail
+
+
+# --- LOKALNY CACHE ZAŁĄCZNIKÓW (ADRESOWANY TREŚCIĄ) ---
+# Te same pliki (NDA, cenniki, prezentacje) wracają przy ponowieniach zadań, backfillu
+# i ponownej synchronizacji. Pobrana treść trafia do ATTACHMENT_CACHE_DIR pod nazwą
+# równą swojemu SHA-256 (identyczne pliki zajmują miejsce raz), a indeks SQLite wiąże
+# ID pliku Pipedrive + jego rozmiar i update_time z tym skrótem. Zmiana pliku w Pipedrive
+# (inny rozmiar/update_time) powoduje ponowne pobranie. Po przekroczeniu
+# ATTACHMENT_CACHE_MAX_BYTES usuwane są najdawniej używane pliki (LRU).
+# Pusta wartość ATTACHMENT_CACHE_DIR wyłącza cache.
+ATTACHMENT_CACHE_DIR = os.getenv("ATTACHMENT_CACHE_DIR", "attachment_cache")
+ATTACHMENT_CACHE_MAX_BYTES = int(os.getenv("ATTACHMENT_CACHE_MAX_BYTES", str(1024 * 1024 * 1024))) # bajty
+
+
+class AttachmentCache:
+    """Dyskowy cache treści załączników z indeksem (ID pliku, wersja) -> SHA-256 i eviction LRU."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def _connect(self):
+        """Otwiera indeks cache (przy pierwszym użyciu tworzy katalog i tabele)."""
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    os.makedirs(os.path.join(self.directory, "blobs"), exist_ok=True)
+                    conn = sqlite3.connect(os.path.join(self.directory, "index.sqlite3"), timeout=30, isolation_level=None)
+                    try:
+                        conn.execute("PRAGMA journal_mode=WAL")
+                        conn.execute(
+                            "CREATE TABLE IF NOT EXISTS entries (file_id TEXT PRIMARY KEY, version TEXT NOT NULL, sha256 TEXT NOT NULL)"
+                        )
+                        conn.execute(
+                            "CREATE TABLE IF NOT EXISTS blobs (sha256 TEXT PRIMARY KEY, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+                        )
+                        conn.execute("CREATE INDEX IF NOT EXISTS idx_blobs_last_used ON blobs (last_used)")
+                    finally:
+                        conn.close()
+                    self._initialized = True
+        conn = sqlite3.connect(os.path.join(self.directory, "index.sqlite3"), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _blob_path(self, sha256):
+        return os.path.join(self.directory, "blobs", sha256[:2], sha256)
+
+    @staticmethod
+    def version_of(file_size, update_time):
+        """Wersja pliku Pipedrive: rozmiar i czas modyfikacji z listy /files."""
+        return f"{file_size or ''}:{update_time or ''}"
+
+    def open(self, file_id, version):
+        """Zwraca AttachmentContent z dysku albo None, jeśli pliku (w tej wersji) nie ma w cache."""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT b.sha256, b.size FROM entries e JOIN blobs b ON b.sha256 = e.sha256 WHERE e.file_id = ? AND e.version = ?",
+                (str(file_id), version),
+            ).fetchone()
+            if row is None:
+                return None
+            try:
+                blob_file = open(self._blob_path(row["sha256"]), "rb")
+            except FileNotFoundError:
+                conn.execute("DELETE FROM blobs WHERE sha256 = ?", (row["sha256"],))
+                return None
+            conn.execute("UPDATE blobs SET last_used = ? WHERE sha256 = ?", (time.time(), row["sha256"]))
+        finally:
+            conn.close()
+        return AttachmentContent(row["size"], spool_file=blob_file)
+
+    def store(self, file_id, version, response):
+        """Zapisuje treść odpowiedzi (stream=True) w cache i zwraca ją jako AttachmentContent z dysku."""
+        digest = hashlib.sha256()
+        size = 0
+        tmp_file = tempfile.NamedTemporaryFile(dir=os.path.join(self.directory, "blobs"), prefix=".partial-", delete=False)
+        try:
+            with tmp_file:
+                for chunk in response.iter_content(chunk_size=ATTACHMENT_CHUNK_SIZE):
+                    tmp_file.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            metrics.inc("attachment_bytes_total", size, direction="download")
+            sha256 = digest.hexdigest()
+            blob_path = self._blob_path(sha256)
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(tmp_file.name, blob_path)
+        except Exception:
+            if os.path.exists(tmp_file.name):
+                os.remove(tmp_file.name)
+            raise
+        finally:
+            response.close()
+
+        blob_file = open(blob_path, "rb")
+        conn = self._connect()
+        try:
+            now = time.time()
+            conn.execute("INSERT OR REPLACE INTO blobs (sha256, size, last_used) VALUES (?, ?, ?)", (sha256, size, now))
+            conn.execute("INSERT OR REPLACE INTO entries (file_id, version, sha256) VALUES (?, ?, ?)", (str(file_id), version, sha256))
+            self._evict(conn)
+        finally:
+            conn.close()
+        return AttachmentContent(size, spool_file=blob_file)
+
+    def _evict(self, conn):
+        """Usuwa najdawniej używane pliki, dopóki łączny rozmiar przekracza limit."""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) AS total FROM blobs").fetchone()["total"]
+        if total <= self.max_bytes:
+            return
+        for row in conn.execute("SELECT sha256, size FROM blobs ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM blobs WHERE sha256 = ?", (row["sha256"],))
+            conn.execute("DELETE FROM entries WHERE sha256 = ?", (row["sha256"],))
+            try:
+                # Otwarte deskryptory (trwające uploady) nadal mogą czytać usunięty plik.
+                os.remove(self._blob_path(row["sha256"]))
+            except FileNotFoundError:
+                pass
+            total -= row["size"]
+            metrics.inc("attachment_cache_events_total", event="eviction")
+
+    def stats(self):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT COUNT(*) AS blobs, COALESCE(SUM(size), 0) AS size FROM blobs").fetchone()
+            entries = conn.execute("SELECT COUNT(*) AS n FROM entries").fetchone()["n"]
+        finally:
+            conn.close()
+        return {"entries": entries, "blobs": row["blobs"], "bytes": row["size"], "max_bytes": self.max_bytes}
+
+
+attachment_cache = AttachmentCache(ATTACHMENT_CACHE_DIR, ATTACHMENT_CACHE_MAX_BYTES) if ATTACHMENT_CACHE_DIR else None
+
+
+# --- SILNIK MAPOWANIA PÓL (PIPEDRIVE -> JIRA) ---
+# Specyfikacja (JSON) to lista wpisów {"target": <ID pola Jira>, "source": "deal.<klucz>" | "org.<klucz>" | "deal_id",
+# "convert": "text" | "options" | "name_or_text", "default": ...} albo {"target": ..., "template": "... {org.name|domyślna} ..."}.
+# Przy starcie każdy wpis jest kompilowany do kroku (ekstraktor, konwerter, wartość domyślna),
+# a mapowanie rekordu to jedno przejście po liście kroków.
+_TEMPLATE_PLACEHOLDER = re.compile(r"\{([^{}|]+)(?:\|([^{}]*))?\}")
+
+
+def _is_empty_value(value):
+    return value is None or value == "" or value == [] or value == {}
+
+
+def _compile_extractor(source):
+    """Kompiluje ścieżkę 'deal.klucz[.zagnieżdżony]' do funkcji pobierającej wartość z kontekstu."""
+    root, _, path = source.partition(".")
+    if root not in ("deal", "org", "deal_id"):
+        raise ValueError(f"Nieznane źródło pola w mapowaniu: '{source}'.")
+    keys = path.split(".") if path else []
+
+    def extract(context):
+        value = context[root]
+        for key in keys:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(key)
+        return value
+    return extract
+
+
+def _compile_converter(entry):
+    """Zwraca funkcję konwertującą wartość z Pipedrive na format pola Jira."""
+    convert = entry.get("convert", "text")
+    if convert == "text":
+        return lambda value: value
+    if convert == "name_or_text":
+        # Pole organizacji bywa słownikiem ({'name': ..., 'value': ...}) albo prostą wartością.
+        return lambda value: value.get("name") if isinstance(value, dict) else (None if value is None else str(value))
+    if convert == "options":
+        options = {str(key): option for key, option in entry["options"].items()}
+        field_name = entry.get("name", entry["target"])
+
+        def convert_options(value):
+            if _is_empty_value(value):
+                return None
+            # Pola wielokrotnego wyboru Pipedrive zwraca jako listę albo jako "32,33".
+            raw_values = value if isinstance(value, list) else str(value).split(",")
+            mapped = []
+            for raw in raw_values:
+                option = options.get(str(raw).strip())
+                if option:
+                    mapped.append(option)
+                else:
+                    logging.warning("Nie znaleziono mapowania Jira dla Pipedrive ID '%s' (pole '%s'). Opcja zostanie pominięta.", raw, field_name)
+            return mapped
+        return convert_options
+    raise ValueError(f"Nieznany konwerter '{convert}' dla pola '{entry['target']}'.")
+
+
+def _compile_template(template):
+    """Kompiluje szablon tekstu z placeholderami {źródło|domyślna} do funkcji renderującej."""
+    parts = []
+    position = 0
+    for match in _TEMPLATE_PLACEHOLDER.finditer(template):
+        parts.append((template[position:match.start()], None, None))
+        parts.append(("", _compile_extractor(match.group(1).strip()), match.group(2) or ""))
+        position = match.end()
+    parts.append((template[position:], None, None))
+
+    def render(context):
+        rendered = []
+        for literal, extract, default in parts:
+            rendered.append(literal)
+            if extract is not None:
+                value = extract(context)
+                rendered.append(default if _is_empty_value(value) else str(value))
+        return "".join(rendered)
+    return render
+
+
+class FieldMapper:
+    """Skompilowane mapowanie rekordów deal+organizacja z Pipedrive na pola zadania Jira."""
+
+    def __init__(self, spec):
+        self.steps = []
+        self._option_maps = []
+        for entry in spec["fields"]:
+            target = entry["target"]
+            if "template" in entry:
+                extract, convert = _compile_template(entry["template"]), (lambda value: value)
+            else:
+                extract, convert = _compile_extractor(entry["source"]), _compile_converter(entry)
+            if entry.get("convert") == "options":
+                self._option_maps.append((target, list(entry["options"].values())))
+            self.steps.append((target, entry.get("name", target), extract, convert, entry.get("default")))
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as spec_file:
+            return cls(json.load(spec_file))
+
+    def apply(self, deal_id, deal_data, org_data):
+        """Zwraca słownik {ID pola Jira: wartość}; puste pola bez wartości domyślnej są pomijane."""
+        context = {"deal": deal_data or {}, "org": org_data or {}, "deal_id": deal_id}
+        fields = {}
+        for target, name, extract, convert, default in self.steps:
+            value = convert(extract(context))
+            if _is_empty_value(value):
+                value = default
+            if _is_empty_value(value):
+                logging.debug("Pole '%s' jest puste w Pipedrive.", name)
+                continue
+            fields[target] = value
+        return fields
+
+    def option_maps(self):
+        """Lista (ID pola Jira, opcje Jira) dla pól mapowanych konwerterem 'options'."""
+        return list(self._option_maps)
+
+
+FIELD_MAPPER = FieldMapper.from_file(FIELD_MAPPING_PATH)
 
 
 # --- FUNKCJE POMOCNICZE (KOMUNIKACJA Z API) ---
+@timed_stage("get_deal_from_pipedrive")
 def get_deal_from_pipedrive(deal_id):
     """Pobiera szczegóły deala z Pipedrive."""
     if not PIPEDRIVE_API_TOKEN:
         logging.error("PIPEDRIVE_API_TOKEN nie jest ustawiony.")
         return None
-    url = f"https://api.pipedrive.com/v1/deals/{deal_id}?api_token={PIPEDRIVE_API_TOKEN}"
+    response = None
     try:
-        response = requests.get(url)
+        response = pipedrive_request("GET", f"/deals/{deal_id}")
         response.raise_for_status()
         return response.json().get("data")
     except requests.exceptions.RequestException as e:
-        logging.error(f"Błąd podczas pobierania deala {deal_id} z Pipedrive: {e}")
+        logging.error("Błąd podczas pobierania deala %s z Pipedrive: %s", deal_id, e)
         if response is not None:
-            logging.error(f"Odpowiedź Pipedrive: {response.text}")
+            logging.error("Odpowiedź Pipedrive: %s", response.text)
         return None
 
+@timed_stage("get_organization_from_pipedrive")
 def get_organization_from_pipedrive(org_id):
-    """Pobiera szczegóły organizacji z Pipedrive."""
+    """Pobiera szczegóły organizacji z Pipedrive (z użyciem pipedrive_cache)."""
+    cached_org = pipedrive_cache.get("organization", org_id)
+    if cached_org is not None:
+        logging.info("Organizacja %s pobrana z cache.", org_id)
+        return cached_org
     if not PIPEDRIVE_API_TOKEN:
         logging.error("PIPEDRIVE_API_TOKEN nie jest ustawiony.")
         return None
-    url = f"https://api.pipedrive.com/v1/organizations/{org_id}?api_token={PIPEDRIVE_API_TOKEN}"
+    response = None
     try:
-        response = requests.get(url)
+        response = pipedrive_request("GET", f"/organizations/{org_id}")
         response.raise_for_status()
-        return response.json().get("data")
+        org_data = response.json().get("data")
+        if org_data:
+            pipedrive_cache.set("organization", org_id, org_data, CACHE_TTL_SECONDS["organization"])
+        return org_data
     except requests.exceptions.RequestException as e:
-        logging.error(f"Błąd podczas pobierania organizacji {org_id} z Pipedrive: {e}")
+        logging.error("Błąd podczas pobierania organizacji %s z Pipedrive: %s", org_id, e)
         if response is not None:
-            logging.error(f"Odpowiedź Pipedrive: {response.text}")
+            logging.error("Odpowiedź Pipedrive: %s", response.text)
         return None
 
+@timed_stage("get_attachments_from_pipedrive")
 def get_attachments_from_pipedrive(deal_id):
     """Pobiera listę załączników (plików) dla danego deala z Pipedrive."""
     if not PIPEDRIVE_API_TOKEN:
         logging.error("PIPEDRIVE_API_TOKEN nie jest ustawiony.")
         return []
-    url = f"https://api.pipedrive.com/v1/files?deal_id={deal_id}&api_token={PIPEDRIVE_API_TOKEN}"
+    response = None
     try:
-        response = requests.get(url)
+        response = pipedrive_request("GET", "/files", params={"deal_id": deal_id})
         response.raise_for_status()
         return response.json().get("data", [])
     except requests.exceptions.RequestException as e:
-        logging.error(f"Błąd podczas pobierania załączników dla deala {deal_id} z Pipedrive: {e}")
+        logging.error("Błąd podczas pobierania załączników dla deala %s z Pipedrive: %s", deal_id, e)
         if response is not None:
-            logging.error(f"Odpowiedź Pipedrive: {response.text}")
+            logging.error("Odpowiedź Pipedrive: %s", response.text)
         return []
 
-def download_file_content_from_pipedrive(file_id):
-    """Pobiera binarną zawartość pliku z Pipedrive."""
+def _log_error_response(label, response):
+    """Loguje treść odpowiedzi z błędnym statusem HTTP.
+
+    Przy błędzie w trakcie odczytu poprawnej odpowiedzi (np. zerwany strumień) część treści
+    została już pobrana, a ponowne odczytanie response.text zgłosiłoby kolejny wyjątek,
+    więc logowany jest tylko kod statusu.
+    """
+    if response is None:
+        return
+    if response.ok:
+        logging.error("%s: status %s, błąd podczas odczytu treści.", label, response.status_code)
+        return
+    try:
+        body = response.text
+    except requests.exceptions.RequestException as e:
+        body = f"<nie udało się odczytać treści: {e}>"
+    logging.error("%s (status %s): %s", label, response.status_code, body)
+
+# Maksymalny rozmiar strony list w API Pipedrive v1.
+PIPEDRIVE_PAGE_LIMIT = 500
+
+def get_pipedrive_page(path, params=None, start=0, limit=PIPEDRIVE_PAGE_LIMIT):
+    """Pobiera jedną stronę listy z Pipedrive. Zwraca (rekordy, next_start lub None, gdy to ostatnia strona).
+
+    W odróżnieniu od pozostałych helperów błędy są zgłaszane dalej, żeby wywołujący
+    (np. backfill) mógł przerwać i wznowić od ostatniej strony.
+    """
+    response = None
+    try:
+        response = pipedrive_request("GET", path, params={**(params or {}), "start": start, "limit": limit})
+        response.raise_for_status()
+        response_data = response.json()
+    except requests.exceptions.RequestException as e:
+        logging.error("Błąd podczas pobierania listy %s (start=%s) z Pipedrive: %s", path, start, e)
+        _log_error_response("Odpowiedź Pipedrive", response)
+        raise
+    pagination = (response_data.get("additional_data") or {}).get("pagination") or {}
+    next_start = pagination.get("next_start") if pagination.get("more_items_in_collection") else None
+    return response_data.get("data") or [], next_start
+
+@timed_stage("download_file_content_from_pipedrive")
+def download_file_content_from_pipedrive(file_id, file_size=None, update_time=None):
+    """Otwiera strumień zawartości pliku z Pipedrive (AttachmentContent, do zamknięcia przez wywołującego).
+
+    Jeśli włączony jest attachment_cache, plik w tej samej wersji (rozmiar, update_time)
+    jest odczytywany z dysku, a nowo pobrany zapisywany w cache.
+    """
+    version = AttachmentCache.version_of(file_size, update_time)
+    if attachment_cache is not None:
+        try:
+            cached_content = attachment_cache.open(file_id, version)
+        except (OSError, sqlite3.Error) as e:
+            logging.warning("Błąd odczytu cache załączników dla pliku %s: %s", file_id, e)
+            cached_content = None
+        if cached_content is not None:
+            metrics.inc("attachment_cache_events_total", event="hit")
+            logging.info("Plik %s (%s B) odczytany z lokalnego cache załączników.", file_id, len(cached_content))
+            return cached_content
+        metrics.inc("attachment_cache_events_total", event="miss")
+
     if not PIPEDRIVE_API_TOKEN:
         logging.error("PIPEDRIVE_API_TOKEN nie jest ustawiony.")
         return None
-    url = f"https://api.pipedrive.com/v1/files/{file_id}/download?api_token={PIPEDRIVE_API_TOKEN}"
+    response = None
     try:
-        response = requests.get(url, stream=True)
+        response = pipedrive_request("GET", f"/files/{file_id}/download", stream=True)
         response.raise_for_status()
-        return response.content
+        if attachment_cache is not None:
+            try:
+                return attachment_cache.store(file_id, version, response)
+            except (OSError, sqlite3.Error) as e:
+                # Odpowiedź została już (częściowo) odczytana, więc pobieramy plik ponownie bez cache.
+                logging.warning("Nie udało się zapisać pliku %s w cache załączników: %s", file_id, e)
+                response = pipedrive_request("GET", f"/files/{file_id}/download", stream=True)
+                response.raise_for_status()
+        return AttachmentContent.from_response(response, size_hint=file_size)
     except requests.exceptions.RequestException as e:
-        logging.error(f"Błąd podczas pobierania zawartości pliku {file_id} z Pipedrive: {e}")
-        if response is not None:
-            logging.error(f"Odpowiedź Pipedrive: {response.text}")
+        logging.error("Błąd podczas pobierania zawartości pliku %s z Pipedrive: %s", file_id, e)
+        _log_error_response("Odpowiedź Pipedrive", response)
         return None
 
-def create_jira_issue(fields_to_create):
-    """Tworzy zadanie w Jira z podanymi polami."""
-    if not all([JIRA_DOMAIN, JIRA_EMAIL, JIRA_API_TOKEN]):
-        logging.error("Brak pełnych danych uwierzytelniających Jira (DOMAIN, EMAIL, API_TOKEN). Nie można utworzyć zadania.")
-        raise ValueError("Missing Jira credentials")
-
-    url = f"https://{JIRA_DOMAIN}/rest/api/3/issue"
-    auth = (JIRA_EMAIL, JIRA_API_TOKEN)
-    headers = {"Content-Type": "application/json"}
-
+def build_jira_issue_payload(fields_to_create):
+    """Buduje payload zadania Jira ({'fields': ...}) z pól Jira zmapowanych przez build_jira_fields."""
     jira_issue_payload = {
         "fields": {
             "project": {"id": JIRA_PROJECT_ID}, # <--- Używamy ID projektu 43!
-            "summary": fields_to_create.get("summary_notatka", "Nowy deal Pipedrive (brak notatki)"),
-            "description": f"Organizacja: {fields_to_create.get('org_name', 'Brak nazwy organizacji')}\n"
-                           f"Deal ID: {fields_to_create.get('deal_id', 'Brak ID deala')}",
             "issuetype": {"name": JIRA_ISSUE_TYPE},
         }
     }
@@ -250,206 +1642,1156 @@ def create_jira_issue(fields_to_create):
     else:
         logging.warning("ID pola 'Request Type' nie jest zdefiniowane w konfiguracji.")
 
+    # Pola z mapowania (puste wartości zostały już pominięte przez FieldMapper)
+    jira_issue_payload["fields"].update(fields_to_create)
 
-    # Dodawanie pozostałych pól niestandardowych tylko, jeśli mają wartości
-    # customfield_1008: Typ Prezentacji Technicznej (multi-select w Jira)
-    if fields_to_create.get("typ_prezentacji_tech_jira_format"):
-        jira_issue_payload["fields"][JIRA_CUSTOM_FIELDS_IDS["typ_prezentacji_tech"]] = \
-            fields_to_create["typ_prezentacji_tech_jira_format"]
-    else:
-        logging.info("Pole 'Typ Prezentacji Technicznej' jest puste lub niepoprawne w Pipedrive.")
+    if JIRA_PAYLOAD_VALIDATION:
+        validation_errors = validate_jira_issue_payload(jira_issue_payload)
+        if validation_errors:
+            # Metadane z cache mogą nie znać nowej opcji lub pola, więc przed odrzuceniem walidujemy na świeżych.
+            logging.info("Payload nie przeszedł walidacji na metadanych z cache; odświeżanie createmeta: %s", validation_errors)
+            validation_errors = validate_jira_issue_payload(jira_issue_payload, load_jira_createmeta_fields(force_refresh=True))
+        if validation_errors:
+            logging.error("Payload zadania Jira nie przeszedł walidacji createmeta (bez wysyłania do Jira): %s", validation_errors)
+            raise ValueError(f"Invalid Jira issue payload: {' '.join(validation_errors)}")
+    return jira_issue_payload
 
-    # customfield_10086: Klient (tekstowe)
-    if fields_to_create.get("klient"):
-        jira_issue_payload["fields"][JIRA_CUSTOM_FIELDS_IDS["klient"]] = \
-            fields_to_create["klient"]
-    else:
-        logging.info("Pole 'Klient' jest puste.")
-
-    # Pola dat (tekstowe, format incessantly-MM-DD)
-    if fields_to_create.get("data_1"):
-        jira_issue_payload["fields"][JIRA_CUSTOM_FIELDS_IDS["data_1"]] = fields_to_create["data_1"]
-    if fields_to_create.get("data_2"):
-        jira_issue_payload["fields"][JIRA_CUSTOM_FIELDS_IDS["data_2"]] = fields_to_create["data_2"]
-    if fields_to_create.get("data_3"):
-        jira_issue_payload["fields"][JIRA_CUSTOM_FIELDS_IDS["data_3"]] = fields_to_create["data_3"]
-
-    # customfield_10092: Partner (tekstowe)
-    if fields_to_create.get("partner"):
-        jira_issue_payload["fields"][JIRA_CUSTOM_FIELDS_IDS["partner"]] = \
-            fields_to_create["partner"]
-    else:
-        logging.info("Pole 'Partner' jest puste.")
+@timed_stage("create_jira_issue")
+def create_jira_issue(fields_to_create):
+    """Tworzy zadanie w Jira z podanymi polami (słownik ID pola Jira -> wartość, zob. build_jira_fields)."""
+    if not all([JIRA_DOMAIN, JIRA_EMAIL, JIRA_API_TOKEN]):
+        logging.error("Brak pełnych danych uwierzytelniających Jira (DOMAIN, EMAIL, API_TOKEN). Nie można utworzyć zadania.")
+        raise ValueError("Missing Jira credentials")
 
-    logging.info(f"Wysyłanie danych do Jira: {jira_issue_payload}")
+    jira_issue_payload = build_jira_issue_payload(fields_to_create)
+    logging.debug("Wysyłanie danych do Jira: %s", jira_issue_payload)
 
     response = None
     try:
-        response = requests.post(url, auth=auth, json=jira_issue_payload, headers=headers)
+        response = jira_request("POST", "/rest/api/3/issue", json=jira_issue_payload)
         response.raise_for_status()
         jira_response_data = response.json()
-        logging.info(f"Zadanie Jira utworzone pomyślnie. Klucz: {jira_response_data.get('key')}, ID: {jira_response_data.get('id')}")
+        logging.info("Zadanie Jira utworzone pomyślnie. Klucz: %s, ID: %s", jira_response_data.get('key'), jira_response_data.get('id'))
         return jira_response_data
     except requests.exceptions.RequestException as e:
-        logging.error(f"Błąd podczas tworzenia zadania Jira: {e}")
+        logging.error("Błąd podczas tworzenia zadania Jira: %s", e)
         if response is not None:
-            logging.error(f"Odpowiedź Jira (BŁĄD): {response.text}")
+            logging.error("Odpowiedź Jira (BŁĄD): %s", response.text)
         raise # Ponowne zgłoszenie błędu do głównego bloku try-except
 
+@timed_stage("update_jira_issue")
+def update_jira_issue(issue_id_or_key, fields_to_update):
+    """Aktualizuje pola istniejącego zadania Jira (te same pola co przy tworzeniu, zob. build_jira_fields)."""
+    if not all([JIRA_DOMAIN, JIRA_EMAIL, JIRA_API_TOKEN]):
+        logging.error("Brak pełnych danych uwierzytelniających Jira (DOMAIN, EMAIL, API_TOKEN). Nie można zaktualizować zadania.")
+        raise ValueError("Missing Jira credentials")
+
+    # Walidacja jak przy tworzeniu; projekt, typ zadania i Request Type nie są zmieniane.
+    build_jira_issue_payload(fields_to_update)
+    logging.debug("Aktualizacja zadania Jira %s: %s", issue_id_or_key, fields_to_update)
+
+    response = None
+    try:
+        response = jira_request("PUT", f"/rest/api/3/issue/{issue_id_or_key}", json={"fields": fields_to_update})
+        response.raise_for_status()
+        logging.info("Zadanie Jira %s zaktualizowane.", issue_id_or_key)
+    except requests.exceptions.RequestException as e:
+        logging.error("Błąd podczas aktualizacji zadania Jira %s: %s", issue_id_or_key, e)
+        if response is not None:
+            logging.error("Odpowiedź Jira (BŁĄD): %s", response.text)
+        raise
+
+# Maksymalna liczba zadań w jednym żądaniu POST /rest/api/3/issue/bulk (limit Jira Cloud).
+JIRA_BULK_CREATE_MAX = 50
+
+@timed_stage("create_jira_issues_bulk")
+def create_jira_issues_bulk(jira_issue_payloads):
+    """Tworzy do JIRA_BULK_CREATE_MAX zadań jednym żądaniem bulk API Jira.
+
+    Zwraca listę o długości wejścia: dla każdego payloadu {'key', 'id', ...} albo {'error': ...}.
+    """
+    if not all([JIRA_DOMAIN, JIRA_EMAIL, JIRA_API_TOKEN]):
+        logging.error("Brak pełnych danych uwierzytelniających Jira (DOMAIN, EMAIL, API_TOKEN). Nie można utworzyć zadań.")
+        raise ValueError("Missing Jira credentials")
+    if len(jira_issue_payloads) > JIRA_BULK_CREATE_MAX:
+        raise ValueError(f"Jira bulk create accepts at most {JIRA_BULK_CREATE_MAX} issues per request.")
+
+    logging.info("Wysyłanie %s zadań do Jira (bulk).", len(jira_issue_payloads))
+    response = None
+    try:
+        response = jira_request("POST", "/rest/api/3/issue/bulk", json={"issueUpdates": jira_issue_payloads})
+        # Przy częściowym sukcesie Jira zwraca 201 z listą błędów; 400 oznacza, że żadne zadanie nie powstało.
+        if response.status_code != 400:
+            response.raise_for_status()
+        jira_response_data = response.json()
+    except requests.exceptions.RequestException as e:
+        logging.error("Błąd podczas tworzenia zadań Jira (bulk): %s", e)
+        if response is not None:
+            logging.error("Odpowiedź Jira (BŁĄD): %s", response.text)
+        raise
+
+    errors_by_index = {}
+    for error in jira_response_data.get("errors", []):
+        element_errors = error.get("elementErrors", {})
+        message = "; ".join(element_errors.get("errorMessages", []) + [f"{k}: {v}" for k, v in element_errors.get("errors", {}).items()])
+        errors_by_index[error.get("failedElementNumber")] = message or f"HTTP {error.get('status')}"
+
+    # Jira zwraca utworzone zadania w kolejności wejściowej, pomijając elementy z błędami.
+    created = iter(jira_response_data.get("issues", []))
+    results = []
+    for index in range(len(jira_issue_payloads)):
+        if index in errors_by_index:
+            results.append({"error": errors_by_index[index]})
+        else:
+            results.append(next(created, {"error": "Missing issue in Jira bulk response."}))
+    logging.info("Jira bulk: utworzono %s/%s zadań.", sum(1 for r in results if 'key' in r), len(results))
+    return results
+
+@timed_stage("get_jira_issue_attachments")
+def get_jira_issue_attachments(issue_id_or_key):
+    """Zwraca listę załączników zadania Jira (filename, size, ...) albo None przy błędzie."""
+    if not all([JIRA_DOMAIN, JIRA_EMAIL, JIRA_API_TOKEN]):
+        logging.error("Brak pełnych danych uwierzytelniających Jira. Nie można pobrać listy załączników.")
+        return None
+    response = None
+    try:
+        response = jira_request("GET", f"/rest/api/3/issue/{issue_id_or_key}", params={"fields": "attachment"})
+        response.raise_for_status()
+        return response.json().get("fields", {}).get("attachment") or []
+    except requests.exceptions.RequestException as e:
+        logging.warning("Nie udało się pobrać listy załączników zadania Jira %s: %s", issue_id_or_key, e)
+        if response is not None:
+            logging.warning("Odpowiedź Jira: %s", response.text)
+        return None
+
+@timed_stage("upload_attachment_to_jira")
 def upload_attachment_to_jira(issue_id_or_key, filename, file_content):
-    """Przesyła pojedynczy załącznik do zadania Jira."""
+    """Przesyła pojedynczy załącznik do zadania Jira (bajty lub AttachmentContent, wysyłane strumieniowo).
+
+    Zwraca kod statusu HTTP odpowiedzi Jira albo None, gdy żądanie nie dostało odpowiedzi (błąd połączenia).
+    """
     if not all([JIRA_DOMAIN, JIRA_EMAIL, JIRA_API_TOKEN]):
         logging.error("Brak pełnych danych uwierzytelniających Jira. Nie można przesłać załącznika.")
-        return False
+        raise ValueError("Missing Jira credentials")
 
-    url = f"https://{JIRA_DOMAIN}/rest/api/3/issue/{issue_id_or_key}/attachments"
-    auth = (JIRA_EMAIL, JIRA_API_TOKEN)
+    if isinstance(file_content, (bytes, bytearray)):
+        file_content = AttachmentContent.from_bytes(file_content)
+    body = MultipartFileBody("file", filename, file_content)
     headers = {
-        "X-Atlassian-Token": "no-check"
-    }
-
-    files = {
-        'file': (filename, io.BytesIO(file_content))
+        "X-Atlassian-Token": "no-check",
+        "Content-Type": body.content_type,
     }
 
     response = None
     try:
-        response = requests.post(url, auth=auth, files=files, headers=headers)
+        response = jira_request("POST", f"/rest/api/3/issue/{issue_id_or_key}/attachments", data=body, headers=headers)
         response.raise_for_status()
-        logging.info(f"Załącznik '{filename}' dodany do zadania Jira {issue_id_or_key}.")
-        return True
+        metrics.inc("attachment_bytes_total", len(file_content), direction="upload")
+        logging.info("Załącznik '%s' dodany do zadania Jira %s.", filename, issue_id_or_key)
+        return response.status_code
     except requests.exceptions.RequestException as e:
-        logging.error(f"Błąd podczas przesyłania załącznika '{filename}' do Jira {issue_id_or_key}: {e}")
-        if response is not None:
-            logging.error(f"Odpowiedź Jira (załącznik BŁĄD): {response.text}")
-        return False
+        logging.error("Błąd podczas przesyłania załącznika '%s' do Jira %s: %s", filename, issue_id_or_key, e)
+        if response is None:
+            return None
+        logging.error("Odpowiedź Jira (załącznik BŁĄD): %s", response.text)
+        return response.status_code
 
-# --- ENDPOINT (Główna logika webhooka) ---
-@app.route("/webhook", methods=["POST"])
-def pipedrive_webhook():
-    logging.info("Otrzymano żądanie webhooka Pipedrive.")
+# --- RÓWNOLEGŁE PRZESYŁANIE ZAŁĄCZNIKÓW ---
+# Maksymalna liczba plików przesyłanych jednocześnie dla jednego zadania Jira.
+# Pula połączeń Jira (JIRA_POOL_SIZE) powinna być co najmniej tak duża.
+ATTACHMENT_TRANSFER_CONCURRENCY = int(os.getenv("ATTACHMENT_TRANSFER_CONCURRENCY", "4"))
+# Liczba prób przesłania jednego pliku. Strumienia z Pipedrive nie da się cofnąć po rozpoczęciu
+# uploadu, więc po nieudanej próbie (np. 429 lub zerwane połączenie) plik jest pobierany ponownie.
+ATTACHMENT_UPLOAD_ATTEMPTS = int(os.getenv("ATTACHMENT_UPLOAD_ATTEMPTS", "3"))
+
+
+def transfer_attachment_to_jira(jira_issue_key, attachment_info, existing_attachments=()):
+    """Pobiera jeden plik z Pipedrive i przesyła go do zadania Jira. Zwraca wynik dla tego pliku.
+
+    `existing_attachments` to zbiór par (nazwa, rozmiar) plików już załączonych do zadania;
+    pasujący plik nie jest ponownie pobierany ani wysyłany.
+    """
+    file_id = attachment_info.get('id')
+    file_name = attachment_info.get('file_name')
+    result = {"file_id": file_id, "file_name": file_name}
+    if not (file_id and file_name):
+        logging.warning("Brak ID pliku lub nazwy dla załącznika w Pipedrive: %s. Pomijanie.", attachment_info)
+        return {**result, "status": "skipped", "error": "Missing file id or name."}
+    if is_attachment_transferred(jira_issue_key, file_id):
+        logging.info("Plik '%s' (ID: %s) został już przesłany do zadania Jira %s. Pomijanie.", file_name, file_id, jira_issue_key)
+        return {**result, "status": "already_uploaded"}
+    if (file_name, attachment_info.get('file_size')) in existing_attachments:
+        logging.info("Plik '%s' (ID: %s) jest już załączony do zadania Jira %s. Pomijanie.", file_name, file_id, jira_issue_key)
+        metrics.inc("attachments_deduplicated_total")
+        record_attachment_transfer(jira_issue_key, file_id, file_name)
+        return {**result, "status": "already_uploaded"}
+
+    file_content = None
     try:
-        request_data = request.json
-        logging.info(f"Odebrano dane JSON z webhooka: {request_data}")
-
-        deal_id = request_data.get("deal_id")
-        org_id = request_data.get("org_id")
-
-        if not deal_id or not org_id:
-            logging.warning(f"Brak deal_id lub org_id w otrzymanym JSON: {request_data}. "
-                            f"Oczekiwano {{'deal_id': ..., 'org_id': ...}}")
-            return jsonify({"error": "Missing 'deal_id' or 'org_id' in JSON payload."}), 400
-
-        logging.info(f"Pobieranie szczegółów dla deal_id: {deal_id}, org_id: {org_id} z Pipedrive API.")
-
-        deal_data = get_deal_from_pipedrive(deal_id)
-        if not deal_data:
-            return jsonify({"error": f"Failed to retrieve deal {deal_id} from Pipedrive."}), 500
-
-        org_data = get_organization_from_pipedrive(org_id)
-        if not org_data:
-            return jsonify({"error": f"Failed to retrieve organization {org_id} from Pipedrive."}), 500
-
-        # --- PRZETWARZANIE POBRANYCH DANYCH ---
-        typ_prezentacji_pipedrive_val = deal_data.get(PIPEDRIVE_CUSTOM_FIELDS_HASHES["typ_prezentacji_tech"])
-        data_1_val = deal_data.get(PIPEDRIVE_CUSTOM_FIELDS_HASHES["data_1"])
-        data_2_val = deal_data.get(PIPEDRIVE_CUSTOM_FIELDS_HASHES["data_2"])
-        data_3_val = deal_data.get(PIPEDRIVE_CUSTOM_FIELDS_HASHES["data_3"])
-        notatka_summary_val = deal_data.get(PIPEDRIVE_CUSTOM_FIELDS_HASHES["notatka_summary"])
-
-        raw_partner_data = org_data.get(PIPEDRIVE_CUSTOM_FIELDS_HASHES["partner_org_field"])
-        partner_val = None
-        if raw_partner_data is None:
-            logging.info("Pole 'Partner' z Pipedrive jest puste (None).")
-        elif isinstance(raw_partner_data, dict):
-            partner_val = raw_partner_data.get('name')
-            logging.info(f"Pole 'Partner' z Pipedrive to słownik. Pobrano nazwę: {partner_val}")
-        elif isinstance(raw_partner_data, (str, int, float)):
-            partner_val = str(raw_partner_data)
-            logging.info(f"Pole 'Partner' z Pipedrive to prosty typ. Wartość: {partner_val}")
+        for attempt in range(1, ATTACHMENT_UPLOAD_ATTEMPTS + 1):
+            # Treść z pliku tymczasowego/cache można wysłać ponownie; rozpoczęty strumień trzeba pobrać od nowa.
+            if file_content is None or not file_content.rewind():
+                if file_content is not None:
+                    file_content.close()
+                logging.info("Pobieranie pliku '%s' (ID: %s) z Pipedrive...", file_name, file_id)
+                file_content = download_file_content_from_pipedrive(file_id, attachment_info.get('file_size'),
+                                                                    attachment_info.get('update_time'))
+                if file_content is None:
+                    logging.warning("Brak zawartości pliku '%s' (ID: %s). Prawdopodobnie błąd pobierania.", file_name, file_id)
+                    return {**result, "status": "failed", "error": "Pipedrive download failed."}
+            if not file_content:
+                logging.warning("Plik '%s' (ID: %s) jest pusty. Pomijanie.", file_name, file_id)
+                return {**result, "status": "skipped", "error": "Empty file."}
+            logging.info("Przesyłanie pliku '%s' (%s B) do zadania Jira %s (próba %s/%s)...",
+                         file_name, len(file_content), jira_issue_key, attempt, ATTACHMENT_UPLOAD_ATTEMPTS)
+            status_code = upload_attachment_to_jira(jira_issue_key, file_name, file_content)
+            if status_code is not None and status_code < 400:
+                break
+            # Odrzucenie przez Jira (403, 413, niepoprawna nazwa itp.) nie zmieni się przy kolejnej próbie.
+            if status_code is not None and status_code not in RETRYABLE_STATUS_CODES:
+                logging.error("Jira odrzuciła załącznik '%s' (HTTP %s). Bez ponawiania.", file_name, status_code)
+                return {**result, "status": "failed", "error": f"Jira upload rejected (HTTP {status_code}).",
+                        "retryable": False}
+            if attempt < ATTACHMENT_UPLOAD_ATTEMPTS:
+                metrics.inc("upstream_retries_total", upstream="jira", reason="attachment_upload")
         else:
-            partner_val = str(raw_partner_data)
-            logging.warning(f"Pole 'Partner' z Pipedrive ma nieoczekiwany typ ({type(raw_partner_data)}). Próba konwersji na string: {partner_val}")
-
-        logging.info(f"Pobrane wartości z Pipedrive (po przetworzeniu): "
-                     f"Typ Prezentacji: {typ_prezentacji_pipedrive_val}, "
-                     f"Data 1: {data_1_val}, Data 2: {data_2_val}, Data 3: {data_3_val}, "
-                     f"Partner: {partner_val} (Typ: {type(partner_val)}), "
-                     f"Notatka (Summary): {notatka_summary_val}")
-
-        typ_prezentacji_tech_jira_format = []
-        if typ_prezentacji_pipedrive_val:
-            values_to_map = [str(typ_prezentacji_pipedrive_val)] if not isinstance(typ_prezentacji_pipedrive_val, list) else [str(v) for v in typ_prezentacji_pipedrive_val]
-            for pid_option_id in values_to_map:
-                jira_option = TYP_PREZENTACJI_MAPPING.get(pid_option_id)
-                if jira_option:
-                    typ_prezentacji_tech_jira_format.append(jira_option)
-                else:
-                    logging.warning(f"Nie znaleziono mapowania Jira dla Pipedrive ID '{pid_option_id}'. Opcja zostanie pominięta.")
+            logging.error("Nie udało się przesłać załącznika '%s'.", file_name)
+            return {**result, "status": "failed", "error": "Jira upload failed."}
+    finally:
+        if file_content is not None:
+            file_content.close()
+    record_attachment_transfer(jira_issue_key, file_id, file_name)
+    return {**result, "status": "uploaded", "size": len(file_content)}
+
+
+@timed_stage("transfer_attachments_to_jira")
+def transfer_attachments_to_jira(deal_id, jira_issue_key, pipedrive_attachments=None, check_existing=True):
+    """Przesyła wszystkie załączniki deala do zadania Jira przez ograniczoną pulę wątków.
+
+    Lista załączników może zostać przekazana, jeśli pobrano ją wcześniej (np. w fetch_pipedrive_records).
+    Dla właśnie utworzonego zadania `check_existing=False` pomija odczyt jego listy załączników.
+    """
+    if pipedrive_attachments is None:
+        logging.info("Pobieranie załączników dla deala %s z Pipedrive...", deal_id)
+        pipedrive_attachments = get_attachments_from_pipedrive(deal_id)
+    if not pipedrive_attachments:
+        logging.info("Brak załączników dla deala %s w Pipedrive.", deal_id)
+        return []
+
+    logging.info("Znaleziono %s załączników dla deala %s. Rozpoczynanie przesyłania do Jira %s.", len(pipedrive_attachments), deal_id, jira_issue_key)
+    # Pliki już załączone do zadania (np. przy ponowieniu lub ponownej synchronizacji) są pomijane.
+    # Jeśli listy nie da się pobrać, wszystkie pliki są przesyłane jak dotąd.
+    existing_attachments = set()
+    if check_existing:
+        existing_attachments = {(a.get("filename"), a.get("size")) for a in get_jira_issue_attachments(jira_issue_key) or []}
+    max_workers = max(1, min(ATTACHMENT_TRANSFER_CONCURRENCY, len(pipedrive_attachments)))
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="attachment") as executor:
+        futures = [executor.submit(transfer_attachment_to_jira, jira_issue_key, info, existing_attachments)
+                   for info in pipedrive_attachments]
+        for attachment_info, future in zip(pipedrive_attachments, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logging.error("Nieoczekiwany błąd podczas przesyłania załącznika %s: %s", attachment_info.get('id'), e, exc_info=True)
+                results.append({"file_id": attachment_info.get('id'), "file_name": attachment_info.get('file_name'),
+                                "status": "failed", "error": str(e)})
+
+    uploaded = sum(1 for r in results if r["status"] in ("uploaded", "already_uploaded"))
+    logging.info("Przesłano %s/%s załączników do zadania Jira %s.", uploaded, len(results), jira_issue_key)
+    return results
+
+
+class AttachmentTransferError(RuntimeError):
+    """Część załączników nie została przesłana; ponowione zadanie pominie pliki już przesłane."""
+
+
+def raise_for_failed_attachments(jira_issue_key, attachment_results):
+    """Zgłasza AttachmentTransferError (błąd do ponowienia), jeśli którykolwiek plik ma status 'failed'.
+
+    Pliki odrzucone przez Jira ('retryable': False) zostają w wyniku, ale nie powodują ponowienia zadania.
+    """
+    failed = [r for r in attachment_results if r["status"] == "failed" and r.get("retryable", True)]
+    if failed:
+        details = ", ".join(f"{r.get('file_name') or r.get('file_id')} ({r.get('error')})" for r in failed)
+        raise AttachmentTransferError(
+            f"Failed to transfer {len(failed)}/{len(attachment_results)} attachments to Jira issue {jira_issue_key}: {details}")
+
+
+# --- KOLEJKA ZADAŃ (TRWAŁA, SQLITE) ---
+# Webhook jedynie waliduje dane i zapisuje zadanie do lokalnej kolejki, a właściwe
+# przetwarzanie (Pipedrive -> Jira -> załączniki) wykonują wątki robocze w tle.
+JOB_QUEUE_DB_PATH = os.getenv("JOB_QUEUE_DB_PATH", "job_queue.sqlite3")
+# Pod gevent "wątki" robocze to tanie greenlety, więc domyślnie jest ich więcej. Zbyt wiele
+# greenletów zadań konkuruje o CPU z obsługą /webhook i podbija jego opóźnienie (zob.
+# benchmarks/webhook_load.py), a przepustowość i tak ograniczają limity API.
+JOB_QUEUE_WORKERS = int(os.getenv("JOB_QUEUE_WORKERS", "10" if COOPERATIVE_RUNTIME else "2"))
+JOB_QUEUE_POLL_INTERVAL = float(os.getenv("JOB_QUEUE_POLL_INTERVAL", "1.0")) # sekundy
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "900")) # po tym czasie zadanie "running" wraca do kolejki
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY_SECONDS = int(os.getenv("JOB_RETRY_DELAY_SECONDS", "30"))
+
+_job_workers_lock = threading.Lock()
+_job_workers_pid = None
+
+
+def _job_queue_connection():
+    """Otwiera połączenie z bazą kolejki (osobne dla każdego wywołania/wątku)."""
+    conn = sqlite3.connect(JOB_QUEUE_DB_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def init_job_queue():
+    """Tworzy tabelę kolejki zadań, jeśli jeszcze nie istnieje."""
+    conn = _job_queue_connection()
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                available_at REAL NOT NULL,
+                claimed_at REAL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_available ON jobs (status, available_at)")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS webhook_deliveries (
+                deal_id TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                job_id INTEGER,
+                jira_issue_key TEXT,
+                jira_issue_id TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (deal_id, fingerprint)
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS attachment_transfers (
+                jira_issue_key TEXT NOT NULL,
+                file_id TEXT NOT NULL,
+                file_name TEXT,
+                uploaded_at REAL NOT NULL,
+                PRIMARY KEY (jira_issue_key, file_id)
+            )
+            """
+        )
+        # Trwałe powiązanie deal -> zadanie Jira (webhook_deliveries wygasa po oknie idempotencji)
+        # oraz kursory i nieudane deale synchronizacji przyrostowej (sync.py).
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS deal_issues (
+                deal_id TEXT PRIMARY KEY,
+                jira_issue_key TEXT NOT NULL,
+                jira_issue_id TEXT,
+                deal_update_time TEXT,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute(
+            "INSERT OR IGNORE INTO deal_issues (deal_id, jira_issue_key, jira_issue_id, deal_update_time, updated_at) "
+            "SELECT deal_id, jira_issue_key, jira_issue_id, NULL, updated_at FROM webhook_deliveries "
+            "WHERE jira_issue_key IS NOT NULL"
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sync_state (
+                name TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sync_failures (
+                deal_id TEXT PRIMARY KEY,
+                deal_update_time TEXT,
+                attempts INTEGER NOT NULL,
+                error TEXT,
+                permanent INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+    finally:
+        conn.close()
+
+
+def _insert_job(conn, payload, now):
+    cursor = conn.execute(
+        "INSERT INTO jobs (payload, status, created_at, updated_at, available_at) VALUES (?, 'queued', ?, ?, ?)",
+        (json.dumps(payload), now, now, now),
+    )
+    return cursor.lastrowid
+
+
+def enqueue_job(payload):
+    """Zapisuje dane webhooka jako nowe zadanie w kolejce i zwraca jego ID."""
+    conn = _job_queue_connection()
+    try:
+        return _insert_job(conn, payload, time.time())
+    finally:
+        conn.close()
+
+
+def claim_next_job():
+    """Atomowo pobiera kolejne zadanie do przetworzenia (lub przeterminowane zadanie 'running')."""
+    now = time.time()
+    conn = _job_queue_connection()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT id, payload, attempts FROM jobs "
+            "WHERE (status = 'queued' AND available_at <= ?) OR (status = 'running' AND claimed_at < ?) "
+            "ORDER BY available_at, id LIMIT 1",
+            (now, now - JOB_LEASE_SECONDS),
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, claimed_at = ?, updated_at = ? WHERE id = ?",
+            (now, now, row["id"]),
+        )
+        conn.execute("COMMIT")
+        return {"id": row["id"], "payload": json.loads(row["payload"]), "attempts": row["attempts"] + 1}
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def complete_job(job_id, result):
+    """Oznacza zadanie jako zakończone i zapisuje jego wynik."""
+    now = time.time()
+    conn = _job_queue_connection()
+    try:
+        conn.execute(
+            "UPDATE jobs SET status = 'done', result = ?, error = NULL, updated_at = ? WHERE id = ?",
+            (json.dumps(result), now, job_id),
+        )
+    finally:
+        conn.close()
+
+
+def fail_job(job_id, error_message, retry):
+    """Zapisuje błąd zadania; przy retry=True zadanie wraca do kolejki z opóźnieniem."""
+    now = time.time()
+    conn = _job_queue_connection()
+    try:
+        if retry:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', error = ?, updated_at = ?, available_at = ? WHERE id = ?",
+                (error_message, now, now + JOB_RETRY_DELAY_SECONDS, job_id),
+            )
         else:
-            logging.info("Pole 'Typ Prezentacji Technicznej' z Pipedrive jest puste lub nie wybrane.")
-
-        # --- Przygotowanie słownika pól do przekazania do funkcji create_jira_issue ---
-        fields_for_jira_creation = {
-            "deal_id": deal_id,
-            "summary_notatka": notatka_summary_val,
-            "org_name": org_data.get("name"),
-            "klient": org_data.get("name"),
-            "typ_prezentacji_tech_jira_format": typ_prezentacji_tech_jira_format,
-            "data_1": data_1_val,
-            "data_2": data_2_val,
-            "data_3": data_3_val,
-            "partner": partner_val
-        }
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                (error_message, now, job_id),
+            )
+    finally:
+        conn.close()
 
-        # --- TWORZENIE ZADANIA W JIRA ---
-        jira_creation_response = create_jira_issue(fields_for_jira_creation)
-        jira_issue_key = jira_creation_response.get('key')
-        jira_issue_id = jira_creation_response.get('id')
-
-        # --- PRZESYŁANIE ZAŁĄCZNIKÓW DO JIRA ---
-        if jira_issue_key:
-            logging.info(f"Pobieranie załączników dla deala {deal_id} z Pipedrive...")
-            pipedrive_attachments = get_attachments_from_pipedrive(deal_id)
-
-            if pipedrive_attachments:
-                logging.info(f"Znaleziono {len(pipedrive_attachments)} załączników dla deala {deal_id}. Rozpoczynanie przesyłania do Jira {jira_issue_key}.")
-                for attachment_info in pipedrive_attachments:
-                    file_id = attachment_info.get('id')
-                    file_name = attachment_info.get('file_name')
-                    if file_id and file_name:
-                        logging.info(f"Pobieranie pliku '{file_name}' (ID: {file_id}) z Pipedrive...")
-                        file_content = download_file_content_from_pipedrive(file_id)
-                        if file_content:
-                            logging.info(f"Przesyłanie pliku '{file_name}' do zadania Jira {jira_issue_key}...")
-                            upload_success = upload_attachment_to_jira(jira_issue_key, file_name, file_content)
-                            if not upload_success:
-                                logging.error(f"Nie udało się przesłać załącznika '{file_name}'.")
-                        else:
-                            logging.warning(f"Brak zawartości pliku '{file_name}' (ID: {file_id}). Prawdopodobnie plik pusty lub błąd pobierania.")
-                    else:
-                        logging.warning(f"Brak ID pliku lub nazwy dla załącznika w Pipedrive: {attachment_info}. Pomijanie.")
-            else:
-                logging.info(f"Brak załączników dla deala {deal_id} w Pipedrive.")
+
+def get_job(job_id):
+    """Zwraca status i wynik zadania lub None, jeśli zadanie nie istnieje."""
+    conn = _job_queue_connection()
+    try:
+        row = conn.execute(
+            "SELECT id, status, attempts, result, error, created_at, updated_at FROM jobs WHERE id = ?",
+            (job_id,),
+        ).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    return {
+        "id": row["id"],
+        "status": row["status"],
+        "attempts": row["attempts"],
+        "result": json.loads(row["result"]) if row["result"] else None,
+        "error": row["error"],
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+    }
+
+
+def get_job_queue_stats():
+    """Zwraca liczbę zadań w poszczególnych statusach oraz głębokość kolejki."""
+    conn = _job_queue_connection()
+    try:
+        rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        oldest = conn.execute("SELECT MIN(created_at) AS t FROM jobs WHERE status = 'queued'").fetchone()
+    finally:
+        conn.close()
+    counts = {"queued": 0, "running": 0, "done": 0, "failed": 0}
+    for row in rows:
+        counts[row["status"]] = row["n"]
+    return {
+        "depth": counts["queued"] + counts["running"],
+        "counts": counts,
+        "oldest_queued_age_seconds": round(time.time() - oldest["t"], 3) if oldest["t"] else None,
+        "workers": JOB_QUEUE_WORKERS,
+        "cooperative": COOPERATIVE_RUNTIME,
+    }
+
+
+def is_retryable_job_error(error):
+    """Błędy 4xx z Jira/Pipedrive i błędy konfiguracji są trwałe; pozostałe można ponowić."""
+    if isinstance(error, ValueError):
+        return False
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return error.response.status_code >= 500 or error.response.status_code == 429
+    return True
+
+
+def run_job(job):
+    """Przetwarza pojedyncze zadanie z kolejki i zapisuje jego wynik."""
+    job_id = job["id"]
+    logging.info("Rozpoczynam przetwarzanie zadania %s (próba %s/%s).", job_id, job['attempts'], JOB_MAX_ATTEMPTS)
+    started = time.perf_counter()
+    try:
+        result = process_pipedrive_webhook(job["payload"])
+        complete_job(job_id, result)
+        metrics.inc("jobs_total", result="done")
+        logging.info("Zadanie %s zakończone pomyślnie.", job_id)
+    except Exception as e:
+        if isinstance(e, requests.exceptions.HTTPError) and e.response is not None:
+            error_message = f"HTTP Error: {e.response.status_code} - {e.response.text}"
         else:
-            logging.error("Nie uzyskano klucza/ID zadania Jira po utworzeniu. Nie można przesłać załączników.")
+            error_message = str(e)
+        retry = job["attempts"] < JOB_MAX_ATTEMPTS and is_retryable_job_error(e)
+        logging.error("Błąd podczas przetwarzania zadania %s: %s. %s", job_id, error_message,
+                      "Zadanie zostanie ponowione." if retry else "Zadanie oznaczone jako nieudane.", exc_info=True)
+        fail_job(job_id, error_message, retry)
+        metrics.inc("jobs_total", result="retried" if retry else "failed")
+    finally:
+        metrics.observe("stage_duration_seconds", time.perf_counter() - started, stage="job")
+
+
+def job_worker_loop():
+    """Pętla wątku roboczego: pobiera i przetwarza zadania z kolejki."""
+    while True:
+        try:
+            job = claim_next_job()
+        except Exception as e:
+            logging.error("Błąd podczas pobierania zadania z kolejki: %s", e, exc_info=True)
+            job = None
+        if job is None:
+            time.sleep(JOB_QUEUE_POLL_INTERVAL)
+            continue
+        run_job(job)
+
+
+def start_job_workers():
+    """Uruchamia wątki robocze kolejki (raz na proces, także po forku workera Gunicorna)."""
+    global _job_workers_pid
+    if _job_workers_pid == os.getpid():
+        return
+    with _job_workers_lock:
+        if _job_workers_pid == os.getpid():
+            return
+        init_job_queue()
+        for i in range(JOB_QUEUE_WORKERS):
+            threading.Thread(target=job_worker_loop, name=f"job-worker-{i}", daemon=True).start()
+        _job_workers_pid = os.getpid()
+        logging.info("Uruchomiono %s wątków roboczych kolejki zadań (PID %s).", JOB_QUEUE_WORKERS, _job_workers_pid)
+
+
+# --- IDEMPOTENCJA DOSTARCZEŃ WEBHOOKA ---
+# Pipedrive ponawia webhooki, które przekroczyły limit czasu. Każde dostarczenie jest
+# identyfikowane przez deal_id i odcisk (hash) payloadu; powtórki w oknie
+# IDEMPOTENCY_WINDOW_SECONDS zwracają istniejące zadanie Jira bez wywołań API.
+# Niezależnie od tego okna tabela deal_issues trwale wiąże deal_id z zadaniem Jira; na niej
+# (a nie na odcisku payloadu) opiera się deduplikacja między webhookiem, backfill.py i sync.py:
+# nowe dostarczenie (zmienione dane) deala, który ma już zadanie, aktualizuje to zadanie.
+# Tabele znajdują się w tej samej bazie co kolejka (JOB_QUEUE_DB_PATH).
+IDEMPOTENCY_WINDOW_SECONDS = int(os.getenv("IDEMPOTENCY_WINDOW_SECONDS", str(24 * 3600)))
+
+
+def payload_fingerprint(payload):
+    """Zwraca stabilny hash SHA-256 payloadu webhooka (niezależny od kolejności kluczy)."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def enqueue_webhook_delivery(payload):
+    """Zapisuje dostarczenie webhooka do kolejki, chyba że jest powtórką.
+
+    Zwraca (job_id, delivery), gdzie delivery to istniejący wpis dla powtórzonego
+    dostarczenia (z kluczem Jira lub ID oczekującego zadania) albo None dla nowego zadania.
+    """
+    deal_id = str(payload.get("deal_id"))
+    fingerprint = payload_fingerprint(payload)
+    now = time.time()
+    conn = _job_queue_connection()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT d.job_id, d.jira_issue_key, d.jira_issue_id, j.status AS job_status "
+            "FROM webhook_deliveries d LEFT JOIN jobs j ON j.id = d.job_id "
+            "WHERE d.deal_id = ? AND d.fingerprint = ? AND d.created_at > ?",
+            (deal_id, fingerprint, now - IDEMPOTENCY_WINDOW_SECONDS),
+        ).fetchone()
+        if row is not None and (row["jira_issue_key"] or row["job_status"] in ("queued", "running", "done")):
+            conn.execute("COMMIT")
+            return row["job_id"], dict(row)
+
+        job_id = _insert_job(conn, payload, now)
+        conn.execute(
+            "INSERT OR REPLACE INTO webhook_deliveries "
+            "(deal_id, fingerprint, job_id, jira_issue_key, jira_issue_id, created_at, updated_at) "
+            "VALUES (?, ?, ?, NULL, NULL, ?, ?)",
+            (deal_id, fingerprint, job_id, now, now),
+        )
+        conn.execute("DELETE FROM webhook_deliveries WHERE created_at <= ?", (now - IDEMPOTENCY_WINDOW_SECONDS,))
+        conn.execute("COMMIT")
+        return job_id, None
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def record_jira_issue(payload, jira_issue_key, jira_issue_id):
+    """Zapamiętuje zadanie Jira utworzone dla dostarczenia (zaraz po utworzeniu, przed załącznikami)."""
+    now = time.time()
+    conn = _job_queue_connection()
+    try:
+        conn.execute(
+            "INSERT INTO webhook_deliveries (deal_id, fingerprint, job_id, jira_issue_key, jira_issue_id, created_at, updated_at) "
+            "VALUES (?, ?, NULL, ?, ?, ?, ?) "
+            "ON CONFLICT (deal_id, fingerprint) DO UPDATE SET "
+            "jira_issue_key = excluded.jira_issue_key, jira_issue_id = excluded.jira_issue_id, updated_at = excluded.updated_at",
+            (str(payload.get("deal_id")), payload_fingerprint(payload), jira_issue_key, jira_issue_id, now, now),
+        )
+        conn.execute(
+            "INSERT INTO deal_issues (deal_id, jira_issue_key, jira_issue_id, deal_update_time, updated_at) "
+            "VALUES (?, ?, ?, NULL, ?) "
+            "ON CONFLICT (deal_id) DO UPDATE SET "
+            "jira_issue_key = excluded.jira_issue_key, jira_issue_id = excluded.jira_issue_id, updated_at = excluded.updated_at",
+            (str(payload.get("deal_id")), jira_issue_key, jira_issue_id, now),
+        )
+    finally:
+        conn.close()
+
+
+def get_deal_jira_issue(deal_id):
+    """Zwraca {'key', 'id', 'deal_update_time'} zadania Jira powiązanego z dealem lub None."""
+    conn = _job_queue_connection()
+    try:
+        row = conn.execute(
+            "SELECT jira_issue_key, jira_issue_id, deal_update_time FROM deal_issues WHERE deal_id = ? AND jira_issue_key != ?",
+            (str(deal_id), PENDING_JIRA_ISSUE_KEY),
+        ).fetchone()
+    finally:
+        conn.close()
+    return {"key": row["jira_issue_key"], "id": row["jira_issue_id"], "deal_update_time": row["deal_update_time"]} if row else None
+
+
+# Rezerwacja deala w deal_issues na czas tworzenia zadania Jira: wiersz z pustym kluczem.
+# Dwa zadania z różnymi payloadami tego samego deala (albo webhook i sync.py) nie utworzą
+# dwóch zadań Jira. Rezerwacja porzucona przez proces, który padł, wygasa po JOB_LEASE_SECONDS.
+PENDING_JIRA_ISSUE_KEY = ""
+
+
+class DealClaimedError(RuntimeError):
+    """Zadanie Jira dla deala jest właśnie tworzone przez inne zadanie (błąd do ponowienia)."""
+
+
+def claim_deal_for_create(deal_id):
+    """Atomowo rezerwuje deal przed utworzeniem zadania Jira.
+
+    Zwraca None, gdy rezerwacja się udała (wywołujący tworzy zadanie i zapisuje je przez
+    record_jira_issue albo zwalnia przez release_deal_claim), albo powiązane zadanie
+    (jak get_deal_jira_issue), gdy deal już je ma. Zgłasza DealClaimedError, gdy deal
+    jest zarezerwowany przez inne zadanie.
+    """
+    now = time.time()
+    conn = _job_queue_connection()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT jira_issue_key, jira_issue_id, deal_update_time, updated_at FROM deal_issues WHERE deal_id = ?",
+            (str(deal_id),),
+        ).fetchone()
+        linked = row is not None and row["jira_issue_key"] != PENDING_JIRA_ISSUE_KEY
+        claimed_by_other = row is not None and not linked and row["updated_at"] > now - JOB_LEASE_SECONDS
+        if not (linked or claimed_by_other):
+            conn.execute(
+                "INSERT OR REPLACE INTO deal_issues (deal_id, jira_issue_key, jira_issue_id, deal_update_time, updated_at) "
+                "VALUES (?, ?, NULL, NULL, ?)",
+                (str(deal_id), PENDING_JIRA_ISSUE_KEY, now),
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    if linked:
+        return {"key": row["jira_issue_key"], "id": row["jira_issue_id"], "deal_update_time": row["deal_update_time"]}
+    if claimed_by_other:
+        raise DealClaimedError(f"Jira issue for deal {deal_id} is being created by another job.")
+    return None
+
+
+def release_deal_claim(deal_id):
+    """Zwalnia rezerwację deala, gdy utworzenie zadania Jira się nie powiodło."""
+    conn = _job_queue_connection()
+    try:
+        conn.execute("DELETE FROM deal_issues WHERE deal_id = ? AND jira_issue_key = ?", (str(deal_id), PENDING_JIRA_ISSUE_KEY))
+    finally:
+        conn.close()
+
+
+def record_deal_sync(deal_id, jira_issue_key, jira_issue_id, deal_update_time):
+    """Zapamiętuje, do której wersji deala (update_time) zsynchronizowano zadanie Jira."""
+    conn = _job_queue_connection()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO deal_issues (deal_id, jira_issue_key, jira_issue_id, deal_update_time, updated_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (str(deal_id), jira_issue_key, jira_issue_id, deal_update_time, time.time()),
+        )
+    finally:
+        conn.close()
+
+
+def get_sync_cursor(name):
+    """Zwraca zapisany kursor synchronizacji (np. znacznik czasu Pipedrive) lub None."""
+    conn = _job_queue_connection()
+    try:
+        row = conn.execute("SELECT value FROM sync_state WHERE name = ?", (name,)).fetchone()
+    finally:
+        conn.close()
+    return row["value"] if row else None
+
+
+def save_sync_cursor(name, value):
+    conn = _job_queue_connection()
+    try:
+        conn.execute("INSERT OR REPLACE INTO sync_state (name, value, updated_at) VALUES (?, ?, ?)", (name, value, time.time()))
+    finally:
+        conn.close()
+
+
+def record_sync_failure(deal_id, deal_update_time, error_message, permanent):
+    """Zapisuje nieudaną synchronizację wersji deala i zwraca liczbę prób tej wersji."""
+    conn = _job_queue_connection()
+    try:
+        conn.execute(
+            "INSERT INTO sync_failures (deal_id, deal_update_time, attempts, error, permanent, updated_at) "
+            "VALUES (?, ?, 1, ?, ?, ?) "
+            "ON CONFLICT (deal_id) DO UPDATE SET "
+            "attempts = CASE WHEN deal_update_time IS excluded.deal_update_time THEN attempts + 1 ELSE 1 END, "
+            "deal_update_time = excluded.deal_update_time, error = excluded.error, "
+            "permanent = excluded.permanent, updated_at = excluded.updated_at",
+            (str(deal_id), deal_update_time, error_message, int(permanent), time.time()),
+        )
+        row = conn.execute("SELECT attempts FROM sync_failures WHERE deal_id = ?", (str(deal_id),)).fetchone()
+    finally:
+        conn.close()
+    return row["attempts"]
+
+
+def get_sync_failure(deal_id):
+    """Zwraca ostatnią nieudaną synchronizację deala ({'deal_update_time', 'attempts', 'permanent', 'error'}) lub None."""
+    conn = _job_queue_connection()
+    try:
+        row = conn.execute(
+            "SELECT deal_update_time, attempts, permanent, error FROM sync_failures WHERE deal_id = ?",
+            (str(deal_id),),
+        ).fetchone()
+    finally:
+        conn.close()
+    return {**dict(row), "permanent": bool(row["permanent"])} if row else None
+
+
+def clear_sync_failure(deal_id):
+    conn = _job_queue_connection()
+    try:
+        conn.execute("DELETE FROM sync_failures WHERE deal_id = ?", (str(deal_id),))
+    finally:
+        conn.close()
+
+
+def is_attachment_transferred(jira_issue_key, file_id):
+    """Sprawdza, czy plik Pipedrive został już przesłany do danego zadania Jira."""
+    conn = _job_queue_connection()
+    try:
+        row = conn.execute(
+            "SELECT 1 FROM attachment_transfers WHERE jira_issue_key = ? AND file_id = ?",
+            (jira_issue_key, str(file_id)),
+        ).fetchone()
+    finally:
+        conn.close()
+    return row is not None
+
+
+def record_attachment_transfer(jira_issue_key, file_id, file_name):
+    """Zapamiętuje udane przesłanie pliku, aby ponowione zadanie mogło go pominąć."""
+    conn = _job_queue_connection()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO attachment_transfers (jira_issue_key, file_id, file_name, uploaded_at) VALUES (?, ?, ?, ?)",
+            (jira_issue_key, str(file_id), file_name, time.time()),
+        )
+    finally:
+        conn.close()
+
+
+# --- GŁÓWNA LOGIKA PRZETWARZANIA WEBHOOKA (WYKONYWANA W TLE) ---
+@timed_stage("fetch_pipedrive_records")
+def fetch_pipedrive_records(deal_id, org_id):
+    """Równolegle pobiera deal, organizację i listę załączników z Pipedrive.
+
+    Zwraca (deal_data, org_data, attachments). Jeśli nie uda się pobrać deala lub organizacji,
+    zgłasza RuntimeError opisujący wszystkie nieudane odczyty; brak listy załączników nie jest błędem.
+    """
+    logging.info("Pobieranie szczegółów dla deal_id: %s, org_id: %s z Pipedrive API (równolegle).", deal_id, org_id)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3, thread_name_prefix="pipedrive-fetch") as executor:
+        deal_future = executor.submit(get_deal_from_pipedrive, deal_id)
+        org_future = executor.submit(get_organization_from_pipedrive, org_id)
+        attachments_future = executor.submit(get_attachments_from_pipedrive, deal_id)
 
-        logging.info("Zakończono przetwarzanie webhooka Pipedrive i utworzono zadanie Jira (oraz załączniki, jeśli były).")
-        return jsonify(jira_creation_response), 201
+    errors = []
 
-    except requests.exceptions.HTTPError as e:
-        status_code = e.response.status_code if e.response is not None else 500
-        error_message = e.response.text if e.response is not None else str(e)
-        logging.error(f"Błąd HTTP podczas przetwarzania webhooka: Status {status_code}, Wiadomość: {error_message}", exc_info=True)
-        return jsonify({"error": f"HTTP Error: {status_code} - {error_message}"}), status_code
+    def collect(future, error_message):
+        try:
+            value = future.result()
+        except Exception as e:
+            logging.error("%s Nieoczekiwany błąd: %s", error_message, e, exc_info=True)
+            value = None
+        if not value:
+            errors.append(error_message)
+        return value
+
+    deal_data = collect(deal_future, f"Failed to retrieve deal {deal_id} from Pipedrive.")
+    org_data = collect(org_future, f"Failed to retrieve organization {org_id} from Pipedrive.")
+    try:
+        attachments = attachments_future.result()
+    except Exception as e:
+        logging.error("Nie udało się pobrać listy załączników dla deala %s: %s", deal_id, e, exc_info=True)
+        attachments = None # transfer_attachments_to_jira spróbuje pobrać listę ponownie
+
+    if errors:
+        raise RuntimeError(" ".join(errors))
+    return deal_data, org_data, attachments
+
+
+def build_jira_fields(deal_id, deal_data, org_data):
+    """Mapuje rekordy deala i organizacji z Pipedrive na pola Jira skompilowanym mapowaniem FIELD_MAPPER."""
+    fields_for_jira_creation = FIELD_MAPPER.apply(deal_id, deal_data, org_data)
+    logging.debug("Pola Jira zmapowane z Pipedrive dla deala %s: %s", deal_id, fields_for_jira_creation)
+    return fields_for_jira_creation
+
+
+def process_pipedrive_webhook(request_data):
+    """Pobiera dane z Pipedrive, tworzy (lub aktualizuje) zadanie Jira i przesyła załączniki. Zwraca odpowiedź Jira."""
+    deal_id = request_data.get("deal_id")
+    org_id = request_data.get("org_id")
+
+    deal_data, org_data, pipedrive_attachments = fetch_pipedrive_records(deal_id, org_id)
+
+    fields_for_jira_creation = build_jira_fields(deal_id, deal_data, org_data)
+
+    # Powtórki tego samego payloadu odsiewa już enqueue_webhook_delivery. Jeśli mimo to deal
+    # ma zadanie Jira (z wcześniejszego webhooka ze zmienionymi danymi, ponowionego zadania,
+    # backfillu lub sync.py), aktualizujemy jego pola jak sync.py i uzupełniamy brakujące
+    # załączniki zamiast tworzyć drugie zadanie.
+    linked_issue = claim_deal_for_create(deal_id)
+    if linked_issue:
+        logging.info("Zadanie Jira %s dla deala %s już istnieje. Aktualizacja pól i uzupełnianie załączników.",
+                     linked_issue['key'], deal_id)
+        update_jira_issue(linked_issue['key'], fields_for_jira_creation)
+        attachment_results = transfer_attachments_to_jira(deal_id, linked_issue['key'], pipedrive_attachments)
+        record_deal_sync(deal_id, linked_issue['key'], linked_issue['id'], deal_data.get("update_time"))
+        raise_for_failed_attachments(linked_issue['key'], attachment_results)
+        return {"key": linked_issue['key'], "id": linked_issue['id'], "attachments": attachment_results}
+
+    # --- TWORZENIE ZADANIA W JIRA ---
+    try:
+        jira_creation_response = create_jira_issue(fields_for_jira_creation)
+    except Exception:
+        release_deal_claim(deal_id)
+        raise
+    jira_issue_key = jira_creation_response.get('key')
+    if jira_issue_key:
+        record_jira_issue(request_data, jira_issue_key, jira_creation_response.get('id'))
+    else:
+        release_deal_claim(deal_id)
+
+    # --- PRZESYŁANIE ZAŁĄCZNIKÓW DO JIRA ---
+    attachment_results = []
+    if jira_issue_key:
+        attachment_results = transfer_attachments_to_jira(deal_id, jira_issue_key, pipedrive_attachments, check_existing=False)
+        # Zadanie Jira jest już zapisane w deal_issues, więc ponowienie tylko dośle brakujące pliki.
+        raise_for_failed_attachments(jira_issue_key, attachment_results)
+    else:
+        logging.error("Nie uzyskano klucza/ID zadania Jira po utworzeniu. Nie można przesłać załączników.")
+
+    logging.info("Zakończono przetwarzanie webhooka Pipedrive i utworzono zadanie Jira (oraz załączniki, jeśli były).")
+    return {**jira_creation_response, "attachments": attachment_results}
+
+
+# --- START WORKERA I GOTOWOŚĆ ---
+# Worker przyjmuje żądania od razu po imporcie modułu, a zdalne rozgrzewanie wykonuje
+# wątek w tle: otwarcie połączeń keep-alive do Pipedrive i Jira, załadowanie metadanych
+# createmeta (dysk albo API) i sprawdzenie mapowań opcji. Zadania nie czekają na jego
+# koniec – createmeta jest w razie potrzeby ładowane przy pierwszej walidacji payloadu.
+# Czasy importu, rozgrzewania i poszczególnych etapów są raportowane w /health, w /metrics
+# (startup_seconds) i w logu. STARTUP_WARMUP_ENABLED=0 wyłącza rozgrzewanie.
+#
+# Rozgrzewanie startuje tylko w procesie, który obsługuje żądania: z hooka post_worker_init
+# (gunicorn.conf.py) albo przy pierwszym żądaniu (before_request). Sam import modułu (np. przez
+# backfill.py, sync.py czy benchmarki) nie wysyła żadnych żądań.
+#
+# "ready" oznacza, że rozgrzewanie się zakończyło, a nie że wszystkie jego etapy się udały:
+# worker przyjmuje webhooki także bez nich (połączenia i createmeta są tworzone przy pierwszym
+# użyciu). Nieudane etapy są wymienione w "failed_steps" w /health/ready i w metryce
+# startup_step_ok.
+#
+# Konfiguracja ze zmiennych środowiskowych jest nadal odczytywana przy imporcie. Cały kod modułu
+# po imporcie bibliotek trwa kilka milisekund (import_seconds), a start workera zajmuje głównie
+# import Flaska/requests i zdalne wywołania, które są tu w tle. Leniwy odczyt kilkudziesięciu
+# stałych zmieniłby API modułu używane przez backfill.py i sync.py bez mierzalnego zysku.
+STARTUP_WARMUP_ENABLED = os.getenv("STARTUP_WARMUP_ENABLED", "1").lower() not in ("0", "false", "no")
+
+startup_state = {"ready": False, "import_seconds": None, "warmup_seconds": None, "steps": {}, "failed_steps": []}
+_startup_lock = threading.Lock()
+_startup_pid = None
+
+
+def prewarm_http_connections():
+    """Nawiązuje połączenia (DNS, TCP, TLS) do Pipedrive i Jira, które trafiają do puli sesji."""
+    targets = []
+    if PIPEDRIVE_API_TOKEN:
+        targets.append(("Pipedrive", get_pipedrive_session(), PIPEDRIVE_API_URL))
+    if all([JIRA_DOMAIN, JIRA_EMAIL, JIRA_API_TOKEN]):
+        targets.append(("Jira", get_jira_session(), JIRA_BASE_URL))
+    if not targets:
+        raise ValueError("Missing Pipedrive and Jira credentials")
+    for name, session, url in targets:
+        # Status odpowiedzi nie ma znaczenia; liczy się otwarte połączenie keep-alive.
+        session.head(url, timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT), allow_redirects=False).close()
+        logging.debug("Połączenie z %s nawiązane.", name)
+
+
+def _load_createmeta_for_startup():
+    fields = load_jira_createmeta_fields()
+    if fields is None:
+        raise RuntimeError("Jira createmeta metadata unavailable")
+    return fields
+
+
+def _run_startup_step(name, func):
+    """Wykonuje etap rozgrzewania, zapisując jego czas i wynik w startup_state. Zwraca wynik lub None."""
+    started = time.perf_counter()
+    try:
+        result = func()
+        step = {"status": "ok"}
     except Exception as e:
-        logging.error(f"Wystąpił nieoczekiwany błąd podczas przetwarzania webhooka: {e}", exc_info=True)
-        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+        logging.warning("Etap startu '%s' nie powiódł się: %s", name, e)
+        result, step = None, {"status": "error", "error": str(e)}
+    step["seconds"] = round(time.perf_counter() - started, 3)
+    startup_state["steps"][name] = step
+    return result
+
+
+def run_startup_warmup():
+    """Rozgrzewa worker (połączenia, createmeta, walidacja mapowań) i oznacza go jako gotowy."""
+    started = time.perf_counter()
+    _run_startup_step("http_connections", prewarm_http_connections)
+    createmeta_fields = _run_startup_step("jira_createmeta", _load_createmeta_for_startup)
+    if createmeta_fields is not None:
+        mapping_errors = _run_startup_step("field_mapping_validation", lambda: validate_jira_option_mappings(createmeta_fields))
+        if mapping_errors:
+            startup_state["steps"]["field_mapping_validation"]["warnings"] = mapping_errors
+    else:
+        startup_state["steps"]["field_mapping_validation"] = {"status": "skipped", "seconds": 0.0}
+    startup_state["warmup_seconds"] = round(time.perf_counter() - started, 3)
+    startup_state["failed_steps"] = [name for name, step in startup_state["steps"].items() if step["status"] == "error"]
+    startup_state["ready"] = True
+    logging.info("Worker gotowy (PID %s): import %.3fs, rozgrzewanie %.3fs (%s).", os.getpid(),
+                 startup_state["import_seconds"] or 0, startup_state["warmup_seconds"],
+                 ", ".join(f"{name}: {step['status']} {step['seconds']}s" for name, step in startup_state["steps"].items()))
+
+
+def start_startup_warmup():
+    """Uruchamia rozgrzewanie w wątku w tle (raz na proces, także po forku workera Gunicorna)."""
+    global _startup_pid
+    if _startup_pid == os.getpid():
+        return
+    with _startup_lock:
+        if _startup_pid == os.getpid():
+            return
+        inherited = _startup_pid is not None
+        _startup_pid = os.getpid()
+        if inherited:
+            startup_state.update(ready=False, warmup_seconds=None, steps={}, failed_steps=[])
+        if not STARTUP_WARMUP_ENABLED:
+            startup_state["ready"] = True
+            return
+        threading.Thread(target=run_startup_warmup, name="startup-warmup", daemon=True).start()
+
+
+# --- ENDPOINTY ---
+@app.before_request
+def ensure_job_workers():
+    # Wątki robocze startują przy pierwszym żądaniu w danym procesie (np. /health),
+    # dzięki czemu zadania pozostawione w kolejce po restarcie są od razu podejmowane.
+    start_job_workers()
+
+@app.before_request
+def ensure_metrics_flusher():
+    start_metrics_flusher()
+
+@app.before_request
+def ensure_startup_warmup():
+    # Zwykle rozgrzewanie startuje już z post_worker_init (gunicorn.conf.py); tu zostaje dla
+    # serwera deweloperskiego Flaska i innych serwerów WSGI.
+    start_startup_warmup()
+
+@app.route("/webhook", methods=["POST"])
+def pipedrive_webhook():
+    """Waliduje dane webhooka, zapisuje zadanie do kolejki i od razu zwraca 202."""
+    logging.info("Otrzymano żądanie webhooka Pipedrive.")
+    request_data = request.get_json(silent=True)
+    logging.debug("Odebrano dane JSON z webhooka: %s", request_data)
+
+    if not isinstance(request_data, dict):
+        logging.warning("Żądanie webhooka nie zawiera poprawnego obiektu JSON.")
+        return jsonify({"error": "Request body must be a JSON object."}), 400
+
+    deal_id = request_data.get("deal_id")
+    org_id = request_data.get("org_id")
+
+    if not deal_id or not org_id:
+        logging.warning("Brak deal_id lub org_id w otrzymanym JSON: %s. "
+                        "Oczekiwano {'deal_id': ..., 'org_id': ...}", request_data)
+        return jsonify({"error": "Missing 'deal_id' or 'org_id' in JSON payload."}), 400
+
+    try:
+        job_id, delivery = enqueue_webhook_delivery(request_data)
+    except Exception as e:
+        logging.error("Nie udało się zapisać zadania do kolejki: %s", e, exc_info=True)
+        return jsonify({"error": f"Failed to enqueue webhook: {str(e)}"}), 500
+
+    if delivery is not None:
+        if delivery["jira_issue_key"]:
+            logging.info("Powtórzone dostarczenie webhooka dla deala %s. Zadanie Jira %s już istnieje.", deal_id, delivery['jira_issue_key'])
+            return jsonify({"key": delivery["jira_issue_key"], "id": delivery["jira_issue_id"],
+                            "job_id": job_id, "duplicate": True}), 200
+        logging.info("Powtórzone dostarczenie webhooka dla deala %s. Zadanie %s jest już w kolejce.", deal_id, job_id)
+        return jsonify({"job_id": job_id, "status": delivery["job_status"], "status_url": f"/jobs/{job_id}",
+                        "duplicate": True}), 202
+
+    logging.info("Zadanie %s dla deala %s zapisane w kolejce.", job_id, deal_id)
+    return jsonify({"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}), 202
+
+@app.route("/webhook/organization", methods=["POST"])
+def pipedrive_organization_webhook():
+    """Unieważnia wpis organizacji w cache po zdarzeniu organizacji z Pipedrive (updated/deleted/merged)."""
+    request_data = request.get_json(silent=True)
+    if not isinstance(request_data, dict):
+        return jsonify({"error": "Request body must be a JSON object."}), 400
+
+    # Obsługa formatu webhooków Pipedrive v1 (meta.id, current/previous) i v2 (meta.entity_id, data).
+    meta = request_data.get("meta") or {}
+    org_id = meta.get("entity_id") or meta.get("id")
+    if not org_id:
+        org_id = ((request_data.get("current") or request_data.get("data") or request_data.get("previous") or {}).get("id")
+                  or request_data.get("org_id"))
+    if not org_id:
+        logging.warning("Nie znaleziono ID organizacji w zdarzeniu Pipedrive: %s", request_data)
+        return jsonify({"error": "Missing organization id in webhook payload."}), 400
+
+    pipedrive_cache.invalidate("organization", org_id)
+    logging.info("Unieważniono cache organizacji %s (zdarzenie: %s).", org_id, meta.get('action'))
+    return jsonify({"invalidated": {"organization": str(org_id)}}), 200
+
+@app.route("/cache")
+def cache_status():
+    """Zwraca liczniki trafień i chybień cache odczytów z Pipedrive oraz stan cache załączników."""
+    stats = pipedrive_cache.stats()
+    if attachment_cache is not None:
+        stats["attachment_cache"] = attachment_cache.stats()
+    return jsonify(stats), 200
+
+@app.route("/jobs/<int:job_id>")
+def job_status(job_id):
+    """Zwraca status i wynik zadania z kolejki."""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": f"Job {job_id} not found."}), 404
+    return jsonify(job), 200
+
+@app.route("/queue")
+def queue_status():
+    """Zwraca głębokość kolejki oraz liczbę zadań w poszczególnych statusach."""
+    return jsonify({**get_job_queue_stats(), "upstreams": get_upstream_status()}), 200
+
+def collect_process_gauges():
+    """Ustawia metryki stanu bieżącego procesu (etykietę pid dodaje render_prometheus_metrics)."""
+    for namespace, counters in pipedrive_cache.stats()["namespaces"].items():
+        for event, count in counters.items():
+            metrics.set_gauge("cache_events_total", count, namespace=namespace, event=event)
+    metrics.set_gauge("ready", 1 if startup_state["ready"] else 0)
+    for phase in ("import", "warmup"):
+        if startup_state[f"{phase}_seconds"] is not None:
+            metrics.set_gauge("startup_seconds", startup_state[f"{phase}_seconds"], phase=phase)
+    for name, step in list(startup_state["steps"].items()):
+        metrics.set_gauge("startup_seconds", step["seconds"], phase=name)
+        if step["status"] != "skipped":
+            metrics.set_gauge("startup_step_ok", 1 if step["status"] == "ok" else 0, step=name)
+
+
+metrics.add_gauge_collector(collect_process_gauges)
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Metryki w formacie Prometheusa (etapy, żądania do API, ponowienia, bajty, kolejka, cache)."""
+    gauges = []
+    try:
+        for status, count in get_job_queue_stats()["counts"].items():
+            gauges.append(("queue_jobs", {"status": status}, count))
+    except sqlite3.Error as e:
+        logging.warning("Nie udało się odczytać stanu kolejki dla /metrics: %s", e)
+    body = render_prometheus_metrics(collect_metric_snapshots(), gauges)
+    return body, 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
 
 # --- Uruchomienie aplikacji (dla Render.com używany jest Gunicorn, lokalnie Flask) ---
 @app.route("/health") # Dodatkowy endpoint do sprawdzania statusu aplikacji
 def health_check():
-    return "OK", 200
+    """Liveness: 200 zaraz po starcie workera; "ready" mówi, czy zakończyło się rozgrzewanie."""
+    return jsonify({"status": "OK", "pid": os.getpid(), **startup_state}), 200
+
+@app.route("/health/ready")
+def readiness_check():
+    """Readiness: 200 po zakończeniu rozgrzewania workera (także z nieudanymi etapami, zob. failed_steps), wcześniej 503."""
+    return jsonify({"ready": startup_state["ready"], "steps": startup_state["steps"], "failed_steps": startup_state["failed_steps"]}), \
+        200 if startup_state["ready"] else 503
+
+# Import modułu nie wykonuje wywołań sieciowych; rozgrzewanie uruchamia worker (zob. start_startup_warmup).
+startup_state["import_seconds"] = round(time.perf_counter() - _MODULE_INIT_STARTED, 3)
 
 if __name__ == "__main__":
     # Wywołaj funkcję logującą metadane Jira przy starcie aplikacji
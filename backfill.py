@@ -0,0 +1,238 @@
+"""Hurtowa synchronizacja (backfill) deali z Pipedrive do Jira.
+
+Używane przy wdrażaniu nowego pipeline'u lub po awarii, gdy trzeba przepchnąć
+setki deali naraz zamiast wywoływać /webhook pojedynczo.
+
+Przykłady:
+    python backfill.py 101 102 103
+    python backfill.py --filter-id 42
+    python backfill.py --filter-id 42 --checkpoint backfill_checkpoint.json --skip-attachments
+
+Postęp zapisywany jest w pliku checkpoint po każdej partii, więc ponowne
+uruchomienie z tym samym plikiem wznawia pracę od miejsca przerwania.
+"""
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+import time
+
+import app
+
+BACKFILL_FETCH_CONCURRENCY = int(os.getenv("BACKFILL_FETCH_CONCURRENCY", "4"))
+# Powyżej tej liczby unikalnych organizacji lista /organizations jest pobierana stronami
+# zamiast pojedynczych zapytań.
+BACKFILL_ORG_PAGING_THRESHOLD = int(os.getenv("BACKFILL_ORG_PAGING_THRESHOLD", "100"))
+
+
+# --- CHECKPOINT ---
+def load_checkpoint(path):
+    """Wczytuje stan poprzedniego uruchomienia (lub pusty stan)."""
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as checkpoint_file:
+            state = json.load(checkpoint_file)
+        logging.info("Wznawianie z checkpointu %s: %s deali już zsynchronizowanych.", path, len(state.get('done', {})))
+        return state
+    return {"done": {}, "failed": {}, "next_start": 0}
+
+
+def save_checkpoint(path, state):
+    """Zapisuje stan atomowo (plik tymczasowy + rename)."""
+    if not path:
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as checkpoint_file:
+        json.dump(state, checkpoint_file, indent=2)
+    os.replace(tmp_path, path)
+
+
+# --- POBIERANIE DANYCH Z PIPEDRIVE ---
+def org_id_of(deal_data):
+    """org_id w API v1 bywa słownikiem ({'value': ..., 'name': ...}) albo liczbą."""
+    org_id = deal_data.get("org_id")
+    if isinstance(org_id, dict):
+        return org_id.get("value")
+    return org_id
+
+
+def iter_deal_batches(deal_ids, filter_id, state, batch_size):
+    """Zwraca kolejne partie rekordów deali (pomijając już zsynchronizowane)."""
+    if filter_id is not None:
+        start = state.get("next_start") or 0
+        while start is not None:
+            deals, next_start = app.get_pipedrive_page("/deals", {"filter_id": filter_id, "status": "all_not_deleted"}, start)
+            pending = [deal for deal in deals if str(deal.get("id")) not in state["done"]]
+            for i in range(0, len(pending), batch_size):
+                yield pending[i:i + batch_size]
+            # Strona jest zakończona dopiero po przetworzeniu wszystkich jej partii.
+            state["next_start"] = next_start
+            start = next_start
+        return
+
+    pending_ids = [deal_id for deal_id in deal_ids if str(deal_id) not in state["done"]]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=BACKFILL_FETCH_CONCURRENCY) as executor:
+        for i in range(0, len(pending_ids), batch_size):
+            chunk = pending_ids[i:i + batch_size]
+            deals = []
+            for deal_id, deal_data in zip(chunk, executor.map(app.get_deal_from_pipedrive, chunk)):
+                if deal_data:
+                    deals.append(deal_data)
+                else:
+                    state["failed"][str(deal_id)] = "Failed to retrieve deal from Pipedrive."
+            yield deals
+
+
+def fetch_organizations(org_ids):
+    """Pobiera organizacje (każdą tylko raz) i zwraca słownik {org_id: rekord}.
+
+    Przy dużej liczbie organizacji przegląda stronami /organizations, a brakujące
+    (np. spoza pierwszych stron) dociąga pojedynczo. Wyniki trafiają do pipedrive_cache.
+    """
+    wanted = {str(org_id) for org_id in org_ids if org_id}
+    organizations = {}
+    for org_id in wanted:
+        cached_org = app.pipedrive_cache.get("organization", org_id)
+        if cached_org is not None:
+            organizations[org_id] = cached_org
+
+    missing = wanted - organizations.keys()
+    if len(missing) > BACKFILL_ORG_PAGING_THRESHOLD:
+        start = 0
+        while start is not None and missing:
+            orgs_page, start = app.get_pipedrive_page("/organizations", start=start)
+            for org_data in orgs_page:
+                org_id = str(org_data.get("id"))
+                if org_id in missing:
+                    organizations[org_id] = org_data
+                    missing.discard(org_id)
+                    app.pipedrive_cache.set("organization", org_id, org_data, app.CACHE_TTL_SECONDS["organization"])
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=BACKFILL_FETCH_CONCURRENCY) as executor:
+        missing = sorted(missing)
+        for org_id, org_data in zip(missing, executor.map(app.get_organization_from_pipedrive, missing)):
+            if org_data:
+                organizations[org_id] = org_data
+    return organizations
+
+
+# --- SYNCHRONIZACJA PARTII ---
+def sync_batch(deals, state, skip_attachments=False, dry_run=False):
+    """Tworzy zadania Jira dla partii deali jednym żądaniem bulk. Zwraca liczbę utworzonych zadań."""
+    organizations = fetch_organizations(org_id_of(deal) for deal in deals)
+
+    pending = [] # (deal_id, webhook_payload, jira_issue_payload)
+    for deal_data in deals:
+        deal_id = deal_data.get("id")
+        # Powiązanie deal -> zadanie Jira jest wspólne dla backfillu, /webhook i sync.py.
+        linked_issue = app.get_deal_jira_issue(deal_id)
+        if linked_issue:
+            logging.info("Deal %s ma już zadanie Jira %s. Uzupełnianie załączników.", deal_id, linked_issue['key'])
+            if not (skip_attachments or dry_run):
+                app.transfer_attachments_to_jira(deal_id, linked_issue["key"])
+            state["done"][str(deal_id)] = linked_issue["key"]
+            continue
+
+        org_id = org_id_of(deal_data)
+        org_data = organizations.get(str(org_id))
+        if not org_data:
+            state["failed"][str(deal_id)] = f"Failed to retrieve organization {org_id} from Pipedrive."
+            continue
+
+        # Ten sam kształt co payload webhooka (wpis w webhook_deliveries dla powtórek w oknie idempotencji).
+        webhook_payload = {"deal_id": deal_id, "org_id": org_id}
+        try:
+            jira_issue_payload = app.build_jira_issue_payload(app.build_jira_fields(deal_id, deal_data, org_data))
+        except ValueError as e:
+            state["failed"][str(deal_id)] = str(e)
+            continue
+        if not dry_run:
+            # Rezerwacja w deal_issues, żeby równoległy webhook lub sync.py nie utworzył drugiego zadania.
+            try:
+                linked_issue = app.claim_deal_for_create(deal_id)
+            except app.DealClaimedError as e:
+                state["failed"][str(deal_id)] = str(e)
+                continue
+            if linked_issue:
+                state["done"][str(deal_id)] = linked_issue["key"]
+                continue
+        pending.append((deal_id, webhook_payload, jira_issue_payload))
+
+    if dry_run or not pending:
+        return 0
+
+    created = 0
+    for i in range(0, len(pending), app.JIRA_BULK_CREATE_MAX):
+        chunk = pending[i:i + app.JIRA_BULK_CREATE_MAX]
+        try:
+            results = app.create_jira_issues_bulk([jira_issue_payload for _, _, jira_issue_payload in chunk])
+        except Exception:
+            for deal_id, _, _ in pending[i:]:
+                app.release_deal_claim(deal_id)
+            raise
+        for (deal_id, webhook_payload, _), result in zip(chunk, results):
+            if "key" not in result:
+                app.release_deal_claim(deal_id)
+                state["failed"][str(deal_id)] = result.get("error")
+                continue
+            app.record_jira_issue(webhook_payload, result["key"], result.get("id"))
+            state["done"][str(deal_id)] = result["key"]
+            state["failed"].pop(str(deal_id), None)
+            created += 1
+            if not skip_attachments:
+                app.transfer_attachments_to_jira(deal_id, result["key"], check_existing=False)
+    return created
+
+
+def run_backfill(deal_ids=None, filter_id=None, checkpoint_path=None, batch_size=app.JIRA_BULK_CREATE_MAX,
+                 skip_attachments=False, dry_run=False):
+    """Synchronizuje wskazane deale (lub deale z filtra Pipedrive) i zwraca stan końcowy."""
+    app.init_job_queue() # tabele idempotencji
+    state = load_checkpoint(checkpoint_path)
+    started_at = time.monotonic()
+    processed = created = 0
+
+    for deals in iter_deal_batches(deal_ids or [], filter_id, state, batch_size):
+        batch_started_at = time.monotonic()
+        batch_created = sync_batch(deals, state, skip_attachments=skip_attachments, dry_run=dry_run)
+        processed += len(deals)
+        created += batch_created
+        save_checkpoint(checkpoint_path, state)
+
+        elapsed = time.monotonic() - started_at
+        batch_elapsed = time.monotonic() - batch_started_at
+        logging.info("Partia: %s deali, %s zadań w %.1fs. "
+                     "Łącznie: %s deali, %s zadań, %s błędów, %.1f deali/s.",
+                     len(deals), batch_created, batch_elapsed,
+                     processed, created, len(state["failed"]), processed / elapsed if elapsed else 0)
+
+    elapsed = time.monotonic() - started_at
+    logging.info("Backfill zakończony: %s deali w %.1fs (%.1f deali/s), utworzono %s zadań, błędy: %s.",
+                 processed, elapsed, processed / elapsed if elapsed else 0, created, len(state["failed"]))
+    return state
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Hurtowa synchronizacja deali z Pipedrive do Jira.")
+    parser.add_argument("deal_ids", nargs="*", help="ID deali do synchronizacji.")
+    parser.add_argument("--filter-id", help="ID filtra Pipedrive wybierającego deale (zamiast listy ID).")
+    parser.add_argument("--checkpoint", default="backfill_checkpoint.json",
+                        help="Plik postępu umożliwiający wznowienie (domyślnie: %(default)s).")
+    parser.add_argument("--batch-size", type=int, default=app.JIRA_BULK_CREATE_MAX,
+                        help="Liczba deali w jednej partii (domyślnie: %(default)s).")
+    parser.add_argument("--skip-attachments", action="store_true", help="Nie przesyłaj załączników.")
+    parser.add_argument("--dry-run", action="store_true", help="Tylko pobierz i zmapuj dane, bez tworzenia zadań.")
+    args = parser.parse_args(argv)
+
+    if not args.deal_ids and args.filter_id is None:
+        parser.error("Podaj ID deali albo --filter-id.")
+
+    state = run_backfill(args.deal_ids, args.filter_id, args.checkpoint, args.batch_size,
+                         args.skip_attachments, args.dry_run)
+    for deal_id, error in state["failed"].items():
+        logging.error("Deal %s: %s", deal_id, error)
+    return 1 if state["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,66 @@
+"""Mikro-benchmark skompilowanego mapowania pól Pipedrive -> Jira (rekordy/s).
+
+Uruchomienie (z katalogu głównego repozytorium):
+    python benchmarks/field_mapping_bench.py [--records 20000] [--repeat 5]
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def make_records(count, seed=0):
+    """Generuje syntetyczne pary (deal, organizacja) z polami używanymi w field_mapping.json."""
+    rng = random.Random(seed)
+    records = []
+    for deal_id in range(1, count + 1):
+        deal = {
+            "id": deal_id,
+            "b1d7a6fb7866d3e88f0eb486ae1032012bf8295b": f"Prezentacja dla klienta {deal_id}",
+            "5bc985e61592b58e001c657305423499b6a23ce4": ",".join(rng.sample(["32", "33", "68", "69", "70"], rng.randint(0, 3))),
+            "77554ed03246265be68e75bc152243b19d492d9f": "2026-01-15",
+            "348bc2d5699beb5a76ae34f9318055a0bbbef3a8": rng.choice([None, "2026-02-01"]),
+            "db137c6e874446aaa7e42d1638538f5138786633": None,
+        }
+        org = {
+            "id": 1000 + deal_id % 50,
+            "name": f"Organizacja {deal_id % 50}",
+            "fea50f9d3ff5801b5fa9c451a8110445442db46d": rng.choice([None, "Partner", {"name": "Partner", "value": 7}]),
+        }
+        records.append((deal_id, deal, org))
+    return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    records = make_records(args.records)
+
+    compile_started = time.perf_counter()
+    mapper = app.FieldMapper.from_file(app.FIELD_MAPPING_PATH)
+    compile_ms = (time.perf_counter() - compile_started) * 1000
+
+    best = float("inf")
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        for deal_id, deal, org in records:
+            mapper.apply(deal_id, deal, org)
+        best = min(best, time.perf_counter() - started)
+
+    print(f"kompilacja mapowania: {compile_ms:.2f} ms ({len(mapper.steps)} kroków)")
+    print(f"mapowanie: {args.records} rekordów, najlepszy z {args.repeat} przebiegów: {best:.3f} s "
+          f"-> {args.records / best:,.0f} rekordów/s")
+
+
+if __name__ == "__main__":
+    main()
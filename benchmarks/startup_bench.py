@@ -0,0 +1,89 @@
+"""Pomiar czasu startu serwisu: do pierwszej odpowiedzi /health i do gotowości (/health/ready).
+
+Serwis jest uruchamiany kilkukrotnie na atrapie API (upstream_stub.py) z zadanym opóźnieniem,
+żeby było widać, że zdalne rozgrzewanie nie opóźnia przyjmowania żądań.
+
+Uruchomienie (z katalogu głównego repozytorium):
+    python benchmarks/startup_bench.py [--runs 5] [--latency-ms 300]
+        [--server-cmd "gunicorn --bind 127.0.0.1:{port} app:app"]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import upstream_stub  # noqa: E402
+import webhook_load  # noqa: E402
+
+
+def wait_for(url, timeout, expected_status=200):
+    """Czeka na odpowiedź `expected_status` z `url`; zwraca ostatnią odpowiedź."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            response = requests.get(url, timeout=1)
+            if response.status_code == expected_status:
+                return response
+        except requests.exceptions.RequestException:
+            pass
+        if time.monotonic() >= deadline:
+            raise RuntimeError(f"{url} nie zwrócił {expected_status} w ciągu {timeout}s.")
+        time.sleep(0.01)
+
+
+def measure_startup(server_cmd, stub_url, timeout):
+    """Uruchamia serwis raz i zwraca (s do /health, s do gotowości, stan startu z /health)."""
+    workdir = tempfile.mkdtemp(prefix="startup-bench-")
+    process = None
+    try:
+        started = time.monotonic()
+        process, base_url = webhook_load.start_service(server_cmd, stub_url, workdir)
+        wait_for(f"{base_url}/health", timeout)
+        healthy_after = time.monotonic() - started
+        wait_for(f"{base_url}/health/ready", timeout)
+        ready_after = time.monotonic() - started
+        return healthy_after, ready_after, requests.get(f"{base_url}/health", timeout=5).json()
+    finally:
+        if process:
+            process.terminate()
+            process.wait(timeout=30)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--server-cmd", default=webhook_load.DEFAULT_SERVER_CMD,
+                        help="Polecenie uruchamiające serwis; {port} zostanie podstawiony (domyślnie: %(default)s).")
+    upstream_stub.add_stub_arguments(parser)
+    parser.set_defaults(latency_ms=300.0, jitter_ms=0.0)
+    args = parser.parse_args(argv)
+
+    stub_server, stub_url = upstream_stub.start_in_background(upstream_stub.stub_config_from_args(args))
+    healthy, ready = [], []
+    try:
+        for run in range(1, args.runs + 1):
+            healthy_after, ready_after, state = measure_startup(args.server_cmd, stub_url, args.timeout)
+            healthy.append(healthy_after)
+            ready.append(ready_after)
+            steps = ", ".join(f"{name} {step['seconds']:.3f}s" for name, step in state.get("steps", {}).items())
+            print(f"przebieg {run}: /health po {healthy_after:.3f} s, gotowość po {ready_after:.3f} s "
+                  f"(import modułu {state.get('import_seconds')} s; {steps})")
+    finally:
+        stub_server.shutdown()
+
+    print(f"mediana: /health po {statistics.median(healthy):.3f} s, gotowość po {statistics.median(ready):.3f} s "
+          f"(opóźnienie API: {args.latency_ms:g} ms)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,327 @@
+"""Lokalny serwer-atrapa API Pipedrive i Jira do testów obciążeniowych.
+
+Obsługuje endpointy używane przez aplikację:
+    Pipedrive: GET /v1/deals/<id>, /v1/deals, /v1/recents, /v1/organizations/<id>, /v1/organizations,
+               /v1/files?deal_id=..., /v1/files/<id>/download
+    Jira:      GET /rest/api/3/issue/createmeta, /rest/api/3/issue/<klucz>, PUT /rest/api/3/issue/<klucz>,
+               POST /rest/api/3/issue, /rest/api/3/issue/bulk, /rest/api/3/issue/<klucz>/attachments
+
+Opóźnienie, odsetek błędów 5xx i odpowiedzi 429 (z Retry-After) są konfigurowalne, więc
+można sprawdzić zachowanie limitera, ponowień i circuit breakera bez dotykania prawdziwych API.
+Statystyki (liczba żądań per endpoint i status) są dostępne pod GET /__stats.
+
+Uruchomienie samodzielne (np. obok serwisu uruchomionego ręcznie):
+    python benchmarks/upstream_stub.py --port 8099 --latency-ms 80 --error-rate 0.01 --rate-limit-rate 0.02
+Serwis należy wtedy uruchomić z PIPEDRIVE_API_URL=http://127.0.0.1:8099/v1
+i JIRA_BASE_URL=http://127.0.0.1:8099.
+"""
+import argparse
+import collections
+import dataclasses
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Hashe pól Pipedrive używane w field_mapping.json.
+SUMMARY_FIELD = "b1d7a6fb7866d3e88f0eb486ae1032012bf8295b"
+PRESENTATION_TYPE_FIELD = "5bc985e61592b58e001c657305423499b6a23ce4"
+DATE_FIELD = "77554ed03246265be68e75bc152243b19d492d9f"
+PARTNER_FIELD = "fea50f9d3ff5801b5fa9c451a8110445442db46d"
+
+CREATEMETA = {
+    "projects": [{
+        "id": "10033",
+        "issuetypes": [{
+            "name": "Task",
+            "fields": {
+                "project": {"name": "Project", "required": True, "allowedValues": [{"id": "10033"}]},
+                "issuetype": {"name": "Issue Type", "required": True},
+                "summary": {"name": "Summary", "required": True},
+                "description": {"name": "Description", "required": False},
+                "reporter": {"name": "Reporter", "required": True, "hasDefaultValue": True},
+                "customfield_10010": {"name": "Request Type", "required": False,
+                                      "allowedValues": [{"id": "1", "value": "YOUR_EXACT_REQUEST_TYPE_NAME_FROM_JIRA_LOGS"}]},
+                "customfield_1008": {"name": "Typ Prezentacji Technicznej", "required": False,
+                                     "allowedValues": [{"id": option_id} for option_id in ("32", "33", "68", "69", "70")]},
+                "customfield_10086": {"name": "Klient", "required": False},
+                "customfield_10089": {"name": "Data 2", "required": False},
+                "customfield_10090": {"name": "Data 1", "required": False},
+                "customfield_10091": {"name": "Data 3", "required": False},
+                "customfield_10092": {"name": "Partner", "required": False},
+            },
+        }],
+    }],
+}
+
+
+@dataclasses.dataclass
+class StubConfig:
+    latency_ms: float = 50.0 # średnie opóźnienie odpowiedzi
+    jitter_ms: float = 20.0 # losowe odchylenie (+/-) opóźnienia
+    error_rate: float = 0.0 # odsetek odpowiedzi 503
+    rate_limit_rate: float = 0.0 # odsetek odpowiedzi 429
+    retry_after_seconds: int = 1
+    files_per_deal: int = 2
+    file_size: int = 256 * 1024
+    total_deals: int = 1000
+    seed: int = 0
+
+
+class StubState:
+    """Licznik żądań i wydanych kluczy zadań, współdzielony przez wątki serwera."""
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.random = random.Random(config.seed)
+        self.counts = collections.Counter()
+        self.issue_counter = 0
+        self.bytes_received = 0
+        self.file_body = b"\0" * config.file_size
+
+    def record(self, endpoint, status):
+        with self.lock:
+            self.counts[f"{endpoint} {status}"] += 1
+
+    def next_issue(self):
+        with self.lock:
+            self.issue_counter += 1
+            return {"id": str(self.issue_counter), "key": f"STUB-{self.issue_counter}"}
+
+    def draw(self):
+        with self.lock:
+            return self.random.random(), self.random.uniform(-1, 1)
+
+    def stats(self):
+        with self.lock:
+            return {"requests": dict(sorted(self.counts.items())), "issues_created": self.issue_counter,
+                    "bytes_received": self.bytes_received}
+
+
+def _deal_record(deal_id):
+    return {
+        "id": deal_id,
+        "org_id": {"value": 1000 + deal_id % 50, "name": f"Organizacja {deal_id % 50}"},
+        "update_time": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+        SUMMARY_FIELD: f"Prezentacja dla klienta {deal_id}",
+        PRESENTATION_TYPE_FIELD: "32,68" if deal_id % 3 == 0 else "33",
+        DATE_FIELD: "2026-01-15",
+    }
+
+
+def _organization_record(org_id):
+    return {"id": org_id, "name": f"Organizacja {org_id % 50}", PARTNER_FIELD: {"name": "Partner", "value": 7}}
+
+
+def _page(items, start, limit, offset=0, total=None):
+    """Strona w formacie API v1. `offset`/`total` pozwalają podać już wycięty fragment kolekcji."""
+    total = len(items) + offset if total is None else total
+    start, items = start + offset, items[start:start + limit]
+    more = start + limit < total
+    return {
+        "data": items,
+        "additional_data": {"pagination": {"start": start, "limit": limit, "more_items_in_collection": more,
+                                           "next_start": start + limit if more else None}},
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None # ustawiane przez make_server
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, endpoint, status, payload=None, body=None, headers=None):
+        body = body if body is not None else json.dumps(payload).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json" if payload is not None else "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.state.record(endpoint, status)
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            size = 0
+            while True:
+                chunk_size = int(self.rfile.readline().strip().split(b";")[0], 16)
+                if chunk_size == 0:
+                    self.rfile.readline()
+                    break
+                size += len(self.rfile.read(chunk_size))
+                self.rfile.readline()
+            return size, None
+        length = int(self.headers.get("Content-Length") or 0)
+        data = self.rfile.read(length)
+        return length, data
+
+    def _inject_faults(self, endpoint, errors=True):
+        """Symuluje opóźnienie i losowe błędy. Zwraca True, jeśli odpowiedź została już wysłana."""
+        config = self.state.config
+        roll, jitter = self.state.draw()
+        delay = max(0.0, config.latency_ms + jitter * config.jitter_ms) / 1000
+        if delay:
+            time.sleep(delay)
+        if not errors:
+            return False
+        if roll < config.rate_limit_rate:
+            self._send(endpoint, 429, {"error": "Rate limit exceeded"}, headers={
+                "Retry-After": str(config.retry_after_seconds), "X-RateLimit-Remaining": "0",
+            })
+            return True
+        if roll < config.rate_limit_rate + config.error_rate:
+            self._send(endpoint, 503, {"error": "Service unavailable (stub)"})
+            return True
+        return False
+
+    def do_GET(self):
+        parsed = urllib.parse.urlparse(self.path)
+        path, query = parsed.path, urllib.parse.parse_qs(parsed.query)
+        start = int(query.get("start", ["0"])[0])
+        limit = int(query.get("limit", ["100"])[0])
+        config = self.state.config
+
+        if path == "/__stats":
+            return self._send("stats", 200, self.state.stats())
+        if path.startswith("/rest/api/3/issue/createmeta"):
+            # Bez losowych błędów, żeby start serwisu był powtarzalny; opóźnienie jak w innych endpointach.
+            self._inject_faults("jira.createmeta", errors=False)
+            return self._send("jira.createmeta", 200, CREATEMETA)
+
+        if match := re.fullmatch(r"/v1/deals/(\d+)", path):
+            endpoint = "pipedrive.deal"
+            if not self._inject_faults(endpoint):
+                self._send(endpoint, 200, {"success": True, "data": _deal_record(int(match[1]))})
+        elif path == "/v1/deals":
+            endpoint = "pipedrive.deals"
+            if not self._inject_faults(endpoint):
+                deals = [_deal_record(deal_id) for deal_id in range(start + 1, min(config.total_deals, start + limit) + 1)]
+                self._send(endpoint, 200, {"success": True, **_page(deals, 0, limit, start, config.total_deals)})
+        elif path == "/v1/recents":
+            endpoint = "pipedrive.recents"
+            if not self._inject_faults(endpoint):
+                deals = [{"item": "deal", "id": deal_id, "data": _deal_record(deal_id)}
+                         for deal_id in range(start + 1, min(config.total_deals, start + limit) + 1)]
+                self._send(endpoint, 200, {"success": True, **_page(deals, 0, limit, start, config.total_deals)})
+        elif match := re.fullmatch(r"/v1/organizations/(\d+)", path):
+            endpoint = "pipedrive.organization"
+            if not self._inject_faults(endpoint):
+                self._send(endpoint, 200, {"success": True, "data": _organization_record(int(match[1]))})
+        elif path == "/v1/organizations":
+            endpoint = "pipedrive.organizations"
+            if not self._inject_faults(endpoint):
+                self._send(endpoint, 200, {"success": True, **_page([_organization_record(1000 + i) for i in range(50)], start, limit)})
+        elif path == "/v1/files":
+            endpoint = "pipedrive.files"
+            if not self._inject_faults(endpoint):
+                deal_id = int(query.get("deal_id", ["0"])[0])
+                files = [{"id": deal_id * 100 + i, "file_name": f"deal-{deal_id}-{i}.pdf", "file_size": config.file_size,
+                          "deal_id": deal_id} for i in range(config.files_per_deal)]
+                self._send(endpoint, 200, {"success": True, "data": files})
+        elif re.fullmatch(r"/v1/files/(\d+)/download", path):
+            endpoint = "pipedrive.file_download"
+            if not self._inject_faults(endpoint):
+                self._send(endpoint, 200, body=self.state.file_body)
+        elif match := re.fullmatch(r"/rest/api/3/issue/([^/]+)", path):
+            endpoint = "jira.issue_get"
+            if not self._inject_faults(endpoint):
+                self._send(endpoint, 200, {"key": match[1], "fields": {"attachment": []}})
+        else:
+            self._send("unknown", 404, {"error": f"Unknown path {path}"})
+
+    def do_HEAD(self):
+        # Serwis wysyła HEAD na bazowe URL-e przy starcie, żeby otworzyć połączenia keep-alive.
+        self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+        self.state.record("head", 404)
+
+    def do_PUT(self):
+        self._read_body()
+        path = urllib.parse.urlparse(self.path).path
+        if re.fullmatch(r"/rest/api/3/issue/[^/]+", path):
+            endpoint = "jira.issue_update"
+            if not self._inject_faults(endpoint):
+                self._send(endpoint, 204, body=b"")
+        else:
+            self._send("unknown", 404, {"error": f"Unknown path {path}"})
+
+    def do_POST(self):
+        size, data = self._read_body()
+        with self.state.lock:
+            self.state.bytes_received += size
+        path = urllib.parse.urlparse(self.path).path
+
+        if path == "/rest/api/3/issue":
+            endpoint = "jira.issue_create"
+            if not self._inject_faults(endpoint):
+                self._send(endpoint, 201, self.state.next_issue())
+        elif path == "/rest/api/3/issue/bulk":
+            endpoint = "jira.issue_bulk"
+            if not self._inject_faults(endpoint):
+                updates = json.loads(data or b"{}").get("issueUpdates", [])
+                self._send(endpoint, 201, {"issues": [self.state.next_issue() for _ in updates], "errors": []})
+        elif re.fullmatch(r"/rest/api/3/issue/[^/]+/attachments", path):
+            endpoint = "jira.attachment_upload"
+            if not self._inject_faults(endpoint):
+                self._send(endpoint, 200, [{"id": "1", "size": size}])
+        else:
+            self._send("unknown", 404, {"error": f"Unknown path {path}"})
+
+
+def make_server(config, host="127.0.0.1", port=0):
+    """Tworzy serwer-atrapę (jeszcze nieuruchomiony). Port 0 = losowy wolny port."""
+    handler = type("BoundStubHandler", (StubHandler,), {"state": StubState(config)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_background(config, host="127.0.0.1", port=0):
+    """Uruchamia serwer-atrapę w wątku demona i zwraca (serwer, bazowy URL)."""
+    server = make_server(config, host, port)
+    threading.Thread(target=server.serve_forever, name="upstream-stub", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def add_stub_arguments(parser):
+    defaults = StubConfig()
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms, help="Średnie opóźnienie odpowiedzi API.")
+    parser.add_argument("--jitter-ms", type=float, default=defaults.jitter_ms, help="Losowe odchylenie opóźnienia (+/-).")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate, help="Odsetek odpowiedzi 503 (0-1).")
+    parser.add_argument("--rate-limit-rate", type=float, default=defaults.rate_limit_rate, help="Odsetek odpowiedzi 429 (0-1).")
+    parser.add_argument("--retry-after", type=int, default=defaults.retry_after_seconds, help="Wartość nagłówka Retry-After (s).")
+    parser.add_argument("--files-per-deal", type=int, default=defaults.files_per_deal)
+    parser.add_argument("--file-size", type=int, default=defaults.file_size, help="Rozmiar załącznika w bajtach.")
+
+
+def stub_config_from_args(args):
+    return StubConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                      rate_limit_rate=args.rate_limit_rate, retry_after_seconds=args.retry_after,
+                      files_per_deal=args.files_per_deal, file_size=args.file_size)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    add_stub_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = make_server(stub_config_from_args(args), args.host, args.port)
+    print(f"Atrapa API nasłuchuje na http://{args.host}:{server.server_address[1]} (Ctrl+C kończy).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""Test obciążeniowy /webhook: odtwarza payloady webhooków z zadaną częstotliwością.
+
+Domyślnie uruchamia atrapę API Pipedrive/Jira (upstream_stub.py) i serwis pod gunicornem
+skierowany na tę atrapę, po czym raportuje opóźnienia p50/p95/p99 odpowiedzi /webhook,
+przepustowość, czas opróżnienia kolejki zadań i szczytowe RSS drzewa procesów serwisu.
+
+Przykłady (z katalogu głównego repozytorium):
+    python benchmarks/webhook_load.py --rate 50 --duration 30
+    python benchmarks/webhook_load.py --payloads captured_webhooks.jsonl --rate 200 --loop \\
+        --server-cmd "gunicorn --bind 127.0.0.1:{port} --workers 4 --worker-class gthread --threads 8 app:app"
+    python benchmarks/webhook_load.py --target http://127.0.0.1:5000 --pid 12345 --rate 20
+
+Plik --payloads zawiera po jednym obiekcie JSON (payload webhooka) w linii. Przy --loop
+kolejne przebiegi przesuwają deal_id, żeby ominąć deduplikację powtórzonych dostarczeń.
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import shlex
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+import requests.adapters
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import upstream_stub  # noqa: E402
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SERVER_CMD = "gunicorn --bind 127.0.0.1:{port} --workers 2 app:app"
+LOOP_DEAL_ID_OFFSET = 1_000_000
+
+
+# --- PAYLOADY ---
+def load_payloads(path, count):
+    """Wczytuje przechwycone payloady (JSON Lines) albo generuje `count` syntetycznych."""
+    if not path:
+        return [{"deal_id": deal_id, "org_id": 1000 + deal_id % 50} for deal_id in range(1, count + 1)]
+    with open(path, encoding="utf-8") as payload_file:
+        return [json.loads(line) for line in payload_file if line.strip()]
+
+
+def iter_payloads(payloads, loop):
+    """Zwraca payloady po kolei; przy `loop` w nieskończoność, z deal_id przesuniętym o numer przebiegu."""
+    round_number = 0
+    while True:
+        for payload in payloads:
+            if round_number and isinstance(payload.get("deal_id"), int):
+                payload = {**payload, "deal_id": payload["deal_id"] + round_number * LOOP_DEAL_ID_OFFSET}
+            yield payload
+        if not loop:
+            return
+        round_number += 1
+
+
+# --- POMIAR PAMIĘCI ---
+def _read_rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _children_of(pid):
+    """PID-y potomków procesu (rekurencyjnie), na podstawie /proc/<pid>/task/*/children."""
+    children = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children", encoding="ascii") as children_file:
+                children.extend(int(child) for child in children_file.read().split())
+    except OSError:
+        return []
+    return children + [grandchild for child in children for grandchild in _children_of(child)]
+
+
+class RssSampler(threading.Thread):
+    """Próbkuje sumaryczne RSS procesu i jego potomków (np. master + workery gunicorna)."""
+
+    def __init__(self, pid, interval=0.2):
+        super().__init__(name="rss-sampler", daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb = 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            total = sum(_read_rss_kb(pid) for pid in [self.pid, *_children_of(self.pid)])
+            self.peak_kb = max(self.peak_kb, total)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+# --- SERWIS POD TESTEM ---
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_service(server_cmd, stub_url, workdir):
+    """Uruchamia serwis skierowany na atrapę API. Zwraca (proces, bazowy URL)."""
+    port = _free_port()
+    env = {
+        **os.environ,
+        "PIPEDRIVE_API_TOKEN": "benchmark-token",
+        "JIRA_API_TOKEN": "benchmark-token",
+        "JIRA_EMAIL": "benchmark@example.com",
+        "JIRA_DOMAIN": "jira.invalid",
+        "PIPEDRIVE_API_URL": f"{stub_url}/v1",
+        "JIRA_BASE_URL": stub_url,
+        "JOB_QUEUE_DB_PATH": os.path.join(workdir, "job_queue.sqlite3"),
+        "JIRA_CREATEMETA_CACHE_PATH": os.path.join(workdir, "jira_createmeta_cache.json"),
+        "METRICS_DIR": os.path.join(workdir, "metrics"),
+        "ATTACHMENT_CACHE_DIR": os.path.join(workdir, "attachment_cache"),
+    }
+    env.setdefault("LOG_LEVEL", "WARNING")
+    process = subprocess.Popen(shlex.split(server_cmd.format(port=port)), cwd=REPO_ROOT, env=env)
+    return process, f"http://127.0.0.1:{port}"
+
+
+def wait_until_healthy(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Serwis {base_url} nie odpowiedział na /health w ciągu {timeout}s.")
+
+
+def wait_for_queue_drain(base_url, timeout):
+    """Czeka, aż kolejka zadań będzie pusta. Zwraca ostatni stan /queue (albo None po timeoucie)."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        queue_state = requests.get(f"{base_url}/queue", timeout=5).json()
+        if not queue_state.get("depth"):
+            return queue_state
+        time.sleep(0.25)
+    return None
+
+
+# --- GENERATOR OBCIĄŻENIA ---
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def replay(base_url, payloads, rate, duration, max_requests, concurrency):
+    """Wysyła payloady w otwartej pętli ze stałą częstotliwością `rate` żądań/s.
+
+    Opóźnienie liczone jest od zaplanowanego momentu wysłania, a nie od faktycznego, więc
+    przeciążony serwis (lub wyczerpana pula wątków klienta) nie zaniża wyników
+    (coordinated omission).
+    """
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=concurrency))
+    latencies, statuses, lock = [], {}, threading.Lock()
+
+    def send(payload, scheduled_at):
+        try:
+            status = session.post(f"{base_url}/webhook", json=payload, timeout=30).status_code
+        except requests.exceptions.RequestException as e:
+            status = type(e).__name__
+        elapsed = time.monotonic() - scheduled_at
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started_at = time.monotonic()
+    sent = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for payload in payloads:
+            scheduled_at = started_at + sent / rate
+            if (duration and scheduled_at - started_at >= duration) or (max_requests and sent >= max_requests):
+                break
+            delay = scheduled_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send, payload, scheduled_at)
+            sent += 1
+    return sorted(latencies), statuses, time.monotonic() - started_at
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--payloads", help="Plik JSON Lines z przechwyconymi payloadami webhooków.")
+    parser.add_argument("--loop", action="store_true", help="Odtwarzaj payloady w kółko (do --duration/--requests).")
+    parser.add_argument("--rate", type=float, default=20.0, help="Docelowa liczba żądań na sekundę.")
+    parser.add_argument("--duration", type=float, default=0, help="Czas trwania testu w sekundach (0 = bez limitu).")
+    parser.add_argument("--requests", type=int, default=0, help="Maksymalna liczba żądań (0 = bez limitu).")
+    parser.add_argument("--concurrency", type=int, default=64, help="Maksymalna liczba równoczesnych żądań klienta.")
+    parser.add_argument("--drain-timeout", type=float, default=300, help="Ile czekać na opróżnienie kolejki zadań (0 = nie czekaj).")
+    parser.add_argument("--target", help="URL już działającego serwisu (zamiast uruchamiania własnego).")
+    parser.add_argument("--pid", type=int, help="PID serwisu z --target (do pomiaru RSS).")
+    parser.add_argument("--server-cmd", default=DEFAULT_SERVER_CMD,
+                        help="Polecenie uruchamiające serwis; {port} zostanie podstawiony (domyślnie: %(default)s).")
+    parser.add_argument("--json-out", help="Zapisz wyniki również do pliku JSON.")
+    upstream_stub.add_stub_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if not args.duration and not args.requests and args.loop:
+        parser.error("--loop wymaga --duration albo --requests.")
+    payloads = load_payloads(args.payloads, args.requests or max(1, int(args.rate * (args.duration or 10))))
+
+    stub_server = process = workdir = None
+    try:
+        if args.target:
+            base_url, service_pid = args.target.rstrip("/"), args.pid
+        else:
+            stub_server, stub_url = upstream_stub.start_in_background(upstream_stub.stub_config_from_args(args))
+            workdir = tempfile.mkdtemp(prefix="webhook-load-")
+            process, base_url = start_service(args.server_cmd, stub_url, workdir)
+            service_pid = process.pid
+        wait_until_healthy(base_url)
+
+        sampler = RssSampler(service_pid) if service_pid else None
+        if sampler:
+            sampler.start()
+        latencies, statuses, send_elapsed = replay(base_url, iter_payloads(payloads, args.loop), args.rate,
+                                                   args.duration, args.requests, args.concurrency)
+        drain_elapsed = None
+        if args.drain_timeout:
+            drain_started = time.monotonic()
+            if wait_for_queue_drain(base_url, args.drain_timeout) is not None:
+                drain_elapsed = time.monotonic() - drain_started
+        if sampler:
+            sampler.stop()
+
+        total = len(latencies)
+        results = {
+            "requests": total,
+            "statuses": {str(status): count for status, count in statuses.items()},
+            "target_rate": args.rate,
+            "achieved_rate": total / send_elapsed if send_elapsed else 0.0,
+            "latency_ms": {name: percentile(latencies, fraction) * 1000
+                           for name, fraction in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))},
+            "queue_drain_seconds": drain_elapsed,
+            "end_to_end_jobs_per_second": total / (send_elapsed + drain_elapsed) if drain_elapsed is not None else None,
+            "peak_rss_mb": sampler.peak_kb / 1024 if sampler else None,
+        }
+        if stub_server:
+            results["upstream"] = stub_server.RequestHandlerClass.state.stats()
+    finally:
+        if process:
+            process.terminate()
+            process.wait(timeout=30)
+        if stub_server:
+            stub_server.shutdown()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    latency = results["latency_ms"]
+    print(f"żądania: {results['requests']} ({', '.join(f'{s}: {c}' for s, c in sorted(results['statuses'].items()))})")
+    print(f"przepustowość /webhook: {results['achieved_rate']:.1f} żądań/s (cel: {args.rate:g})")
+    print(f"opóźnienie /webhook: p50 {latency['p50']:.1f} ms, p95 {latency['p95']:.1f} ms, "
+          f"p99 {latency['p99']:.1f} ms, max {latency['max']:.1f} ms")
+    if drain_elapsed is not None:
+        print(f"opróżnienie kolejki: {drain_elapsed:.1f} s -> {results['end_to_end_jobs_per_second']:.1f} zadań/s end-to-end")
+    elif args.drain_timeout:
+        print(f"kolejka nie opróżniła się w ciągu {args.drain_timeout:g} s")
+    if results["peak_rss_mb"] is not None:
+        print(f"szczytowe RSS serwisu: {results['peak_rss_mb']:.1f} MB")
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as json_file:
+            json.dump(results, json_file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
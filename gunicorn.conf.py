@@ -0,0 +1,65 @@
+"""Konfiguracja Gunicorna (wczytywana automatycznie z katalogu roboczego).
+
+Domyślnie używane są workery sync (jedno żądanie na proces), jak przed dodaniem tego
+pliku. Tryby o wyższej współbieżności są opcjonalne i włączane przez GUNICORN_WORKER_CLASS:
+
+    gthread  wątki w procesie workera (GUNICORN_THREADS); bez dodatkowych zależności.
+    gevent   każde żądanie i zadanie kolejki działa w greenlecie, a oczekiwanie na
+             Pipedrive/Jira nie blokuje procesu (do GUNICORN_WORKER_CONNECTIONS połączeń
+             na worker). Kolejka opróżnia się szybciej, ale greenlety zadań konkurują
+             o CPU z obsługą /webhook: w benchmarks/webhook_load.py na jednym rdzeniu
+             p99 /webhook wzrosło z ok. 30 ms do ok. 425 ms. Moduł sqlite3 nie jest
+             patchowany przez gevent, więc czekanie na blokadę bazy kolejki (timeout=30,
+             np. gdy sync.py lub backfill.py trzymają zapis) blokuje wszystkie greenlety
+             workera, łącznie z /health. Włączać świadomie, przy wielu procesach workerów.
+
+Zmienne środowiskowe:
+    WEB_CONCURRENCY              liczba procesów workerów (domyślnie 1; dzieli też limity API w app.py)
+    GUNICORN_WORKER_CLASS        sync | gthread | gevent (domyślnie sync)
+    GUNICORN_WORKER_CONNECTIONS  maks. równoczesnych połączeń na worker gevent (domyślnie 500)
+    GUNICORN_THREADS             liczba wątków na worker gthread (domyślnie 32; ignorowane dla sync)
+    GUNICORN_TIMEOUT             limit czasu workera w sekundach (domyślnie 60)
+"""
+import importlib.util
+import logging
+import os
+import sys
+
+workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "sync")
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "500"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = timeout
+keepalive = 5
+# Aplikacja nie może być ładowana w masterze: gevent musi spatchować moduły przed jej importem.
+preload_app = False
+
+if worker_class == "gevent" and importlib.util.find_spec("gevent") is None:
+    logging.getLogger("gunicorn.error").warning("Pakiet gevent nie jest zainstalowany; używam workerów gthread.")
+    worker_class = "gthread"
+# Gunicorn sam zamienia worker sync na gthread, gdy threads > 1, więc wątki ustawiamy tylko dla gthread.
+threads = int(os.getenv("GUNICORN_THREADS", "32")) if worker_class == "gthread" else 1
+
+
+def post_worker_init(worker):
+    """Rozgrzewanie (połączenia, createmeta) startuje w tle zaraz po załadowaniu aplikacji w workerze."""
+    app_module = sys.modules.get("app")
+    if app_module is not None and hasattr(app_module, "start_startup_warmup"):
+        app_module.start_startup_warmup()
+
+
+def child_exit(server, worker):
+    """Usuwa migawkę metryk zakończonego workera (METRICS_DIR), żeby /metrics jej nie sumowało.
+
+    Hook działa w masterze, który nie importuje app.py (preload_app = False), stąd nazwa pliku
+    powtórzona za app._metrics_snapshot_path.
+    """
+    metrics_dir = os.getenv("METRICS_DIR")
+    if not metrics_dir:
+        return
+    try:
+        os.remove(os.path.join(metrics_dir, f"metrics-{worker.pid}.json"))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        server.log.warning("Nie udało się usunąć migawki metryk workera %s: %s", worker.pid, e)
@@ -0,0 +1,174 @@
+"""Przyrostowa synchronizacja deali zmienionych w Pipedrive od ostatniego uruchomienia.
+
+Uzupełnia webhook: deal, którego dostarczenie się zgubiło, trafi do Jira przy
+najbliższej synchronizacji. Zmiany pobierane są stronami z /recents (items=deal)
+od zapisanego kursora (update_time Pipedrive, UTC), więc koszt zależy od liczby
+zmian, a nie od liczby wszystkich deali. Kursor jest przechowywany w bazie kolejki
+(JOB_QUEUE_DB_PATH) i przetrwa restart.
+
+Dla każdego zmienionego deala tworzone jest zadanie Jira (jak w create_jira_issue)
+albo aktualizowane istniejące, po czym uzupełniane są brakujące załączniki. Deale
+już zsynchronizowane w tej samej wersji (update_time) są pomijane. Deal z trwałym
+błędem (4xx, walidacja, brak organizacji) albo po SYNC_MAX_ATTEMPTS nieudanych przejściach trafia do
+tabeli sync_failures i nie wstrzymuje kursora; wróci przy kolejnej zmianie w Pipedrive.
+
+Przykłady:
+    python sync.py                          # jedno przejście od zapisanego kursora
+    python sync.py --since "2026-01-01 00:00:00"
+    python sync.py --loop --interval 300    # tryb cykliczny (np. osobny proces "worker")
+"""
+import argparse
+import collections
+import logging
+import os
+import time
+
+import app
+from backfill import fetch_organizations, org_id_of
+
+SYNC_CURSOR_NAME = "pipedrive_deals_recents"
+SYNC_INTERVAL_SECONDS = float(os.getenv("SYNC_INTERVAL_SECONDS", "300"))
+# Przy pierwszym uruchomieniu (bez kursora) synchronizowane są zmiany z tego okresu.
+SYNC_INITIAL_LOOKBACK_SECONDS = int(os.getenv("SYNC_INITIAL_LOOKBACK_SECONDS", str(24 * 3600)))
+# Ile przejść z rzędu przejściowy błąd deala wstrzymuje kursor, zanim deal zostanie pominięty.
+SYNC_MAX_ATTEMPTS = int(os.getenv("SYNC_MAX_ATTEMPTS", "3"))
+
+
+def pipedrive_timestamp(epoch_seconds):
+    """Znacznik czasu w formacie Pipedrive API v1 (UTC, 'YYYY-MM-DD HH:MM:SS')."""
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(epoch_seconds))
+
+
+def iter_changed_deal_pages(since):
+    """Zwraca kolejne strony deali zmienionych od `since` (z /recents)."""
+    start = 0
+    while start is not None:
+        items, start = app.get_pipedrive_page("/recents", {"since_timestamp": since, "items": "deal"}, start)
+        yield [item["data"] for item in items if item.get("item") == "deal" and item.get("data")]
+
+
+class MissingOrganizationError(ValueError):
+    """Organizacja deala nie istnieje lub została usunięta w Pipedrive (błąd trwały, bez ponawiania)."""
+
+
+def sync_deal(deal_data, org_data, linked_issue, skip_attachments=False):
+    """Tworzy lub aktualizuje zadanie Jira dla deala. Zwraca 'created' albo 'updated'."""
+    deal_id = deal_data.get("id")
+    org_id = org_id_of(deal_data)
+    # Deal bez organizacji nie da się zmapować; kolejne przejścia nic tu nie zmienią, więc deal
+    # trafia do sync_failures jako trwały błąd i wróci dopiero przy kolejnej zmianie w Pipedrive.
+    if not org_data or org_data.get("active_flag") is False:
+        raise MissingOrganizationError(f"Organization {org_id} of deal {deal_id} is missing or deleted in Pipedrive.")
+
+    fields = app.build_jira_fields(deal_id, deal_data, org_data)
+    # Rezerwacja chroni przed równoległym utworzeniem zadania przez webhook (DealClaimedError jest ponawiany).
+    linked_issue = linked_issue or app.claim_deal_for_create(deal_id)
+    if linked_issue:
+        app.update_jira_issue(linked_issue["key"], fields)
+        issue_key, issue_id, action = linked_issue["key"], linked_issue["id"], "updated"
+    else:
+        try:
+            created = app.create_jira_issue(fields)
+        except Exception:
+            app.release_deal_claim(deal_id)
+            raise
+        issue_key, issue_id, action = created["key"], created.get("id"), "created"
+        # Ten sam kształt co payload webhooka, więc ponowne dostarczenie nie utworzy duplikatu.
+        app.record_jira_issue({"deal_id": deal_id, "org_id": org_id}, issue_key, issue_id)
+
+    if not skip_attachments:
+        app.transfer_attachments_to_jira(deal_id, issue_key, check_existing=action == "updated")
+    app.record_deal_sync(deal_id, issue_key, issue_id, deal_data.get("update_time"))
+    return action
+
+
+def run_sync(since=None, skip_attachments=False):
+    """Jedno przejście synchronizacji od kursora. Zwraca podsumowanie (nowy kursor, liczniki, błędy)."""
+    app.init_job_queue() # tabele deal_issues i sync_state
+    cursor = since or app.get_sync_cursor(SYNC_CURSOR_NAME) or pipedrive_timestamp(time.time() - SYNC_INITIAL_LOOKBACK_SECONDS)
+    logging.info("Synchronizacja deali zmienionych od %s.", cursor)
+    started_at = time.monotonic()
+    counts = collections.Counter()
+    failed = {}
+    newest_seen, oldest_failed = cursor, None
+
+    for deals in iter_changed_deal_pages(cursor):
+        pending = []
+        for deal_data in deals:
+            update_time = deal_data.get("update_time") or cursor
+            linked_issue = app.get_deal_jira_issue(deal_data.get("id"))
+            sync_failure = app.get_sync_failure(deal_data.get("id"))
+            if deal_data.get("deleted") or deal_data.get("status") == "deleted":
+                counts["deleted"] += 1
+            elif linked_issue and linked_issue["deal_update_time"] == deal_data.get("update_time"):
+                counts["unchanged"] += 1
+            elif (sync_failure and sync_failure["deal_update_time"] == deal_data.get("update_time")
+                  and (sync_failure["permanent"] or sync_failure["attempts"] >= SYNC_MAX_ATTEMPTS)):
+                counts["skipped"] += 1
+            else:
+                pending.append((deal_data, linked_issue))
+                continue
+            newest_seen = max(newest_seen, update_time)
+
+        organizations = fetch_organizations(org_id_of(deal_data) for deal_data, _ in pending)
+        for deal_data, linked_issue in pending:
+            deal_id = deal_data.get("id")
+            update_time = deal_data.get("update_time") or cursor
+            try:
+                action = sync_deal(deal_data, organizations.get(str(org_id_of(deal_data))), linked_issue, skip_attachments)
+            except Exception as e:
+                failed[str(deal_id)] = str(e)
+                permanent = not app.is_retryable_job_error(e)
+                attempts = app.record_sync_failure(deal_id, deal_data.get("update_time"), str(e), permanent)
+                retry = not permanent and attempts < SYNC_MAX_ATTEMPTS
+                logging.error("Nie udało się zsynchronizować deala %s (próba %s/%s): %s. %s", deal_id, attempts,
+                              SYNC_MAX_ATTEMPTS, e, "Zostanie ponowiony." if retry else "Pomijanie do kolejnej zmiany deala.",
+                              exc_info=True)
+                if retry:
+                    oldest_failed = min(oldest_failed or update_time, update_time)
+                else:
+                    counts["skipped"] += 1
+                    newest_seen = max(newest_seen, update_time)
+                continue
+            app.clear_sync_failure(deal_id)
+            counts[action] += 1
+            newest_seen = max(newest_seen, update_time)
+
+    # Kursor nie przesuwa się za deal z przejściowym błędem, żeby kolejne przejście go ponowiło;
+    # deale już zsynchronizowane w tej wersji zostaną wtedy pominięte jako 'unchanged'. Trwałe błędy
+    # (4xx, walidacja) i deale po SYNC_MAX_ATTEMPTS próbach zostają w tabeli sync_failures, a kursor
+    # idzie dalej; deal wróci do synchronizacji przy kolejnej zmianie w Pipedrive.
+    new_cursor = oldest_failed or newest_seen
+    app.save_sync_cursor(SYNC_CURSOR_NAME, new_cursor)
+    logging.info("Synchronizacja zakończona w %.1fs: %s, błędy: %s. Nowy kursor: %s.",
+                 time.monotonic() - started_at, dict(counts), len(failed), new_cursor)
+    return {"cursor": new_cursor, "counts": dict(counts), "failed": failed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Przyrostowa synchronizacja deali z Pipedrive do Jira.")
+    parser.add_argument("--since", help="Znacznik czasu Pipedrive (UTC, 'YYYY-MM-DD HH:MM:SS') zamiast zapisanego kursora.")
+    parser.add_argument("--loop", action="store_true", help="Synchronizuj cyklicznie co --interval sekund.")
+    parser.add_argument("--interval", type=float, default=SYNC_INTERVAL_SECONDS,
+                        help="Odstęp między przejściami w trybie --loop (domyślnie: %(default)s s).")
+    parser.add_argument("--skip-attachments", action="store_true", help="Nie przesyłaj załączników.")
+    args = parser.parse_args(argv)
+
+    if not args.loop:
+        summary = run_sync(args.since, args.skip_attachments)
+        for deal_id, error in summary["failed"].items():
+            logging.error("Deal %s: %s", deal_id, error)
+        return 1 if summary["failed"] else 0
+
+    since = args.since
+    while True:
+        try:
+            run_sync(since, args.skip_attachments)
+            since = None # kolejne przejścia startują od zapisanego kursora
+        except Exception as e:
+            logging.error("Przejście synchronizacji nie powiodło się: %s", e, exc_info=True)
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
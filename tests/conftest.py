@@ -0,0 +1,31 @@
+"""Wspólna konfiguracja testów: app.py jest importowany z atrapami danych dostępowych i bez sieci."""
+import os
+import sys
+import tempfile
+
+import pytest
+
+_TEST_DIR = tempfile.mkdtemp(prefix="pipedrive-jira-tests-")
+os.environ.update({
+    "PIPEDRIVE_API_TOKEN": "test-pipedrive-token",
+    "JIRA_API_TOKEN": "test-jira-token",
+    "JIRA_EMAIL": "tests@example.com",
+    "JIRA_DOMAIN": "jira.invalid",
+    "PIPEDRIVE_API_URL": "http://pipedrive.invalid/v1",
+    "JOB_QUEUE_DB_PATH": os.path.join(_TEST_DIR, "job_queue.sqlite3"),
+    "JIRA_CREATEMETA_CACHE_PATH": os.path.join(_TEST_DIR, "jira_createmeta_cache.json"),
+    "ATTACHMENT_CACHE_DIR": "",
+    "STARTUP_WARMUP_ENABLED": "0",
+    "LOG_LEVEL": "WARNING",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+@pytest.fixture
+def job_db(tmp_path, monkeypatch):
+    """Pusta baza kolejki zadań (z tabelami idempotencji i synchronizacji) w katalogu tymczasowym."""
+    monkeypatch.setattr(app, "JOB_QUEUE_DB_PATH", str(tmp_path / "job_queue.sqlite3"))
+    app.init_job_queue()
+    return app.JOB_QUEUE_DB_PATH
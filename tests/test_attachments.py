@@ -0,0 +1,136 @@
+import io
+import logging
+
+import pytest
+import requests
+
+import app
+
+
+class BrokenStream(io.RawIOBase):
+    """Strumień, który po kilku bajtach zrywa połączenie (jak urllib3 przy niepełnej odpowiedzi chunked)."""
+
+    def __init__(self, data):
+        self._data = data
+        self._sent = False
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if self._sent:
+            raise requests.exceptions.ChunkedEncodingError("Connection broken: IncompleteRead")
+        self._sent = True
+        return self._data
+
+
+def make_response(status_code, raw, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    response.raw = raw
+    response.url = "http://pipedrive.invalid/v1/files/1/download"
+    return response
+
+
+def test_download_broken_stream_logs_status_not_body(monkeypatch, caplog):
+    monkeypatch.setattr(app, "pipedrive_request", lambda *args, **kwargs: make_response(200, BrokenStream(b"partial")))
+
+    with caplog.at_level(logging.ERROR):
+        assert app.download_file_content_from_pipedrive(1) is None
+
+    assert "status 200" in caplog.text
+    assert "partial" not in caplog.text
+
+
+def test_download_http_error_logs_response_body(monkeypatch, caplog):
+    monkeypatch.setattr(app, "pipedrive_request", lambda *args, **kwargs: make_response(404, io.BytesIO(b'{"error": "not found"}')))
+
+    with caplog.at_level(logging.ERROR):
+        assert app.download_file_content_from_pipedrive(1) is None
+
+    assert '{"error": "not found"}' in caplog.text
+
+
+@pytest.fixture
+def upload_statuses(job_db, monkeypatch):
+    """Atrapy pobierania z Pipedrive i uploadu do Jira; upload zwraca kolejno zaplanowane statusy."""
+    planned, downloads = [], []
+
+    def download(file_id, file_size=None, update_time=None):
+        downloads.append(file_id)
+        return app.AttachmentContent.from_bytes(b"file content")
+
+    monkeypatch.setattr(app, "download_file_content_from_pipedrive", download)
+    monkeypatch.setattr(app, "upload_attachment_to_jira", lambda key, name, content: planned.pop(0))
+    return planned, downloads
+
+
+def transfer():
+    return app.transfer_attachment_to_jira("PROJ-1", {"id": 5, "file_name": "offer.pdf", "file_size": 12})
+
+
+def test_transfer_does_not_retry_upload_rejected_by_jira(upload_statuses):
+    planned, downloads = upload_statuses
+    planned.extend([413, 200])
+
+    result = transfer()
+
+    assert result["status"] == "failed"
+    assert result["retryable"] is False
+    assert planned == [200]
+    assert downloads == [5]
+    app.raise_for_failed_attachments("PROJ-1", [result])
+
+
+def test_transfer_retries_connection_errors_and_retryable_statuses(upload_statuses):
+    planned, downloads = upload_statuses
+    planned.extend([None, 503, 200])
+
+    result = transfer()
+
+    assert result["status"] == "uploaded"
+    assert planned == []
+    assert downloads == [5]
+    assert app.is_attachment_transferred("PROJ-1", 5)
+
+
+def test_transfer_reports_retryable_failure_after_last_attempt(upload_statuses, monkeypatch):
+    monkeypatch.setattr(app, "ATTACHMENT_UPLOAD_ATTEMPTS", 2)
+    planned, _ = upload_statuses
+    planned.extend([502, 502])
+
+    result = transfer()
+
+    assert result["status"] == "failed"
+    with pytest.raises(app.AttachmentTransferError):
+        app.raise_for_failed_attachments("PROJ-1", [result])
+
+
+def test_multipart_body_length_matches_streamed_bytes():
+    content = app.AttachmentContent.from_bytes(b"x" * 1000)
+    body = app.MultipartFileBody("file", 'oferta "Q1"\n.pdf', content)
+
+    data = b"".join(body)
+
+    assert len(body) == len(data)
+    assert body.content_type == f"multipart/form-data; boundary={body.boundary}"
+    assert b'filename="oferta %22Q1%22%0A.pdf"' in data
+    assert data.endswith(f"\r\n--{body.boundary}--\r\n".encode())
+
+
+def test_multipart_body_with_spooled_content_can_be_sent_again():
+    body = app.MultipartFileBody("file", "offer.pdf", app.AttachmentContent.from_bytes(b"file content"))
+    first = b"".join(body)
+
+    assert body.rewind()
+    assert b"".join(body) == first
+
+
+def test_multipart_body_with_started_response_stream_cannot_be_rewound():
+    response = make_response(200, io.BytesIO(b"file content"), {"Content-Length": "12"})
+    body = app.MultipartFileBody("file", "offer.pdf", app.AttachmentContent.from_response(response))
+
+    assert body.rewind()
+    assert b"file content" in b"".join(body)
+    assert not body.rewind()
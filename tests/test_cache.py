@@ -0,0 +1,34 @@
+import app
+
+
+def test_local_hit_does_not_read_shared_backend(tmp_path, monkeypatch):
+    cache = app.TTLCache(10, str(tmp_path / "cache.sqlite3"), local_ttl=30)
+    cache.set("organization", 7, {"name": "Acme"}, ttl=900)
+    connections = []
+    monkeypatch.setattr(cache, "_shared_connection", lambda: connections.append(1))
+
+    assert cache.get("organization", 7) == {"name": "Acme"}
+    assert connections == []
+
+
+def test_invalidation_reaches_other_worker_after_local_ttl(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.sqlite3")
+    worker_a = app.TTLCache(10, path, local_ttl=30)
+    worker_b = app.TTLCache(10, path, local_ttl=30)
+    worker_a.set("organization", 7, {"name": "Acme"}, ttl=900)
+    assert worker_b.get("organization", 7) == {"name": "Acme"}
+
+    worker_a.invalidate("organization", 7)
+    assert worker_b.get("organization", 7) == {"name": "Acme"}
+
+    now = app.time.time()
+    monkeypatch.setattr(app.time, "time", lambda: now + 31)
+    assert worker_b.get("organization", 7) is None
+    assert worker_b.stats()["namespaces"]["organization"]["misses"] == 1
+
+
+def test_expired_entry_is_a_miss():
+    cache = app.TTLCache(10)
+    cache.set("organization", 7, {"name": "Acme"}, ttl=-1)
+
+    assert cache.get("organization", 7) is None
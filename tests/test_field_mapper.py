@@ -0,0 +1,48 @@
+import app
+
+SPEC = {
+    "fields": [
+        {"target": "summary", "source": "deal.title", "default": "Brak tytułu"},
+        {"target": "description", "template": "Organizacja: {org.name|brak}\nDeal ID: {deal_id}"},
+        {"target": "customfield_1", "source": "deal.types", "convert": "options",
+         "options": {"32": {"id": "32"}, "33": {"id": "33"}}},
+        {"target": "customfield_2", "source": "org.partner", "convert": "name_or_text"},
+        {"target": "customfield_3", "source": "deal.nested.value"},
+    ]
+}
+
+
+def test_apply_maps_sources_templates_and_options():
+    mapper = app.FieldMapper(SPEC)
+
+    fields = mapper.apply(101, {"title": "Demo", "types": "32, 33", "nested": {"value": 5}},
+                          {"name": "ACME", "partner": {"name": "Partner", "value": 7}})
+
+    assert fields == {
+        "summary": "Demo",
+        "description": "Organizacja: ACME\nDeal ID: 101",
+        "customfield_1": [{"id": "32"}, {"id": "33"}],
+        "customfield_2": "Partner",
+        "customfield_3": 5,
+    }
+
+
+def test_apply_uses_defaults_and_skips_empty_fields():
+    mapper = app.FieldMapper(SPEC)
+
+    fields = mapper.apply(101, {"title": "", "types": None}, None)
+
+    assert fields == {"summary": "Brak tytułu", "description": "Organizacja: brak\nDeal ID: 101"}
+
+
+def test_apply_drops_unmapped_options_and_accepts_lists():
+    mapper = app.FieldMapper(SPEC)
+
+    fields = mapper.apply(1, {"types": [33, 99]}, {"partner": 12})
+
+    assert fields["customfield_1"] == [{"id": "33"}]
+    assert fields["customfield_2"] == "12"
+
+
+def test_repository_mapping_file_compiles():
+    assert app.FIELD_MAPPER.apply(1, {}, {"name": "ACME"})["customfield_10086"] == "ACME"
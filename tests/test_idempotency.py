@@ -0,0 +1,108 @@
+import pytest
+import requests
+
+import app
+
+
+def test_enqueue_webhook_delivery_creates_job(job_db):
+    job_id, delivery = app.enqueue_webhook_delivery({"deal_id": 101, "org_id": 7})
+
+    assert delivery is None
+    assert app.get_job(job_id)["status"] == "queued"
+    assert app.get_job_queue_stats()["depth"] == 1
+
+
+def test_enqueue_webhook_delivery_returns_existing_job_for_repeat(job_db):
+    payload = {"deal_id": 101, "org_id": 7}
+    job_id, _ = app.enqueue_webhook_delivery(payload)
+
+    repeat_job_id, delivery = app.enqueue_webhook_delivery({"org_id": 7, "deal_id": 101})
+
+    assert repeat_job_id == job_id
+    assert delivery["job_status"] == "queued"
+    assert app.get_job_queue_stats()["depth"] == 1
+
+
+def test_enqueue_webhook_delivery_returns_recorded_issue(job_db):
+    payload = {"deal_id": 101, "org_id": 7}
+    job_id, _ = app.enqueue_webhook_delivery(payload)
+    app.record_jira_issue(payload, "PROJ-1", "10001")
+
+    _, delivery = app.enqueue_webhook_delivery(payload)
+
+    assert delivery["jira_issue_key"] == "PROJ-1"
+
+
+def test_enqueue_webhook_delivery_requeues_after_failed_job(job_db):
+    payload = {"deal_id": 101, "org_id": 7}
+    job_id, _ = app.enqueue_webhook_delivery(payload)
+    app.fail_job(job_id, "boom", retry=False)
+
+    new_job_id, delivery = app.enqueue_webhook_delivery(payload)
+
+    assert delivery is None
+    assert new_job_id != job_id
+
+
+def test_deal_link_ignores_deal_id_type_and_payload_shape(job_db):
+    app.record_jira_issue({"deal_id": 101, "org_id": 7, "extra": True}, "PROJ-1", "10001")
+
+    assert app.get_deal_jira_issue("101")["key"] == "PROJ-1"
+    assert app.get_deal_jira_issue(101)["key"] == "PROJ-1"
+    assert app.get_deal_jira_issue(102) is None
+
+
+def test_claim_deal_for_create_blocks_concurrent_create(job_db):
+    assert app.claim_deal_for_create(101) is None
+
+    with pytest.raises(app.DealClaimedError):
+        app.claim_deal_for_create("101")
+    assert app.get_deal_jira_issue(101) is None
+
+
+def test_claim_deal_for_create_returns_issue_recorded_by_claim_holder(job_db):
+    app.claim_deal_for_create(101)
+    app.record_jira_issue({"deal_id": 101, "org_id": 7}, "PROJ-1", "10001")
+
+    assert app.claim_deal_for_create(101)["key"] == "PROJ-1"
+
+
+def test_claim_deal_for_create_after_release_or_expired_lease(job_db, monkeypatch):
+    app.claim_deal_for_create(101)
+    app.release_deal_claim(101)
+    assert app.claim_deal_for_create(101) is None
+
+    monkeypatch.setattr(app, "JOB_LEASE_SECONDS", -1)
+    assert app.claim_deal_for_create(101) is None
+
+
+@pytest.fixture
+def jira_calls(monkeypatch):
+    """Atrapy Pipedrive i Jira dla process_pipedrive_webhook; zwraca listę wywołań Jira."""
+    calls = []
+    monkeypatch.setattr(app, "fetch_pipedrive_records", lambda deal_id, org_id: ({"id": deal_id, "update_time": "2026-01-02 10:00:00"}, {"id": org_id}, []))
+    monkeypatch.setattr(app, "build_jira_fields", lambda deal_id, deal_data, org_data: {"summary": f"Deal {deal_id}"})
+    monkeypatch.setattr(app, "create_jira_issue", lambda fields: calls.append(("create", fields)) or {"key": "PROJ-1", "id": "10001"})
+    monkeypatch.setattr(app, "update_jira_issue", lambda key, fields: calls.append(("update", key, fields)))
+    monkeypatch.setattr(app, "transfer_attachments_to_jira", lambda *args, **kwargs: [])
+    return calls
+
+
+def test_process_webhook_updates_linked_issue_on_changed_data(job_db, jira_calls):
+    app.process_pipedrive_webhook({"deal_id": 101, "org_id": 7})
+    result = app.process_pipedrive_webhook({"deal_id": 101, "org_id": 7, "current": {"title": "changed"}})
+
+    assert jira_calls == [("create", {"summary": "Deal 101"}), ("update", "PROJ-1", {"summary": "Deal 101"})]
+    assert result["key"] == "PROJ-1"
+    assert app.get_deal_jira_issue(101)["deal_update_time"] == "2026-01-02 10:00:00"
+
+
+def test_process_webhook_releases_claim_when_create_fails(job_db, jira_calls, monkeypatch):
+    def fail_create(fields):
+        raise requests.exceptions.ConnectionError("Jira down")
+    monkeypatch.setattr(app, "create_jira_issue", fail_create)
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        app.process_pipedrive_webhook({"deal_id": 101, "org_id": 7})
+
+    assert app.claim_deal_for_create(101) is None
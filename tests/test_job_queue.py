@@ -0,0 +1,51 @@
+import sqlite3
+import time
+
+import app
+
+
+def _set_job_column(job_db, job_id, column, value):
+    conn = sqlite3.connect(job_db)
+    try:
+        with conn:
+            conn.execute(f"UPDATE jobs SET {column} = ? WHERE id = ?", (value, job_id))
+    finally:
+        conn.close()
+
+
+def test_claim_next_job_claims_oldest_once(job_db):
+    first = app.enqueue_job({"deal_id": 1})
+    second = app.enqueue_job({"deal_id": 2})
+
+    claimed = app.claim_next_job()
+
+    assert claimed == {"id": first, "payload": {"deal_id": 1}, "attempts": 1}
+    assert app.get_job(first)["status"] == "running"
+    assert app.claim_next_job()["id"] == second
+    assert app.claim_next_job() is None
+
+
+def test_claim_next_job_skips_jobs_waiting_for_retry(job_db, monkeypatch):
+    job_id = app.enqueue_job({"deal_id": 1})
+    app.claim_next_job()
+
+    monkeypatch.setattr(app, "JOB_RETRY_DELAY_SECONDS", 60)
+    app.fail_job(job_id, "temporary", retry=True)
+    assert app.claim_next_job() is None
+
+    _set_job_column(job_db, job_id, "available_at", time.time() - 1)
+    claimed = app.claim_next_job()
+    assert claimed["id"] == job_id
+    assert claimed["attempts"] == 2
+
+
+def test_claim_next_job_reclaims_expired_lease(job_db):
+    job_id = app.enqueue_job({"deal_id": 1})
+    app.claim_next_job()
+    assert app.claim_next_job() is None
+
+    _set_job_column(job_db, job_id, "claimed_at", time.time() - app.JOB_LEASE_SECONDS - 1)
+
+    claimed = app.claim_next_job()
+    assert claimed["id"] == job_id
+    assert claimed["attempts"] == 2
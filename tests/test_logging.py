@@ -0,0 +1,55 @@
+import json
+import logging
+import sys
+
+import app
+
+
+def record(msg, *args, exc_info=None):
+    return logging.LogRecord("test", logging.ERROR, __file__, 1, msg, args, exc_info)
+
+
+def test_arguments_are_truncated_but_template_is_kept(monkeypatch):
+    monkeypatch.setattr(app, "LOG_MAX_FIELD_LENGTH", 10)
+
+    message = app.SafeLogFormatter().format(record("Odpowiedź Jira dla zadania %s: %s", 12345, "x" * 25))
+
+    assert message.endswith("Odpowiedź Jira dla zadania 12345: xxxxxxxxxx...[+15 znaków]")
+
+
+def test_dict_argument_is_truncated_as_one_value(monkeypatch):
+    monkeypatch.setattr(app, "LOG_MAX_FIELD_LENGTH", 12)
+
+    message = app.SafeLogFormatter().format(record("Payload: %s", {"fields": {"summary": "long value"}}))
+
+    assert message.endswith("Payload: {'fields': {...[+25 znaków]")
+
+
+def test_tokens_are_redacted_in_message_and_traceback():
+    try:
+        raise RuntimeError(f"GET https://api.pipedrive.invalid/v1/deals/1?api_token={app.PIPEDRIVE_API_TOKEN}")
+    except RuntimeError:
+        exc_info = sys.exc_info()
+
+    message = app.SafeLogFormatter().format(record("Błąd: %s password=hunter2 %s", "api_key=abc123", app.JIRA_API_TOKEN,
+                                                   exc_info=exc_info))
+
+    assert "api_key=*** password=*** ***" in message
+    assert "api_token=***" in message
+    assert app.PIPEDRIVE_API_TOKEN not in message
+    assert app.JIRA_API_TOKEN not in message
+
+
+def test_json_output_is_one_redacted_object():
+    line = app.SafeLogFormatter(json_output=True).format(record("token=%s", "secret-value"))
+
+    entry = json.loads(line)
+    assert entry["level"] == "ERROR"
+    assert entry["message"] == "token=***"
+
+
+def test_sampled_out_count_is_appended():
+    log_record = record("Powtarzający się komunikat")
+    log_record.sampled_out = 3
+
+    assert app.SafeLogFormatter().format(log_record).endswith("[pominięto 3 powtórzeń tego komunikatu]")
@@ -0,0 +1,43 @@
+import json
+import os
+import subprocess
+import sys
+
+import app
+
+
+def snapshot(pid, counters=(), gauges=()):
+    return {"pid": pid, "counters": [list(c) for c in counters], "histograms": [], "gauges": [list(g) for g in gauges]}
+
+
+def test_render_sums_counters_and_labels_process_gauges_with_pid():
+    body = app.render_prometheus_metrics([
+        snapshot(11, counters=[("jobs_total", {"result": "done"}, 2)], gauges=[("ready", {}, 1)]),
+        snapshot(12, counters=[("jobs_total", {"result": "done"}, 3)], gauges=[("ready", {}, 0)]),
+    ], gauges=[("queue_jobs", {"status": "queued"}, 4)])
+
+    assert 'pipedrive_jira_jobs_total{result="done"} 5' in body
+    assert 'pipedrive_jira_ready{pid="11"} 1' in body
+    assert 'pipedrive_jira_ready{pid="12"} 0' in body
+    assert 'pipedrive_jira_queue_jobs{status="queued"} 4' in body
+
+
+def test_snapshot_includes_process_gauges():
+    registry = app.MetricsRegistry(app.METRICS_DURATION_BUCKETS)
+    registry.add_gauge_collector(lambda: registry.set_gauge("ready", 1))
+
+    assert registry.snapshot()["gauges"] == [["ready", {}, 1]]
+
+
+def test_collect_snapshots_removes_files_of_dead_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "METRICS_DIR", str(tmp_path))
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    alive_pid = os.getppid()
+    for pid in (dead.pid, alive_pid):
+        (tmp_path / f"metrics-{pid}.json").write_text(json.dumps(snapshot(pid)), encoding="utf-8")
+
+    snapshots = app.collect_metric_snapshots()
+
+    assert [s["pid"] for s in snapshots[1:]] == [alive_pid]
+    assert not (tmp_path / f"metrics-{dead.pid}.json").exists()
@@ -0,0 +1,43 @@
+import app
+
+CREATEMETA = {
+    "project": {"name": "Project", "required": True, "allowedValues": [{"id": "43"}]},
+    "issuetype": {"name": "Issue Type", "required": True, "allowedValues": [{"id": "10001"}]},
+    "summary": {"name": "Summary", "required": True},
+    "priority": {"name": "Priority", "required": True, "hasDefaultValue": True},
+    "customfield_100": {"name": "Region", "required": False,
+                        "allowedValues": [{"id": "1", "value": "EMEA"}, {"id": "2", "value": "APAC"}]},
+}
+
+
+def payload(**fields):
+    return {"fields": {"project": {"id": "43"}, "issuetype": {"id": "10001"}, "summary": "Deal 101", **fields}}
+
+
+def test_valid_payload_has_no_errors():
+    assert app.validate_jira_issue_payload(payload(customfield_100={"value": "EMEA"}), CREATEMETA) == []
+
+
+def test_missing_required_field_without_default_is_reported():
+    jira_issue_payload = payload()
+    jira_issue_payload["fields"]["summary"] = ""
+
+    assert app.validate_jira_issue_payload(jira_issue_payload, CREATEMETA) == ["Missing required field 'summary' (Summary)."]
+
+
+def test_option_outside_allowed_values_is_reported():
+    errors = app.validate_jira_issue_payload(payload(customfield_100=[{"id": "2"}, {"value": "LATAM"}]), CREATEMETA)
+
+    assert errors == ["Value {'value': 'LATAM'} is not allowed for field 'customfield_100' (Region)."]
+
+
+def test_field_missing_from_create_screen_is_reported():
+    errors = app.validate_jira_issue_payload(payload(customfield_999="x"), CREATEMETA)
+
+    assert len(errors) == 1 and "customfield_999" in errors[0]
+
+
+def test_validation_is_skipped_without_createmeta(monkeypatch):
+    monkeypatch.setattr(app, "load_jira_createmeta_fields", lambda force_refresh=False: None)
+
+    assert app.validate_jira_issue_payload({"fields": {}}) == []
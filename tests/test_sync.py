@@ -0,0 +1,67 @@
+import pytest
+import requests
+
+import app
+import sync
+
+CURSOR = "2026-01-01 00:00:00"
+
+
+@pytest.fixture
+def pipedrive(job_db, monkeypatch):
+    """Atrapy /recents i organizacji Pipedrive oraz Jira; zwraca słownik stanu do ustawienia w teście."""
+    state = {"pages": [], "organizations": {"7": {"id": 7, "name": "Acme"}}, "created": [], "failing": set()}
+    monkeypatch.setattr(sync, "iter_changed_deal_pages", lambda since: iter(state["pages"]))
+    monkeypatch.setattr(sync, "fetch_organizations", lambda org_ids: state["organizations"])
+    monkeypatch.setattr(app, "build_jira_fields", lambda deal_id, deal_data, org_data: {"summary": f"Deal {deal_id}"})
+
+    def create(fields):
+        if fields["summary"] in state["failing"]:
+            raise requests.exceptions.ConnectionError("Jira unavailable")
+        state["created"].append(fields["summary"])
+        return {"key": f"PROJ-{len(state['created'])}", "id": str(len(state["created"]))}
+
+    monkeypatch.setattr(app, "create_jira_issue", create)
+    return state
+
+
+def deal(deal_id, update_time, org_id=7):
+    return {"id": deal_id, "update_time": update_time, "org_id": {"value": org_id, "name": "Acme"}}
+
+
+def test_run_sync_skips_deal_with_missing_organization_permanently(pipedrive):
+    pipedrive["pages"] = [[deal(1, "2026-01-01 10:00:00", org_id=404)]]
+
+    summary = sync.run_sync(CURSOR, skip_attachments=True)
+
+    assert summary["cursor"] == "2026-01-01 10:00:00"
+    assert summary["counts"] == {"skipped": 1}
+    assert app.get_sync_failure(1)["permanent"]
+    assert pipedrive["created"] == []
+
+
+def test_run_sync_advances_cursor_to_newest_synced_deal(pipedrive):
+    pipedrive["pages"] = [[deal(1, "2026-01-01 10:00:00")], [deal(2, "2026-01-01 12:00:00")]]
+
+    summary = sync.run_sync(CURSOR, skip_attachments=True)
+
+    assert summary["cursor"] == "2026-01-01 12:00:00"
+    assert summary["counts"] == {"created": 2}
+    assert app.get_sync_cursor(sync.SYNC_CURSOR_NAME) == "2026-01-01 12:00:00"
+    assert app.get_deal_jira_issue(2)["deal_update_time"] == "2026-01-01 12:00:00"
+
+
+def test_run_sync_holds_cursor_at_transient_failure_until_max_attempts(pipedrive, monkeypatch):
+    monkeypatch.setattr(sync, "SYNC_MAX_ATTEMPTS", 2)
+    pipedrive["pages"] = [[deal(1, "2026-01-01 10:00:00"), deal(2, "2026-01-01 11:00:00"), deal(3, "2026-01-01 12:00:00")]]
+    pipedrive["failing"] = {"Deal 2"}
+
+    first = sync.run_sync(CURSOR, skip_attachments=True)
+    assert first["cursor"] == "2026-01-01 11:00:00"
+    assert first["counts"] == {"created": 2}
+
+    second = sync.run_sync(skip_attachments=True)
+    assert second["counts"] == {"unchanged": 2, "skipped": 1}
+    assert second["cursor"] == "2026-01-01 12:00:00"
+    assert app.get_sync_failure(2)["attempts"] == 2
+    assert pipedrive["created"] == ["Deal 1", "Deal 3"]
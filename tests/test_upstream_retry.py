@@ -0,0 +1,144 @@
+import io
+
+import pytest
+import requests
+
+import app
+
+
+class FakeSession:
+    """Sesja zwracająca kolejno zaplanowane odpowiedzi (lub zgłaszająca wyjątki)."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url))
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        response = requests.Response()
+        response.status_code = outcome if isinstance(outcome, int) else outcome[0]
+        response.headers.update({} if isinstance(outcome, int) else outcome[1])
+        response.raw = io.BytesIO(b"")
+        response._content = b""
+        return response
+
+
+class RecordingBucket:
+    """Limiter bez limitu, zapamiętujący wstrzymania (pause) zgłoszone przez 429."""
+
+    def __init__(self):
+        self.pauses = []
+
+    def acquire(self):
+        pass
+
+    def pause(self, seconds):
+        self.pauses.append(seconds)
+
+
+class NonRewindableBody:
+    def rewind(self):
+        return False
+
+
+@pytest.fixture(autouse=True)
+def upstream(monkeypatch):
+    """Świeży limiter i circuit breaker dla usługi 'test', bez faktycznego czekania między próbami."""
+    sleeps = []
+    monkeypatch.setattr(app.time, "sleep", sleeps.append)
+    monkeypatch.setattr(app, "UPSTREAM_MAX_RETRIES", 3)
+    limiter = {"bucket": RecordingBucket(), "breaker": app.CircuitBreaker(threshold=100, cooldown=30), "sleeps": sleeps}
+    monkeypatch.setitem(app._upstream_limiters, "test", limiter)
+    return limiter
+
+
+def send(session, method="GET", **kwargs):
+    return app._send_upstream_request("test", session, method, "http://upstream.invalid/resource", **kwargs)
+
+
+def test_idempotent_request_is_retried_on_5xx():
+    session = FakeSession(503, 502, 200)
+
+    assert send(session).status_code == 200
+    assert len(session.calls) == 3
+
+
+def test_retries_stop_after_max_retries():
+    session = FakeSession(*[503] * 10)
+
+    assert send(session).status_code == 503
+    assert len(session.calls) == app.UPSTREAM_MAX_RETRIES + 1
+
+
+def test_post_is_not_retried_on_5xx():
+    session = FakeSession(503, 200)
+
+    assert send(session, "POST").status_code == 503
+    assert len(session.calls) == 1
+
+
+def test_post_is_retried_on_429_after_retry_after(upstream):
+    session = FakeSession((429, {"Retry-After": "2"}), 201)
+
+    assert send(session, "POST").status_code == 201
+    assert len(session.calls) == 2
+    assert upstream["sleeps"] == [2.0]
+    assert upstream["bucket"].pauses == [2.0]
+
+
+def test_retry_after_longer_than_backoff_cap_is_returned_not_retried(upstream, monkeypatch):
+    monkeypatch.setattr(app, "UPSTREAM_BACKOFF_MAX", 30)
+    session = FakeSession((429, {"Retry-After": "120"}), 201)
+
+    assert send(session, "POST").status_code == 429
+    assert len(session.calls) == 1
+    assert upstream["sleeps"] == []
+    assert upstream["bucket"].pauses == [120.0]
+
+
+def test_client_errors_are_not_retried():
+    session = FakeSession(404, 200)
+
+    assert send(session).status_code == 404
+    assert len(session.calls) == 1
+
+
+def test_idempotent_request_is_retried_on_connection_error():
+    session = FakeSession(requests.exceptions.ConnectionError("reset"), 200)
+
+    assert send(session).status_code == 200
+    assert len(session.calls) == 2
+
+
+def test_post_is_retried_only_when_connection_was_not_established():
+    session = FakeSession(requests.exceptions.ConnectTimeout("connect"), 201)
+    assert send(session, "POST").status_code == 201
+
+    session = FakeSession(requests.exceptions.ReadTimeout("read"), 201)
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        send(session, "POST")
+    assert len(session.calls) == 1
+
+
+def test_consumed_streaming_body_is_not_resent():
+    session = FakeSession((429, {"Retry-After": "1"}), 201)
+
+    assert send(session, "POST", data=NonRewindableBody()).status_code == 429
+    assert len(session.calls) == 1
+
+
+def test_open_circuit_rejects_without_sending(monkeypatch):
+    monkeypatch.setitem(app._upstream_limiters["test"], "breaker", app.CircuitBreaker(threshold=2, cooldown=30))
+    session = FakeSession(500, 500, 200)
+
+    with pytest.raises(app.UpstreamUnavailableError):
+        send(session)
+    assert len(session.calls) == 2
+
+    session = FakeSession(200)
+    with pytest.raises(app.UpstreamUnavailableError):
+        send(session)
+    assert session.calls == []